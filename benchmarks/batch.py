@@ -0,0 +1,52 @@
+"""
+Throughput of batch conversion of Personio exports against the size of the conversion process pool.
+
+Usage: python -m benchmarks.batch [files] [rows]
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+from .generators import write_personio_workbook
+
+DEFAULT_FILES = 16
+DEFAULT_ROWS = 2_000
+
+
+def measure(archive: Path, output: Path, processes: int) -> float:
+    started = time.monotonic()
+    subprocess.run(
+        (
+            *(sys.executable, "manage.py", "convert_batch", "datev", str(archive), str(output)),
+            *("--consultant-number", "1234", "--client-number", "5678"),
+        ),
+        env={**os.environ, "CONVERSION_PROCESSES": str(processes), "INTERNAL_IPS": "127.0.0.1"},
+        check=True,
+        capture_output=True,
+    )
+    return time.monotonic() - started
+
+
+def main(files: int, rows: int):
+    print(f"{'processes':>10} {'seconds':>8} {'files/min':>10}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        workbook = write_personio_workbook(Path(directory) / "personio.xlsx", rows)
+
+        archive = Path(directory) / "batch.zip"
+        with zipfile.ZipFile(archive, "w") as archive_zip:
+            for i in range(files):
+                archive_zip.write(workbook, f"entity-{i}.xlsx")
+
+        for processes in sorted({1, 2, 4, os.cpu_count() or 1}):
+            seconds = measure(archive, Path(directory) / "output.zip", processes)
+            print(f"{processes:>10} {seconds:>8.1f} {60 * files / seconds:>10.0f}")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]), *(DEFAULT_FILES, DEFAULT_ROWS)[len(sys.argv[1:3]) :])
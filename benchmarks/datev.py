@@ -0,0 +1,88 @@
+"""
+DATEV CSV serialization throughput in rows per second, per-booking csv.writer vs. single-pass serializer.
+
+Usage: python -m benchmarks.datev [rows ...]
+"""
+
+import csv
+import sys
+import time
+from io import StringIO
+
+from sepacetamol.views.datev import DatevBooking, DatevHeader, iter_datev_csv
+
+DEFAULT_ROW_COUNTS = (1_000, 10_000, 100_000)
+
+
+def legacy_unquote_empty_csv_strings(value: str) -> str:
+    while ';"";' in value:
+        value = value.replace(';"";', ";;")
+    result = value.removesuffix(';""')
+    return result if result == value else result + ";"
+
+
+def legacy_model_dump_csv(model) -> str:
+    output = StringIO()
+    datev_writer = csv.writer(output, quoting=csv.QUOTE_NONNUMERIC, delimiter=";")
+    datev_writer.writerow(model.model_dump().values())
+    return "\n".join(legacy_unquote_empty_csv_strings(line) for line in output.getvalue().splitlines())
+
+
+def legacy(header: DatevHeader, bookings: list[DatevBooking]) -> bytes:
+    return "\r\n".join(
+        (
+            legacy_model_dump_csv(header),
+            DatevBooking.model_dump_csv_header(),
+            *(legacy_model_dump_csv(booking) for booking in bookings),
+        ),
+    ).encode("cp1252")
+
+
+def single_pass(header: DatevHeader, bookings: list[DatevBooking]) -> bytes:
+    return b"".join(iter_datev_csv(header, bookings))
+
+
+def main(row_counts: tuple[int, ...]):
+    header = DatevHeader(
+        flag="EXTF",
+        format_category=21,
+        format_name="Buchungsstapel",
+        format_version=9,
+        consultant_number=1001,
+        client_numer=99999,
+        business_year_start=20230101,
+        gl_account_length=4,
+        date_from=20230601,
+        date_till=20230630,
+        designation="Lohnbuchungen 2023-06",
+        locking=0,
+        gl_chart_of_accounts="03",
+    )
+
+    print(f"{'rows':>10} {'legacy (rows/s)':>16} {'single pass (rows/s)':>21}")
+
+    for rows in row_counts:
+        bookings = [
+            DatevBooking(
+                umsatz=f"{100 + i % 5_000},{i % 100:02d}",
+                soll_haben_kz="H" if i % 2 else "S",
+                konto=1755,
+                gegenkonto=4120,
+                belegdatum="0106",
+                belegfeld_1="202306",
+                buchungstext=f"Festbezug Gehaelter Mitarbeiter {i}",
+            )
+            for i in range(rows)
+        ]
+
+        throughput = []
+        for serialize in (legacy, single_pass):
+            start = time.perf_counter()
+            serialize(header, bookings)
+            throughput.append(rows / (time.perf_counter() - start))
+
+        print(f"{rows:>10} {throughput[0]:>16,.0f} {throughput[1]:>21,.0f}")
+
+
+if __name__ == "__main__":
+    main(tuple(int(arg) for arg in sys.argv[1:]) or DEFAULT_ROW_COUNTS)
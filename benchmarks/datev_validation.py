@@ -0,0 +1,44 @@
+"""
+DatevBooking validation throughput in rows per second, one model at a time vs. bulk validation of the whole list.
+
+Usage: python -m benchmarks.datev_validation [rows ...]
+"""
+
+import sys
+import time
+
+from sepacetamol.views.datev import DatevBooking
+
+DEFAULT_ROW_COUNTS = (1_000, 10_000, 100_000)
+
+
+def main(row_counts: tuple[int, ...]):
+    print(f"{'rows':>10} {'per model (rows/s)':>19} {'bulk (rows/s)':>14}")
+
+    for rows in row_counts:
+        bookings = [
+            {
+                "umsatz": f"{100 + i % 5_000},{i % 100:02d}",
+                "soll_haben_kz": "H" if i % 2 else "S",
+                "konto": "1755",
+                "gegenkonto": "4120",
+                "belegdatum": "0106",
+                "belegfeld_1": "202306",
+                "buchungstext": f"Festbezug Gehaelter Mitarbeiter {i}",
+            }
+            for i in range(rows)
+        ]
+
+        start = time.perf_counter()
+        [DatevBooking(**booking) for booking in bookings]
+        per_model = rows / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        DatevBooking.model_validate_many(bookings)
+        bulk = rows / (time.perf_counter() - start)
+
+        print(f"{rows:>10} {per_model:>19,.0f} {bulk:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main(tuple(int(arg) for arg in sys.argv[1:]) or DEFAULT_ROW_COUNTS)
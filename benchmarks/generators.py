@@ -0,0 +1,93 @@
+import csv
+from collections.abc import Iterable, Iterator
+from datetime import date, timedelta
+from pathlib import Path
+
+from openpyxl import Workbook
+
+SEPA_ORIGINATOR_HEADER = ("Sender name", "Sender IBAN")
+SEPA_TRANSACTION_HEADER = ("Recipient name", "Recipient IBAN", "Amount", "Purpose", "Reference (optional)")
+
+PERSONIO_HEADER = ("Datum", "Umsatz", "S/H", "Gegenkonto", "Konto", "Belegfeld 1", "Buchungstext")
+
+# Bank codes of well-known German banks, so that every generated IBAN resolves to a BIC
+BANK_CODES = ("72040046", "37040044", "12030000", "50010517")
+
+
+def make_iban(i: int) -> str:
+    """
+    Distinct valid German IBAN per recipient, formatted in groups of four like in the template. The check digits are
+    computed directly, which is a lot faster than going through schwifty for a million rows.
+    """
+    bban = f"{BANK_CODES[i % len(BANK_CODES)]}{i:010d}"
+    iban = f"DE{98 - int(bban + '131400') % 97:02d}{bban}"
+    return " ".join(iban[j : j + 4] for j in range(0, len(iban), 4))
+
+
+def iter_sepa_rows(rows: int) -> Iterator[tuple]:
+    yield SEPA_ORIGINATOR_HEADER
+    yield "honeymeets continuity GmbH", "DE02120300000000202051"
+    yield SEPA_TRANSACTION_HEADER
+
+    for i in range(rows):
+        yield (
+            f"Supplier {i} GmbH",
+            make_iban(i),
+            round(10 + (i % 10_000) * 1.37, 2),
+            f"Auftrag {i:08d}, 12.03.2020, v1/2345",
+            f"Kdn. {i}" if i % 3 else None,
+        )
+
+
+def iter_personio_rows(rows: int, start: date = date(2023, 6, 1)) -> Iterator[tuple]:
+    yield PERSONIO_HEADER
+
+    for i in range(rows):
+        yield (
+            (start + timedelta(days=i % 28)).strftime("%d.%m.%Y"),
+            round((-1 if i % 7 == 0 else 1) * (100 + (i % 5_000) * 3.21), 2),
+            "H" if i % 2 else "S",
+            "4120",
+            "1755",
+            f"{start:%Y%m}",
+            f"Festbezug Gehaelter Mitarbeiter {i}",
+        )
+
+
+def write_workbook(path: Path, title: str, rows: Iterable[tuple]) -> Path:
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(title)
+
+    for row in rows:
+        worksheet.append(row)
+
+    workbook.save(path)
+    return path
+
+
+def write_csv(path: Path, rows: Iterable[tuple]) -> Path:
+    """
+    Write rows the way a German Excel exports them: semicolons, decimal commas and Windows code page 1252.
+    """
+    with path.open("w", encoding="cp1252", newline="") as file:
+        writer = csv.writer(file, delimiter=";")
+        for row in rows:
+            writer.writerow(f"{value:.2f}".replace(".", ",") if isinstance(value, float) else value for value in row)
+
+    return path
+
+
+def write_sepa_workbook(path: Path, rows: int) -> Path:
+    return write_workbook(path, "Transactions", iter_sepa_rows(rows))
+
+
+def write_sepa_csv(path: Path, rows: int) -> Path:
+    return write_csv(path, iter_sepa_rows(rows))
+
+
+def write_personio_workbook(path: Path, rows: int, start: date = date(2023, 6, 1)) -> Path:
+    return write_workbook(path, "Buchungen", iter_personio_rows(rows, start))
+
+
+def write_personio_csv(path: Path, rows: int, start: date = date(2023, 6, 1)) -> Path:
+    return write_csv(path, iter_personio_rows(rows, start))
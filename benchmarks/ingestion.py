@@ -0,0 +1,58 @@
+"""
+Peak RSS of SEPA workbook ingestion against row count, full-mode openpyxl vs. streaming reader.
+
+Usage: python -m benchmarks.ingestion [rows ...]
+"""
+
+import resource
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from .generators import write_sepa_workbook
+
+DEFAULT_ROW_COUNTS = (1_000, 10_000, 50_000, 100_000)
+
+
+def ingest(mode: str, path: Path) -> int:
+    from openpyxl import load_workbook
+
+    from sepacetamol.readers import iter_rows
+    from sepacetamol.views.sepa import parse_source_rows
+
+    if mode == "full":
+        rows = load_workbook(path).active.iter_rows(values_only=True)
+    else:
+        rows = iter_rows(path.open("rb"))
+
+    _, transactions = parse_source_rows(rows)
+    return len(transactions)
+
+
+def measure(mode: str, path: Path) -> int:
+    result = subprocess.run(
+        (sys.executable, "-m", "benchmarks.ingestion", "--child", mode, str(path)),
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return int(result.stdout)
+
+
+def main(row_counts: tuple[int, ...]):
+    print(f"{'rows':>10} {'full (MiB)':>12} {'streaming (MiB)':>16}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in row_counts:
+            path = write_sepa_workbook(Path(directory) / f"sepa-{rows}.xlsx", rows)
+            full, streaming = (measure(mode, path) / 1024 for mode in ("full", "streaming"))
+            print(f"{rows:>10} {full:>12.1f} {streaming:>16.1f}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        ingest(sys.argv[2], Path(sys.argv[3]))
+        print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    else:
+        main(tuple(int(arg) for arg in sys.argv[1:]) or DEFAULT_ROW_COUNTS)
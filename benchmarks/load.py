@@ -0,0 +1,154 @@
+"""
+Tail latency of light requests under mixed traffic, WSGI with threads as in the Procfile vs. ASGI with async views.
+
+Heavy clients keep posting a Personio workbook to the DATEV converter while light clients poll /health/, both
+against gunicorn with 2 workers, once with 4 threads each and once with uvicorn workers.
+
+Usage: python -m benchmarks.load [rows] [seconds]
+"""
+
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from http.cookiejar import CookieJar
+from pathlib import Path
+
+from .generators import write_personio_workbook
+
+DEFAULT_ROWS = 5_000
+DEFAULT_SECONDS = 20
+
+HEAVY_CLIENTS = 8
+LIGHT_CLIENTS = 4
+
+SERVERS = {
+    "wsgi": ("--workers", "2", "--threads", "4", "config.wsgi"),
+    "asgi": ("--workers", "2", "--worker-class", "uvicorn.workers.UvicornWorker", "config.asgi"),
+}
+
+
+def get_free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(kind: str, port: int) -> subprocess.Popen:
+    server = subprocess.Popen(
+        (sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}", "--timeout", "300", *SERVERS[kind]),
+        env={**os.environ, "DJANGO_DEBUG": "1", "INTERNAL_IPS": "127.0.0.1"},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    for _ in range(300):
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/health/", timeout=1)
+            return server
+        except OSError:
+            time.sleep(0.1)
+
+    server.terminate()
+    raise RuntimeError(f"{kind} server did not start")
+
+
+def encode_multipart(fields: dict[str, str], files: dict[str, Path]) -> tuple[str, bytes]:
+    boundary = uuid.uuid4().hex
+    parts = [
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        for name, value in fields.items()
+    ]
+    parts += [
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{path.name}"\r\n'
+        f"Content-Type: application/octet-stream\r\n\r\n".encode()
+        + path.read_bytes()
+        + b"\r\n"
+        for name, path in files.items()
+    ]
+    return f"multipart/form-data; boundary={boundary}", b"".join(parts) + f"--{boundary}--\r\n".encode()
+
+
+def heavy_client(base_url: str, workbook: Path, deadline: float, durations: list[float]):
+    cookies = CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(cookies))
+    opener.open(f"{base_url}/personio-datev/").read()
+    csrf_token = next(cookie.value for cookie in cookies if cookie.name == "csrftoken")
+
+    content_type, body = encode_multipart(
+        {"csrfmiddlewaretoken": csrf_token, "consultant-number": "1234", "client-number": "5678"},
+        {"personio-file": workbook},
+    )
+
+    while time.monotonic() < deadline:
+        request = urllib.request.Request(
+            f"{base_url}/personio-datev/",
+            data=body,
+            headers={"Content-Type": content_type},
+        )
+        started = time.monotonic()
+        with opener.open(request, timeout=300) as response:
+            assert response.headers["Content-Disposition"].startswith("attachment"), "conversion failed"
+            response.read()
+        durations.append(time.monotonic() - started)
+
+
+def light_client(base_url: str, deadline: float, durations: list[float]):
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        with urllib.request.urlopen(f"{base_url}/health/", timeout=300) as response:
+            response.read()
+        durations.append(time.monotonic() - started)
+
+
+def run(kind: str, workbook: Path, seconds: int) -> tuple[list[float], list[float]]:
+    port = get_free_port()
+    server = start_server(kind, port)
+    base_url = f"http://127.0.0.1:{port}"
+
+    heavy, light = [], []
+    deadline = time.monotonic() + seconds
+
+    try:
+        clients = [
+            threading.Thread(target=heavy_client, args=(base_url, workbook, deadline, heavy))
+            for _ in range(HEAVY_CLIENTS)
+        ] + [threading.Thread(target=light_client, args=(base_url, deadline, light)) for _ in range(LIGHT_CLIENTS)]
+
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+    return heavy, light
+
+
+def percentile(values: list[float], p: int) -> float:
+    return statistics.quantiles(values, n=100, method="inclusive")[p - 1] * 1000 if len(values) > 1 else float("nan")
+
+
+def main(rows: int, seconds: int):
+    print(f"{'server':>8} {'conversions':>12} {'health':>8} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        workbook = write_personio_workbook(Path(directory) / f"personio-{rows}.xlsx", rows)
+
+        for kind in SERVERS:
+            heavy, light = run(kind, workbook, seconds)
+            print(
+                f"{kind:>8} {len(heavy):>12} {len(light):>8} "
+                f"{percentile(light, 50):>10.1f} {percentile(light, 95):>10.1f} {percentile(light, 99):>10.1f}",
+            )
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]), *(DEFAULT_ROWS, DEFAULT_SECONDS)[len(sys.argv[1:3]) :])
@@ -0,0 +1,288 @@
+"""
+Per-stage timings of the SEPA and DATEV conversion paths on synthetic workbooks, saved as JSON for comparison
+between commits.
+
+SEPA: workbook load, IBAN resolution (cold cache), row parsing (warm cache), preview render, XML export, schema
+validation. DATEV: workbook load, row parsing, booking validation, CSV export. Startup, once in a fresh interpreter:
+Django setup, first health check, import of the views, warm-up of the rest, and cumulative import time per module.
+
+Input files are XLSX unless other formats are given, the same data saved as CSV is reported as flow `sepa-csv` and
+`datev-csv`.
+
+Usage: python -m benchmarks.suite [--rows N ...] [--flows sepa datev] [--formats xlsx csv] [--output results.json]
+       [--compare base.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+import django
+
+from .generators import write_personio_csv, write_personio_workbook, write_sepa_csv, write_sepa_workbook
+
+DEFAULT_ROW_COUNTS = (100, 1_000, 10_000, 100_000)
+FLOWS = ("sepa", "datev", "startup")
+FORMATS = ("xlsx", "csv")
+
+STARTUP_MODULES = (
+    "django.urls",
+    "openpyxl",
+    "schwifty",
+    "sepaxml",
+    "pydantic",
+    "xmlschema",
+    "sepacetamol.readers",
+    "sepacetamol.iban",
+    "sepacetamol.validation",
+    "sepacetamol.views.sepa",
+    "sepacetamol.views.datev",
+)
+
+STARTUP_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import django
+django.setup()
+setup = time.perf_counter()
+from django.test import Client
+Client().get("/health/", secure=True)
+health = time.perf_counter()
+# Imported by statement rather than through the lazy views, importlib.import_module is not covered by -X importtime
+import sepacetamol.views.api, sepacetamol.views.batch, sepacetamol.views.jobs
+views = time.perf_counter()
+from sepacetamol.startup import warm_up
+warm_up()
+warm = time.perf_counter()
+timings = {"setup": setup - started, "health": health - setup, "views": views - health, "warm_up": warm - views}
+print(json.dumps(timings))
+"""
+
+
+class Timings:
+    def __init__(self, flow: str, rows: int):
+        self.flow = flow
+        self.rows = rows
+        self.results: list[dict] = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        yield
+        seconds = time.perf_counter() - started
+
+        self.results.append(
+            {
+                "flow": self.flow,
+                "rows": self.rows,
+                "stage": name,
+                "seconds": seconds,
+                "rows_per_second": self.rows / seconds if seconds else None,
+            },
+        )
+        print(f"{self.flow:>6} {self.rows:>9} {name:>12} {seconds:>10.3f}s {self.rows / seconds:>12.0f} rows/s")
+
+
+def run_sepa(path: Path, timings: Timings):
+    from django.test import RequestFactory
+
+    from sepacetamol import iban
+    from sepacetamol.readers import iter_rows
+    from sepacetamol.validation import get_schema, validate
+    from sepacetamol.views.sepa import (
+        PREVIEW_PAGE_SIZE,
+        BatchBooking,
+        Draft,
+        get_credit_transfer_writer,
+        parse_source_rows,
+        render_index,
+    )
+
+    # Compiled once per process in production as well
+    get_schema()
+
+    with timings.stage("load"), path.open("rb") as file:
+        rows = list(iter_rows(file))
+
+    iban._resolve_iban.cache_clear()
+    with timings.stage("iban"):
+        for row in rows[3:]:
+            if row[1] is not None:
+                iban.resolve_iban(row[1])
+
+    with timings.stage("parse"):
+        originator, payments = parse_source_rows(rows)
+
+    # Summary and first page, as rendered after an upload
+    with timings.stage("render"):
+        render_index(
+            RequestFactory().post("/"),
+            Draft(
+                source_filename=path.name,
+                target_filename=path.with_suffix(".xml").name,
+                digest="",
+                originator=originator,
+                count=len(payments),
+                total=payments.total,
+                payments=payments[:PREVIEW_PAGE_SIZE],
+            ),
+            token="benchmark",
+        )
+
+    with timings.stage("export"):
+        writer = get_credit_transfer_writer(originator, BatchBooking.TRUE)
+        chunks = list(writer.iter_chunks(payments))
+
+    with timings.stage("validation"):
+        validate(chunks)
+
+
+def run_datev(path: Path, timings: Timings):
+    from sepacetamol.views.datev import (
+        DatevBooking,
+        DatevSettings,
+        get_datev_header,
+        iter_datev_csv,
+        parse_personio_rows,
+        read_personio_rows,
+    )
+
+    datev_settings = DatevSettings(consultant_number=1234, client_numer=5678)
+
+    with timings.stage("load"), path.open("rb") as file:
+        rows = read_personio_rows(file)
+
+    with timings.stage("parse"):
+        bookings_data = parse_personio_rows(rows)
+
+    with timings.stage("validation"):
+        bookings = DatevBooking.model_validate_many(booking for _, booking in bookings_data)
+
+    with timings.stage("export"):
+        (datum, _), *_ = bookings_data
+        for _ in iter_datev_csv(get_datev_header(datev_settings, datum), bookings):
+            pass
+
+
+def parse_import_times(output: str) -> dict[str, float]:
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        if cumulative.strip().isdigit():
+            times.setdefault(name.strip(), int(cumulative) / 1_000_000)
+    return times
+
+
+def run_startup() -> list[dict]:
+    result = subprocess.run(
+        (sys.executable, "-X", "importtime", "-c", STARTUP_SCRIPT),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    import_times = parse_import_times(result.stderr)
+    stages = {
+        **json.loads(result.stdout),
+        **{f"import {module}": import_times[module] for module in STARTUP_MODULES if module in import_times},
+    }
+
+    for name, seconds in stages.items():
+        print(f"{'startup':>6} {'':>9} {name:>12} {seconds:>10.3f}s")
+
+    return [
+        {"flow": "startup", "rows": 0, "stage": name, "seconds": seconds, "rows_per_second": None}
+        for name, seconds in stages.items()
+    ]
+
+
+RUNNERS: dict[str, tuple[dict[str, Callable[[Path, int], Path]], Callable[[Path, Timings], None]]] = {
+    "sepa": ({"xlsx": write_sepa_workbook, "csv": write_sepa_csv}, run_sepa),
+    "datev": ({"xlsx": write_personio_workbook, "csv": write_personio_csv}, run_datev),
+}
+
+
+def get_commit() -> str | None:
+    result = subprocess.run(("git", "rev-parse", "--short", "HEAD"), capture_output=True, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def compare(baseline_path: Path, results: list[dict]):
+    baseline = {
+        (result["flow"], result["rows"], result["stage"]): result["seconds"]
+        for result in json.loads(baseline_path.read_text())["results"]
+    }
+
+    print(f"\n{'flow':>6} {'rows':>9} {'stage':>12} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for result in results:
+        if (before := baseline.get((result["flow"], result["rows"], result["stage"]))) is None:
+            continue
+        print(
+            f"{result['flow']:>6} {result['rows']:>9} {result['stage']:>12} "
+            f"{before:>9.3f}s {result['seconds']:>9.3f}s {result['seconds'] / before:>6.2f}x",
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROW_COUNTS)
+    parser.add_argument("--flows", nargs="+", choices=FLOWS, default=FLOWS)
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=FORMATS[:1])
+    parser.add_argument("--output", type=Path, help="write the results to this JSON file")
+    parser.add_argument("--compare", type=Path, help="JSON results of a previous run to compare with")
+    arguments = parser.parse_args()
+
+    # Debug mode, so that static files resolve without a collected manifest
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+    os.environ.setdefault("DJANGO_DEBUG", "1")
+    django.setup()
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        for flow in arguments.flows:
+            if flow == "startup":
+                results.extend(run_startup())
+                continue
+
+            generators, run = RUNNERS[flow]
+
+            for rows in arguments.rows:
+                for input_format in arguments.formats:
+                    path = generators[input_format](Path(directory) / f"{flow}-{rows}.{input_format}", rows)
+                    timings = Timings(flow if input_format == "xlsx" else f"{flow}-{input_format}", rows)
+                    run(path, timings)
+                    results.extend(timings.results)
+                    path.unlink()
+
+    if arguments.output is not None:
+        arguments.output.write_text(
+            json.dumps(
+                {
+                    "commit": get_commit(),
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "python": sys.version.split()[0],
+                    "platform": platform.platform(),
+                    "results": results,
+                },
+                indent=2,
+            ),
+        )
+
+    if arguments.compare is not None:
+        compare(arguments.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Cold vs. warm pain.001 schema validation latency.
+
+Cold is the first validation in a fresh worker, including compiling the XSD, which is what every export used to pay
+with `sepaxml.SepaTransfer.export(validate=True)`. Warm validations reuse the per-process compiled schema.
+
+Usage: python -m benchmarks.validation [transactions ...]
+"""
+
+import datetime
+import os
+import sys
+import time
+
+import django
+
+DEFAULT_TRANSACTION_COUNTS = (1, 100, 1_000, 10_000)
+REPETITIONS = 3
+
+
+def main(transaction_counts: tuple[int, ...]):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+    os.environ.setdefault("INTERNAL_IPS", "127.0.0.1")
+    django.setup()
+
+    from sepacetamol.pain import BatchBooking, CreditTransferWriter, Payment
+    from sepacetamol.validation import get_schema, validate
+
+    writer = CreditTransferWriter(
+        name="honeymeets continuity GmbH",
+        iban="DE02120300000000202051",
+        bic="BYLADEM1001",
+        batch_booking=BatchBooking.TRUE,
+        execution_date=datetime.date.today(),
+    )
+
+    def documents(transactions: int) -> list[bytes]:
+        payment = Payment(
+            name="CANCOM1 GmbH",
+            iban="DE17720400460112921200",
+            bic="COBADEFF720",
+            amount=12345,
+            description="Auftrag 12345678-9, 12.03.2020, v1/2345",
+            endtoend_id="Kdn. 1234567",
+        )
+        return list(writer.iter_chunks([payment] * transactions))
+
+    start = time.perf_counter()
+    get_schema()
+    print(f"schema compilation: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    print(f"{'transactions':>12} {'cold (ms)':>10} {'warm (ms)':>10}")
+
+    for transactions in transaction_counts:
+        chunks = documents(transactions)
+
+        timings = []
+        for _ in range(REPETITIONS):
+            start = time.perf_counter()
+            validate(chunks)
+            timings.append(time.perf_counter() - start)
+
+        warm = min(timings)
+
+        get_schema.cache_clear()
+        start = time.perf_counter()
+        validate(chunks)
+        cold = time.perf_counter() - start
+
+        print(f"{transactions:>12} {cold * 1000:>10.1f} {warm * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main(tuple(int(arg) for arg in sys.argv[1:]) or DEFAULT_TRANSACTION_COUNTS)
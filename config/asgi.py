@@ -9,8 +9,15 @@ https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+os.environ.setdefault("ASYNC_VIEWS", "1")
 
 application = get_asgi_application()
+
+if settings.WARM_UP:
+    from sepacetamol.startup import warm_up
+
+    warm_up()
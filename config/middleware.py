@@ -0,0 +1,182 @@
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from whitenoise import middleware
+
+from sepacetamol import metrics, profiling
+
+
+class WhiteNoiseMiddleware(middleware.WhiteNoiseMiddleware):
+    """
+    WhiteNoise middleware that can also run natively under ASGI.
+
+    The upstream middleware is sync only, so Django would run it and with it every request in the single thread
+    reserved for sync code, serializing the async views behind it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        static_file = self.find_file(request.path_info) if self.autorefresh else self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
+
+
+class MetricsMiddleware:
+    """
+    Time every request, report its stages in the Server-Timing header and record it in the process-wide metrics.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.current_request.set(request_metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current_request.reset(token)
+
+        return self.finish(request, response, request_metrics, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.current_request.set(request_metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current_request.reset(token)
+
+        return self.finish(request, response, request_metrics, time.perf_counter() - started)
+
+    @staticmethod
+    def finish(request, response, request_metrics: metrics.RequestMetrics, seconds: float):
+        resolver_match = request.resolver_match
+        metrics.record_request(
+            endpoint=resolver_match.url_name or resolver_match.view_name if resolver_match is not None else "unmatched",
+            method=request.method,
+            status=response.status_code,
+            seconds=seconds,
+            upload_size=int(request.META.get("CONTENT_LENGTH") or 0),
+            metrics=request_metrics,
+        )
+
+        response["Server-Timing"] = metrics.get_server_timing(request_metrics, seconds)
+
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profile requests from internal IPs that ask for it with the X-Profile header, or a sample of them, and return the
+    id of the stored profile in the X-Profile-Id header. Removed from the middleware chain unless PROFILING is set.
+
+    Conversions offloaded to the process pool are not covered, and under ASGI the profile includes whatever else the
+    event loop runs concurrently.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING:
+            raise MiddlewareNotUsed
+
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def should_profile(request) -> bool:
+        return profiling.is_internal(request) and (
+            "HTTP_X_PROFILE" in request.META or random.random() < settings.PROFILING_SAMPLE_RATE
+        )
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        with profiling.profile(f"{request.method} {request.get_full_path()}") as result:
+            response = self.get_response(request)
+
+        return self.finish(response, result)
+
+    async def __acall__(self, request):
+        if not self.should_profile(request):
+            return await self.get_response(request)
+
+        with profiling.profile(f"{request.method} {request.get_full_path()}") as result:
+            response = await self.get_response(request)
+
+        return self.finish(response, result)
+
+    @staticmethod
+    def finish(response, result: profiling.Profile | None):
+        if result is not None:
+            response["X-Profile-Id"] = result.id
+        return response
+
+
+class UploadLimitMiddleware:
+    """
+    Reject request bodies beyond UPLOAD_MAX_SIZE from their declared length, before anything reads them.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def check(request) -> HttpResponse | None:
+        size = int(request.META.get("CONTENT_LENGTH") or 0)
+        if size <= settings.UPLOAD_MAX_SIZE:
+            return None
+
+        return HttpResponse(
+            f"The upload is {size} bytes, at most {settings.UPLOAD_MAX_SIZE} bytes are accepted",
+            status=413,
+            content_type="text/plain; charset=utf-8",
+        )
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        return self.check(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        return self.check(request) or await self.get_response(request)
@@ -11,6 +11,8 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 """
 
 import os
+import tempfile
+from decimal import Decimal
 from pathlib import Path
 
 from django.contrib.messages import constants as message_constants
@@ -55,8 +57,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "config.middleware.MetricsMiddleware",
+    "config.middleware.ProfilingMiddleware",
+    "config.middleware.UploadLimitMiddleware",
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "config.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -118,4 +123,73 @@ MESSAGE_TAGS = {
     message_constants.ERROR: "danger",  # Bootstrap error class
 }
 
-SECURE_REDIRECT_EXEMPT = [r"^health\/$"]
+SECURE_REDIRECT_EXEMPT = [r"^health\/$", r"^metrics\/$"]
+
+# SEPA XML schema validation, run on a bounded per-process thread pool
+
+SEPA_VALIDATION_WORKERS = int(os.getenv("SEPA_VALIDATION_WORKERS", "1"))
+SEPA_STREAM_VALIDATION = True if bool(os.getenv("SEPA_STREAM_VALIDATION")) else False
+
+# Banks cap the transactions of a pain.001 document and of each of its payment information blocks: beyond these
+# limits, transactions are split into further blocks, or further documents returned as a ZIP; 0 means no limit
+
+SEPA_MAX_BLOCK_TRANSACTIONS = int(os.getenv("SEPA_MAX_BLOCK_TRANSACTIONS", "0"))
+SEPA_MAX_BLOCK_AMOUNT = int(Decimal(os.getenv("SEPA_MAX_BLOCK_AMOUNT", "0")).scaleb(2))  # euros, kept in cents
+SEPA_MAX_FILE_TRANSACTIONS = int(os.getenv("SEPA_MAX_FILE_TRANSACTIONS", "0"))
+SEPA_MAX_FILE_AMOUNT = int(Decimal(os.getenv("SEPA_MAX_FILE_AMOUNT", "0")).scaleb(2))  # euros, kept in cents
+
+# Uploads are always spooled to temporary files, and rejected beyond these budgets before they are parsed
+
+FILE_UPLOAD_HANDLERS = ["django.core.files.uploadhandler.TemporaryFileUploadHandler"]
+UPLOAD_MAX_SIZE = int(os.getenv("UPLOAD_MAX_SIZE", str(50 * 1024 * 1024)))  # bytes of the request body
+UPLOAD_MAX_SHEET_SIZE = int(os.getenv("UPLOAD_MAX_SHEET_SIZE", str(256 * 1024 * 1024)))  # bytes of a workbook, unpacked
+UPLOAD_MAX_ROWS = int(os.getenv("UPLOAD_MAX_ROWS", "250000"))
+
+# Workers restart gracefully once their resident memory exceeds this after a request, 0 disables; conversion processes
+# are replaced after a number of tasks, 0 keeps them for good
+
+WORKER_MAX_RSS = int(os.getenv("WORKER_MAX_RSS", "0"))  # bytes
+CONVERSION_MAX_TASKS_PER_CHILD = int(os.getenv("CONVERSION_MAX_TASKS_PER_CHILD", "0"))
+
+# Import and initialise everything at startup, for servers preloading the application before forking their workers
+
+WARM_UP = True if bool(os.getenv("WARM_UP")) else False
+
+# Async views offloading conversions to a per-process pool, enabled by default when served through config/asgi.py
+
+ASYNC_VIEWS = True if bool(os.getenv("ASYNC_VIEWS")) else False
+CONVERSION_PROCESSES = int(os.getenv("CONVERSION_PROCESSES", str(os.cpu_count() or 1)))
+
+# Background conversions, queued on the same pool and tracked in SQLite next to their results
+
+JOBS_DIR = Path(os.getenv("JOBS_DIR", Path(tempfile.gettempdir()) / "sepacetamol-jobs"))
+JOB_RETENTION = int(os.getenv("JOB_RETENTION", str(24 * 60 * 60)))  # seconds
+
+# Parsed uploads kept between the SEPA preview and the generate step, which posts only their token
+
+DRAFTS_DIR = Path(os.getenv("DRAFTS_DIR", Path(tempfile.gettempdir()) / "sepacetamol-drafts"))
+DRAFT_RETENTION = int(os.getenv("DRAFT_RETENTION", str(24 * 60 * 60)))  # seconds
+
+# Fingerprints of the payments exported by the SEPA form, to flag uploads paying the same again
+
+PAYMENT_HISTORY_DIR = Path(os.getenv("PAYMENT_HISTORY_DIR", Path(tempfile.gettempdir()) / "sepacetamol-history"))
+PAYMENT_HISTORY_RETENTION = int(os.getenv("PAYMENT_HISTORY_RETENTION", str(365 * 24 * 60 * 60)))  # seconds
+
+# Content-addressed cache of parsed previews and generated files, disabled unless given a size
+
+RESULT_CACHE_DIR = Path(os.getenv("RESULT_CACHE_DIR", Path(tempfile.gettempdir()) / "sepacetamol-cache"))
+RESULT_CACHE_MAX_SIZE = int(os.getenv("RESULT_CACHE_MAX_SIZE", "0"))  # bytes
+RESULT_CACHE_MAX_AGE = int(os.getenv("RESULT_CACHE_MAX_AGE", str(24 * 60 * 60)))  # seconds
+
+# Metrics of every worker, each saving a snapshot after its requests for /metrics to add them up, served to
+# INTERNAL_IPS and to scrapers presenting METRICS_TOKEN as a bearer token
+
+METRICS_DIR = Path(os.getenv("METRICS_DIR", Path(tempfile.gettempdir()) / "sepacetamol-metrics"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# On-demand CPU and allocation profiles of requests from INTERNAL_IPS, kept in a ring buffer of the latest ones
+
+PROFILING = True if bool(os.getenv("PROFILING")) else False
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_DIR = Path(os.getenv("PROFILING_DIR", Path(tempfile.gettempdir()) / "sepacetamol-profiles"))
+PROFILING_RING_SIZE = int(os.getenv("PROFILING_RING_SIZE", "20"))
@@ -21,4 +21,8 @@ from . import views
 urlpatterns = [
     path("", include("sepacetamol.urls")),
     path("health/", views.HealthCheckView.as_view(), name="health"),
+    path("metrics/", views.MetricsView.as_view(), name="metrics"),
+    path("profiles/", views.ProfileListView.as_view(), name="profiles"),
+    path("profiles/<str:profile_id>/", views.ProfileDetailView.as_view(), name="profile"),
+    path("profiles/<str:profile_id>/download/", views.ProfileDownloadView.as_view(), name="profile-download"),
 ]
@@ -1,7 +1,51 @@
-from django.http import JsonResponse
+import hmac
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
 from django.views import View
 
+from sepacetamol import metrics, profiling
+
 
 class HealthCheckView(View):
     def get(self, request, *args, **kwargs):
         return JsonResponse({"status": "pass"})
+
+
+class MetricsView(View):
+    def dispatch(self, request, *args, **kwargs):
+        token = settings.METRICS_TOKEN
+        authorization = request.META.get("HTTP_AUTHORIZATION", "")
+        if not profiling.is_internal(request) and not (token and hmac.compare_digest(authorization, f"Bearer {token}")):
+            raise Http404
+        return super().dispatch(request, *args, **kwargs)
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(metrics.expose(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class ProfileView(View):
+    def dispatch(self, request, *args, **kwargs):
+        if not settings.PROFILING or not profiling.is_internal(request):
+            raise Http404
+        return super().dispatch(request, *args, **kwargs)
+
+
+class ProfileListView(ProfileView):
+    def get(self, request, *args, **kwargs):
+        return JsonResponse({"profiles": profiling.list_profiles()})
+
+
+class ProfileDetailView(ProfileView):
+    def get(self, request, profile_id: str, *args, **kwargs):
+        if (path := profiling.get_profile_path(profile_id, ".json")) is None:
+            raise Http404
+        return FileResponse(path.open("rb"), content_type="application/json")
+
+
+class ProfileDownloadView(ProfileView):
+    def get(self, request, profile_id: str, *args, **kwargs):
+        if (path := profiling.get_profile_path(profile_id, ".prof")) is None:
+            raise Http404
+        # Binary pstats dump, to be opened with `python -m pstats` or snakeviz
+        return FileResponse(path.open("rb"), as_attachment=True, filename=path.name)
@@ -1,11 +1,28 @@
+import os
+
 bind = "0.0.0.0:8000"
 worker = 2
 threads = 4
 keepalive = 5
 wsgi_app = "config.wsgi"
+# Load and warm the application once in the master, workers share it copy-on-write instead of importing it each
+preload_app = True
+raw_env = ["WARM_UP=1"]
 loglevel = "debug"
 access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s" "%(M)s"'
 errorlog = "-"  # log to stderr
 accesslog = "-"  # log to stdout
 # Enable inheritance for stdio file descriptors in daemon mode, allows to stream more logs to stdout
 enable_stdio_inheritance = True
+
+
+def on_starting(server):
+    # Once in the master before the workers start, with or without preloading the application
+    import django
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+    django.setup()
+
+    from sepacetamol.startup import clean_up
+
+    clean_up()
@@ -1,5 +1,18 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.signals import request_finished
 
 
 class SepacetamolConfig(AppConfig):
     name = "sepacetamol"
+
+    def ready(self):
+        from . import iban
+
+        # schwifty loads its registries on first use, do it at startup rather than in the first request of a worker
+        iban.warm_up()
+
+        if settings.WORKER_MAX_RSS:
+            from .workers import recycle_if_oversized
+
+            request_finished.connect(recycle_if_oversized, dispatch_uid="recycle_if_oversized")
@@ -0,0 +1,143 @@
+import json
+import os
+import shutil
+import zipfile
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from dataclasses import dataclass
+from operator import attrgetter
+from pathlib import PurePosixPath
+from typing import IO
+
+from django.conf import settings
+
+from .processes import get_process_pool
+
+# Optional member of the input archive, mapping file names to settings that override those of the request
+MANIFEST = "settings.json"
+
+Converter = Callable[[str, str | bytes, dict[str, str]], tuple[str, str]]
+
+
+@dataclass(frozen=True)
+class BatchResult:
+    source: str
+    target: str | None = None
+    path: str | None = None
+    error: str | None = None
+
+
+class ChunkBuffer:
+    """
+    Write-only file object collecting what `zipfile` writes, so that the archive can be streamed as it is built.
+    Having no `tell`, it makes `zipfile` write data descriptors instead of seeking back to the local headers.
+    """
+
+    def __init__(self):
+        self.chunks: list[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def iter_batch_sources(archive: IO[bytes], defaults: dict[str, str]) -> Iterator[tuple[str, bytes, dict[str, str]]]:
+    with zipfile.ZipFile(archive) as input_zip:
+        names = [
+            info.filename
+            for info in input_zip.infolist()
+            if not info.is_dir()
+            and info.filename != MANIFEST
+            and not PurePosixPath(info.filename).name.startswith((".", "~$"))
+            and not info.filename.startswith("__MACOSX/")
+        ]
+        manifest = json.loads(input_zip.read(MANIFEST)) if MANIFEST in input_zip.namelist() else {}
+
+        for name in names:
+            yield name, input_zip.read(name), {**defaults, **manifest.get(name, {})}
+
+
+def iter_batch_results(
+    convert: Callable[..., tuple[str, str]],
+    sources: Iterable[tuple],
+) -> Iterator[BatchResult]:
+    """
+    Convert the files of a batch on the process pool and yield their results in order of completion. Each source is
+    a tuple of arguments to `convert`, the first one being its name. The number of files in flight is bounded by
+    twice the pool size, so that the archive is never unpacked into memory as a whole.
+    """
+    pool = get_process_pool()
+    max_pending = 2 * settings.CONVERSION_PROCESSES
+    pending: dict[Future, str] = {}
+
+    def collect(futures: Iterable[Future]) -> Iterator[BatchResult]:
+        for future in futures:
+            source = pending.pop(future)
+            try:
+                target, path = future.result()
+            except Exception as e:
+                yield BatchResult(source=source, error=str(e))
+            else:
+                yield BatchResult(source=source, target=target, path=path)
+
+    try:
+        for source in sources:
+            if len(pending) >= max_pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                yield from collect(done)
+
+            pending[pool.submit(convert, *source)] = source[0]
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            yield from collect(done)
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def convert_all(convert: Callable[..., tuple[str, str]], sources: Iterable[tuple]) -> list[BatchResult]:
+    """
+    Convert files that only make sense together, like the documents of a split credit transfer, before any of them
+    is sent. If one fails, the files of the others are removed and a `ValueError` names every failure.
+    """
+    results = sorted(iter_batch_results(convert, sources), key=attrgetter("source"))
+
+    if failed := [result for result in results if result.error is not None]:
+        for result in results:
+            if result.path is not None:
+                os.unlink(result.path)
+        raise ValueError("; ".join(f"{result.source}: {result.error}" for result in failed))
+
+    return results
+
+
+def iter_batch_zip(results: Iterable[BatchResult]) -> Iterator[bytes]:
+    """
+    Stream a ZIP of the converted files, one entry as soon as each conversion finishes. Files that could not be
+    converted are represented by an `.error.txt` entry with the message instead.
+    """
+    buffer = ChunkBuffer()
+
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as output_zip:
+        for result in results:
+            if result.error is not None:
+                output_zip.writestr(f"{result.source}.error.txt", result.error)
+            else:
+                try:
+                    with open(result.path, "rb") as contents, output_zip.open(result.target, "w") as entry:
+                        shutil.copyfileobj(contents, entry)
+                finally:
+                    os.unlink(result.path)
+
+            yield buffer.pop()
+
+    yield buffer.pop()
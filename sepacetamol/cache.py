@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import sqlite3
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import IO, Any
+
+from django.conf import settings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entry (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    meta TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entry_accessed_at ON entry (accessed_at);
+CREATE TABLE IF NOT EXISTS counter (
+    namespace TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (namespace, name)
+);
+"""
+
+
+# Part of every key, to be bumped whenever a change of the code alters the results or the shape of the objects
+# pickled into the cache, so that entries written by an older release are never read back
+VERSION = 1
+
+
+@dataclass(frozen=True)
+class CachedResult:
+    file: IO[bytes]
+    meta: dict
+
+
+def is_enabled() -> bool:
+    return settings.RESULT_CACHE_MAX_SIZE > 0
+
+
+def connect() -> sqlite3.Connection:
+    directory = settings.RESULT_CACHE_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+
+    connection = sqlite3.connect(directory / "index.sqlite3", timeout=30, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def get_file_digest(file: IO[bytes]) -> str:
+    file.seek(0)
+    digest = hashlib.file_digest(file, "sha256").hexdigest()
+    file.seek(0)
+    return digest
+
+
+def get_cache_key(namespace: str, *parts: Any) -> str:
+    """
+    Content address of a result: the namespace, the digest of the input and every parameter the result depends on,
+    along with the `VERSION` of the code that produced it.
+    """
+    return f"{namespace}-" + hashlib.sha256(json.dumps([str(part) for part in (VERSION, *parts)]).encode()).hexdigest()
+
+
+def get_entry_path(key: str) -> Path:
+    return settings.RESULT_CACHE_DIR / key[-2:] / key
+
+
+def count(connection: sqlite3.Connection, key: str, name: str):
+    connection.execute(
+        "INSERT INTO counter (namespace, name, value) VALUES (?, ?, 1) "
+        "ON CONFLICT (namespace, name) DO UPDATE SET value = value + 1",
+        (key.rsplit("-", 1)[0], name),
+    )
+
+
+def lookup(key: str) -> CachedResult | None:
+    if not is_enabled():
+        return None
+
+    now = time.time()
+
+    with closing(connect()) as connection:
+        row = connection.execute(
+            "UPDATE entry SET accessed_at = ? WHERE key = ? AND created_at >= ? RETURNING meta",
+            (now, key, now - settings.RESULT_CACHE_MAX_AGE),
+        ).fetchone()
+
+        try:
+            # Opened right away, an entry evicted by another process in the meantime stays readable until closed
+            file = get_entry_path(key).open("rb") if row is not None else None
+        except FileNotFoundError:
+            file = None
+
+        count(connection, key, "hits" if file is not None else "misses")
+
+    return CachedResult(file=file, meta=json.loads(row[0])) if file is not None else None
+
+
+def store(key: str, contents: IO[bytes], meta: dict | None = None):
+    """
+    Copy a result into the cache from the current position of `contents`, which is rewound to it afterwards, then
+    evict expired entries and the least recently used ones beyond the size limit.
+    """
+    if not is_enabled():
+        return
+
+    path = get_entry_path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    position = contents.tell()
+    with NamedTemporaryFile(dir=path.parent, delete=False) as output:
+        shutil.copyfileobj(contents, output)
+    contents.seek(position)
+
+    # Renamed into place, so that concurrent readers never see a partial entry
+    os.replace(output.name, path)
+
+    now = time.time()
+
+    with closing(connect()) as connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO entry (key, size, meta, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (key, path.stat().st_size, json.dumps(meta or {}), now, now),
+        )
+        evict(connection)
+
+
+def evict(connection: sqlite3.Connection):
+    evicted = connection.execute(
+        "DELETE FROM entry WHERE created_at < ? RETURNING key",
+        (time.time() - settings.RESULT_CACHE_MAX_AGE,),
+    ).fetchall()
+
+    (size,) = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entry").fetchone()
+
+    if size > settings.RESULT_CACHE_MAX_SIZE:
+        for key, entry_size in connection.execute("SELECT key, size FROM entry ORDER BY accessed_at").fetchall():
+            connection.execute("DELETE FROM entry WHERE key = ?", (key,))
+            evicted.append((key,))
+
+            size -= entry_size
+            if size <= settings.RESULT_CACHE_MAX_SIZE:
+                break
+
+    for (key,) in evicted:
+        get_entry_path(key).unlink(missing_ok=True)
+
+
+def load_object(key: str) -> Any | None:
+    # Only ever unpickles what this application has stored in its own cache directory
+    if (result := lookup(key)) is None:
+        return None
+
+    with result.file:
+        return pickle.load(result.file)
+
+
+def store_object(key: str, value: Any):
+    if not is_enabled():
+        return
+
+    with NamedTemporaryFile() as contents:
+        pickle.dump(value, contents, protocol=pickle.HIGHEST_PROTOCOL)
+        contents.seek(0)
+        store(key, contents)
+
+
+def get_stats() -> dict:
+    """
+    Number and total size of the cached entries, and hits and misses per namespace since the cache was created.
+    """
+    if not is_enabled():
+        return {"entries": 0, "size": 0, "namespaces": {}}
+
+    with closing(connect()) as connection:
+        counters = connection.execute("SELECT namespace, name, value FROM counter").fetchall()
+        entries, size = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entry").fetchone()
+
+    namespaces: dict[str, dict[str, int]] = {}
+    for namespace, name, value in counters:
+        namespaces.setdefault(namespace, {"hits": 0, "misses": 0})[name] = value
+
+    return {"entries": entries, "size": size, "namespaces": namespaces}
@@ -0,0 +1,97 @@
+import pickle
+import sqlite3
+import time
+from collections.abc import Iterable
+from contextlib import closing
+from itertools import islice
+from pathlib import Path
+from typing import Any
+from uuid import uuid4
+
+from django.conf import settings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS draft (
+    token TEXT PRIMARY KEY,
+    summary BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS draft_page (
+    token TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    rows BLOB NOT NULL,
+    PRIMARY KEY (token, page)
+);
+"""
+
+
+def connect(directory: Path) -> sqlite3.Connection:
+    directory.mkdir(parents=True, exist_ok=True)
+
+    connection = sqlite3.connect(directory / "drafts.sqlite3", timeout=30, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def dumps(value: Any) -> bytes:
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def save_draft(summary: Any, rows: Iterable[tuple], page_size: int) -> str:
+    """
+    Keep a parsed upload server-side between the preview and the generate step, and return the token to fetch it by.
+    The rows are stored in pages, so that showing one of them does not load the others.
+    """
+    token = uuid4().hex
+    iterator = iter(rows)
+
+    with closing(connect(settings.DRAFTS_DIR)) as connection:
+        purge_drafts(connection)
+
+        connection.execute("BEGIN")
+        connection.execute(
+            "INSERT INTO draft (token, summary, created_at) VALUES (?, ?, ?)",
+            (token, dumps(summary), time.time()),
+        )
+        page = 1
+        while page_rows := list(islice(iterator, page_size)):
+            connection.execute(
+                "INSERT INTO draft_page (token, page, rows) VALUES (?, ?, ?)",
+                (token, page, dumps(page_rows)),
+            )
+            page += 1
+        connection.execute("COMMIT")
+
+    return token
+
+
+def load_draft(token: str, page: int | None = None) -> tuple[Any, list[tuple]] | None:
+    """
+    Return the summary of a draft and its rows, all of them or those of a single page, which are empty past the end.
+    """
+    # Only ever unpickles what this application has stored in its own database
+    with closing(connect(settings.DRAFTS_DIR)) as connection:
+        row = connection.execute(
+            "SELECT summary FROM draft WHERE token = ? AND created_at >= ?",
+            (token, time.time() - settings.DRAFT_RETENTION),
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        if page is None:
+            pages = connection.execute("SELECT rows FROM draft_page WHERE token = ? ORDER BY page", (token,))
+        else:
+            pages = connection.execute("SELECT rows FROM draft_page WHERE token = ? AND page = ?", (token, page))
+
+        return pickle.loads(row[0]), [page_row for (rows,) in pages for page_row in pickle.loads(rows)]
+
+
+def purge_drafts(connection: sqlite3.Connection):
+    expired = connection.execute(
+        "DELETE FROM draft WHERE created_at < ? RETURNING token",
+        (time.time() - settings.DRAFT_RETENTION,),
+    ).fetchall()
+
+    connection.executemany("DELETE FROM draft_page WHERE token = ?", expired)
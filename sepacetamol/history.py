@@ -0,0 +1,90 @@
+import hashlib
+import sqlite3
+import time
+from collections.abc import Iterable, Sequence
+from contextlib import closing
+from datetime import UTC, datetime
+from pathlib import Path
+
+from django.conf import settings
+
+from .pain import Payment
+
+# Bound parameters per statement, well below the limit of older SQLite builds
+BATCH_SIZE = 500
+
+# Incremental vacuuming must be set before the first table is created, and lets purges give pages back to the system
+SCHEMA = """
+PRAGMA auto_vacuum = INCREMENTAL;
+CREATE TABLE IF NOT EXISTS payment (
+    digest BLOB PRIMARY KEY,
+    exported_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS payment_exported_at ON payment (exported_at);
+"""
+
+
+def connect(directory: Path) -> sqlite3.Connection:
+    directory.mkdir(parents=True, exist_ok=True)
+
+    connection = sqlite3.connect(directory / "history.sqlite3", timeout=30, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def get_payment_digest(payment: Payment) -> bytes:
+    """
+    Fingerprint of what makes two payments the same: creditor IBAN, amount, reference and purpose.
+    """
+    return hashlib.blake2b(
+        "\x1f".join((payment.iban, str(payment.amount), payment.endtoend_id, payment.description)).encode(),
+        digest_size=16,
+    ).digest()
+
+
+def find_exported(digests: Sequence[bytes]) -> dict[bytes, datetime]:
+    """
+    Return when each of the given payments was last exported, for those exported within the retention period. Every
+    digest is a lookup of the primary key, which hardly slows down as the history grows.
+    """
+    found = {}
+
+    with closing(connect(settings.PAYMENT_HISTORY_DIR)) as connection:
+        since = time.time() - settings.PAYMENT_HISTORY_RETENTION
+        for start in range(0, len(digests), BATCH_SIZE):
+            batch = digests[start : start + BATCH_SIZE]
+            found.update(
+                connection.execute(
+                    f"SELECT digest, exported_at FROM payment WHERE digest IN ({','.join('?' * len(batch))}) "
+                    "AND exported_at >= ?",
+                    (*batch, since),
+                ),
+            )
+
+    return {digest: datetime.fromtimestamp(exported_at, UTC) for digest, exported_at in found.items()}
+
+
+def record_exported(digests: Iterable[bytes]):
+    now = time.time()
+
+    with closing(connect(settings.PAYMENT_HISTORY_DIR)) as connection:
+        purge_history(connection)
+
+        connection.execute("BEGIN")
+        connection.executemany(
+            "INSERT INTO payment (digest, exported_at) VALUES (?, ?) "
+            "ON CONFLICT (digest) DO UPDATE SET exported_at = excluded.exported_at",
+            ((digest, now) for digest in digests),
+        )
+        connection.execute("COMMIT")
+
+
+def purge_history(connection: sqlite3.Connection):
+    deleted = connection.execute(
+        "DELETE FROM payment WHERE exported_at < ?",
+        (time.time() - settings.PAYMENT_HISTORY_RETENTION,),
+    ).rowcount
+
+    if deleted:
+        connection.execute("PRAGMA incremental_vacuum")
@@ -0,0 +1,162 @@
+import shutil
+import sqlite3
+import time
+from collections.abc import Callable
+from contextlib import closing
+from dataclasses import dataclass
+from enum import StrEnum, auto, unique
+from pathlib import Path
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+
+from .processes import get_process_pool
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS job (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    filename TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    finished_at REAL
+)
+"""
+
+
+@unique
+class JobStatus(StrEnum):
+    PENDING = auto()
+    RUNNING = auto()
+    DONE = auto()
+    FAILED = auto()
+
+
+@dataclass(frozen=True)
+class Job:
+    id: str
+    status: JobStatus
+    filename: str | None
+    error: str | None
+    created_at: float
+    finished_at: float | None
+
+
+def connect(directory: Path) -> sqlite3.Connection:
+    directory.mkdir(parents=True, exist_ok=True)
+
+    # Autocommit, every statement is a transaction of its own; WAL lets workers poll while a job is being updated
+    connection = sqlite3.connect(directory / "jobs.sqlite3", timeout=30, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(SCHEMA)
+    return connection
+
+
+def get_result_path(directory: Path, job_id: str) -> Path:
+    return directory / f"{job_id}.result"
+
+
+def get_upload_path(directory: Path, job_id: str) -> Path:
+    return directory / f"{job_id}.upload"
+
+
+def update_job(directory: Path, job_id: str, status: JobStatus, **fields):
+    fields = {"status": status, **fields}
+    with closing(connect(directory)) as connection:
+        connection.execute(
+            f"UPDATE job SET {', '.join(f'{name} = ?' for name in fields)} WHERE id = ?",
+            (*fields.values(), job_id),
+        )
+
+
+def run_job(directory: Path, job_id: str, fn: Callable[..., tuple[str, str]], *args):
+    """
+    Worker side of a job: run a conversion returning the target filename and a temporary output path, and keep the
+    output next to the job database until it is downloaded or expires.
+    """
+    update_job(directory, job_id, JobStatus.RUNNING)
+
+    try:
+        filename, path = fn(*args)
+        shutil.move(path, get_result_path(directory, job_id))
+    except Exception as e:
+        update_job(directory, job_id, JobStatus.FAILED, error=str(e), finished_at=time.time())
+    else:
+        update_job(directory, job_id, JobStatus.DONE, filename=filename, finished_at=time.time())
+    finally:
+        get_upload_path(directory, job_id).unlink(missing_ok=True)
+
+
+def submit_job(fn: Callable[..., tuple[str, str]], *args, upload: UploadedFile | None = None) -> Job:
+    """
+    Queue a conversion on the process pool and return at once. An upload is copied next to the job database first,
+    since Django removes its temporary file at the end of the request, and its path is passed as first argument.
+    """
+    directory = settings.JOBS_DIR
+    job = Job(
+        id=uuid4().hex,
+        status=JobStatus.PENDING,
+        filename=None,
+        error=None,
+        created_at=time.time(),
+        finished_at=None,
+    )
+
+    with closing(connect(directory)) as connection:
+        purge_jobs(connection, directory)
+        connection.execute(
+            "INSERT INTO job (id, status, created_at) VALUES (?, ?, ?)",
+            (job.id, job.status, job.created_at),
+        )
+
+    if upload is not None:
+        upload_path = get_upload_path(directory, job.id)
+        with upload_path.open("wb") as output:
+            for chunk in upload.chunks():
+                output.write(chunk)
+        args = (str(upload_path), *args)
+
+    get_process_pool().submit(run_job, directory, job.id, fn, *args)
+
+    return job
+
+
+def fail_orphaned_jobs():
+    """
+    Mark jobs left pending or running by a previous run of the server as failed, as the process pool they were
+    queued on is gone.
+    """
+    with closing(connect(settings.JOBS_DIR)) as connection:
+        connection.execute(
+            "UPDATE job SET status = ?, error = ?, finished_at = ? WHERE status IN (?, ?)",
+            (JobStatus.FAILED, "Interrupted by a restart", time.time(), JobStatus.PENDING, JobStatus.RUNNING),
+        )
+
+
+def get_job(job_id: str) -> Job | None:
+    with closing(connect(settings.JOBS_DIR)) as connection:
+        row = connection.execute(
+            "SELECT id, status, filename, error, created_at, finished_at FROM job WHERE id = ?",
+            (job_id,),
+        ).fetchone()
+
+    if row is None:
+        return None
+
+    job_id, status, *fields = row
+    return Job(job_id, JobStatus(status), *fields)
+
+
+def open_job_result(job: Job):
+    return get_result_path(settings.JOBS_DIR, job.id).open("rb")
+
+
+def purge_jobs(connection: sqlite3.Connection, directory: Path):
+    expired = connection.execute(
+        "DELETE FROM job WHERE created_at < ? RETURNING id",
+        (time.time() - settings.JOB_RETENTION,),
+    ).fetchall()
+
+    for (job_id,) in expired:
+        get_result_path(directory, job_id).unlink(missing_ok=True)
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from sepacetamol.startup import clean_up
+
+
+class Command(BaseCommand):
+    help = "Fail the jobs and forget the metrics left by a previous run of the server, before starting it again."
+
+    def handle(self, *args, **options):
+        clean_up()
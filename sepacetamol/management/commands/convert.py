@@ -0,0 +1,180 @@
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sepacetamol.batch import Converter
+from sepacetamol.management.options import add_options, get_defaults
+from sepacetamol.processes import get_process_pool
+from sepacetamol.views.batch import CONVERTERS
+
+EXTENSIONS = (".xlsx", ".ods", ".csv")
+
+# Exit codes, besides 0 for success
+EXIT_FAILED = 1  # some input could not be converted
+EXIT_USAGE = 2  # invalid arguments, as for argparse
+
+
+def is_source(path: Path) -> bool:
+    return path.is_file() and path.suffix.lower() in EXTENSIONS and not path.name.startswith((".", "~$"))
+
+
+class Command(BaseCommand):
+    help = (
+        "Convert a SEPA source sheet or Personio export, read from a file or stdin, to a pain.001 document or DATEV "
+        "file written to a file or stdout. With --watch, convert every file appearing in a directory on the process "
+        "pool instead. Results are reported as JSON lines, on stdout unless it carries the converted file, and the "
+        f"exit code is {EXIT_FAILED} if any conversion failed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=CONVERTERS)
+        parser.add_argument("input", nargs="?", default="-", help="file to convert, - for stdin, or directory to watch")
+        parser.add_argument("-o", "--output", default="-", help="file to write, - for stdout, or directory to write to")
+        parser.add_argument("--name", default="stdin", help="file name of the input read from stdin, naming the output")
+        parser.add_argument("--watch", action="store_true", help="convert the files appearing in the input directory")
+        parser.add_argument("--once", action="store_true", help="with --watch, convert the files present and exit")
+        parser.add_argument("--interval", type=float, default=1.0, help="with --watch, seconds between two scans")
+        add_options(parser)
+
+    def report(self, stream, **fields):
+        stream.write(json.dumps(fields), style_func=str)
+
+    def handle(self, *args, **options):
+        convert = CONVERTERS[options["kind"]]
+        defaults = get_defaults(options)
+
+        if options["watch"]:
+            if options["input"] == "-" or options["output"] == "-":
+                raise CommandError("--watch takes an input and an output directory", returncode=EXIT_USAGE)
+            failed = self.watch(convert, Path(options["input"]), Path(options["output"]), defaults, options)
+        else:
+            failed = self.convert(convert, options["input"], options["output"], defaults, options["name"])
+
+        if failed:
+            sys.exit(EXIT_FAILED)
+
+    def convert(self, convert: Converter, source: str, output: str, defaults: dict[str, str], name: str) -> int:
+        """
+        Convert a single file in this process. Input from stdin is spooled to a temporary file first, as workbooks
+        are ZIP archives that can only be read with seeking.
+        """
+        # The converted file owns stdout then, so the summary goes to stderr
+        stream = self.stderr if output == "-" else self.stdout
+        started = time.monotonic()
+
+        with NamedTemporaryFile(prefix="sepacetamol-") as spool:
+            if source == "-":
+                shutil.copyfileobj(sys.stdin.buffer, spool)
+                spool.flush()
+                source = spool.name
+            elif os.path.isfile(source):
+                name = os.path.basename(source)
+            else:
+                raise CommandError(f"No such file: {source}", returncode=EXIT_USAGE)
+
+            try:
+                target, path = convert(name, source, defaults)
+            except Exception as e:
+                self.report(stream, source=name, error=str(e), seconds=round(time.monotonic() - started, 3))
+                return 1
+
+        try:
+            with open(path, "rb") as result:
+                if output == "-":
+                    shutil.copyfileobj(result, sys.stdout.buffer)
+                    sys.stdout.buffer.flush()
+                else:
+                    with open(output, "wb") as file:
+                        shutil.copyfileobj(result, file)
+        finally:
+            os.unlink(path)
+
+        self.report(stream, source=name, target=target, seconds=round(time.monotonic() - started, 3))
+        return 0
+
+    def watch(
+        self,
+        convert: Converter,
+        directory: Path,
+        output_directory: Path,
+        defaults: dict[str, str],
+        options: dict,
+    ) -> int:
+        """
+        Convert the files appearing in a directory on the process pool, writing the results to the output directory.
+        Sources are moved to `done/` or `failed/` below the watched directory once converted, the latter along with
+        an `.error.txt` file, so that they are not picked up again after a restart.
+        """
+        if not directory.is_dir():
+            raise CommandError(f"No such directory: {directory}", returncode=EXIT_USAGE)
+
+        done_directory, failed_directory = directory / "done", directory / "failed"
+        for path in (output_directory, done_directory, failed_directory):
+            path.mkdir(parents=True, exist_ok=True)
+
+        pool = get_process_pool()
+        pending: dict[Future, tuple[Path, float]] = {}
+        seen: dict[Path, tuple[int, int]] = {}
+        started = time.monotonic()
+        converted = failed = 0
+
+        def collect(futures):
+            nonlocal converted, failed
+            for future in futures:
+                source, submitted = pending.pop(future)
+                seconds = round(time.monotonic() - submitted, 3)
+                try:
+                    target, path = future.result()
+                except Exception as e:
+                    failed += 1
+                    shutil.move(source, failed_directory / source.name)
+                    (failed_directory / f"{source.name}.error.txt").write_text(str(e))
+                    self.report(self.stdout, source=source.name, error=str(e), seconds=seconds)
+                else:
+                    converted += 1
+                    (output_directory / target).parent.mkdir(parents=True, exist_ok=True)
+                    shutil.move(path, output_directory / target)
+                    shutil.move(source, done_directory / source.name)
+                    self.report(self.stdout, source=source.name, target=target, seconds=seconds)
+
+        try:
+            while True:
+                collect([future for future in pending if future.done()])
+
+                in_flight = {source for source, _ in pending.values()}
+                current = {path: path.stat() for path in directory.iterdir() if is_source(path)}
+                current = {path: (stat.st_size, stat.st_mtime_ns) for path, stat in current.items()}
+
+                # Files still being written are left for a later scan, until their size and time stop changing
+                for path, state in current.items():
+                    if path not in in_flight and (options["once"] or seen.get(path) == state):
+                        pending[pool.submit(convert, path.name, str(path), defaults)] = (path, time.monotonic())
+                seen = current
+
+                if options["once"]:
+                    while pending:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    break
+
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            # Files not started yet stay in place for the next run, those being converted are finished
+            for future in [future for future in pending if future.cancel()]:
+                del pending[future]
+            collect(wait(pending).done)
+
+        self.report(
+            self.stdout,
+            converted=converted,
+            failed=failed,
+            seconds=round(time.monotonic() - started, 3),
+        )
+        return failed
@@ -0,0 +1,50 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sepacetamol.batch import iter_batch_results, iter_batch_sources, iter_batch_zip
+from sepacetamol.management.options import add_options, get_defaults
+from sepacetamol.views.batch import CONVERTERS
+
+
+class Command(BaseCommand):
+    help = "Convert a ZIP of SEPA source sheets or Personio exports to a ZIP of pain.001 documents or DATEV files."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=CONVERTERS)
+        parser.add_argument("input", help="ZIP archive of workbooks")
+        parser.add_argument("output", help="ZIP archive to write, - for stdout")
+        add_options(parser)
+
+    def handle(self, *args, **options):
+        defaults = get_defaults(options)
+        started = time.monotonic()
+        failed = converted = 0
+
+        def report(results):
+            nonlocal failed, converted
+            for result in results:
+                if result.error is not None:
+                    failed += 1
+                    self.stderr.write(f"{result.source}: {result.error}")
+                else:
+                    converted += 1
+                    self.stderr.write(f"{result.source} -> {result.target}")
+                yield result
+
+        with open(options["input"], "rb") as archive:
+            results = report(iter_batch_results(CONVERTERS[options["kind"]], iter_batch_sources(archive, defaults)))
+
+            output = sys.stdout.buffer if options["output"] == "-" else open(options["output"], "wb")
+            try:
+                output.writelines(iter_batch_zip(results))
+            finally:
+                if output is not sys.stdout.buffer:
+                    output.close()
+
+        elapsed = time.monotonic() - started
+        self.stderr.write(f"Converted {converted} files in {elapsed:.1f}s, {60 * converted / elapsed:.0f} per minute")
+
+        if failed:
+            raise CommandError(f"{failed} of {failed + converted} files could not be converted")
@@ -0,0 +1,14 @@
+# Settings applied to every file converted, unless overridden per file like in the settings.json of an archive
+OPTIONS = ("consultant-number", "client-number", "batch-booking", "execution-date")
+
+
+def add_options(parser):
+    for option in OPTIONS:
+        parser.add_argument(f"--{option}")
+
+
+def get_defaults(options: dict) -> dict[str, str]:
+    """
+    Settings given on the command line, keyed like the form fields the converters read them from.
+    """
+    return {option: value for option in OPTIONS if (value := options[option.replace("-", "_")]) is not None}
@@ -0,0 +1,135 @@
+import json
+import zipfile
+from io import BytesIO, StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase
+
+from sepacetamol.management.commands import convert
+from sepacetamol.test_readers import make_workbook
+from sepacetamol.views.test_batch import make_archive
+from sepacetamol.views.test_jobs import PERSONIO_ROWS
+from sepacetamol.views.test_sepa import TEMPLATE_PATH
+
+
+class TestConvertBatchCommand(SimpleTestCase):
+    def setUp(self):
+        settings = self.settings(CONVERSION_PROCESSES=1)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_convert_batch(self):
+        with TemporaryDirectory() as directory:
+            input_path, output_path = Path(directory) / "input.zip", Path(directory) / "output.zip"
+            input_path.write_bytes(make_archive({"march.xlsx": TEMPLATE_PATH.read_bytes()}).getvalue())
+
+            call_command("convert_batch", "sepa", str(input_path), str(output_path), stderr=StringIO())
+
+            self.assertEqual(["march.xml"], zipfile.ZipFile(output_path).namelist())
+
+            input_path.write_bytes(make_archive({"march.xlsx": b"broken"}).getvalue())
+
+            with self.assertRaisesMessage(CommandError, "1 of 1 files could not be converted"):
+                call_command("convert_batch", "sepa", str(input_path), str(output_path), stderr=StringIO())
+
+
+class TestConvertCommand(SimpleTestCase):
+    def setUp(self):
+        settings = self.settings(CONVERSION_PROCESSES=1)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def test_file(self):
+        output_path, stdout = self.directory / "march.xml", StringIO()
+
+        call_command("convert", "sepa", str(TEMPLATE_PATH), "-o", str(output_path), stdout=stdout)
+
+        self.assertIn(b"<NbOfTxs>3</NbOfTxs><CtrlSum>369.57</CtrlSum>", output_path.read_bytes())
+        self.assertEqual(
+            {"source": TEMPLATE_PATH.name, "target": "sepa-xml-template.xml"},
+            {key: value for key, value in json.loads(stdout.getvalue()).items() if key != "seconds"},
+        )
+
+        with self.assertRaises(CommandError) as context:
+            call_command("convert", "sepa", str(self.directory / "missing.xlsx"))
+
+        self.assertEqual(convert.EXIT_USAGE, context.exception.returncode)
+
+    def test_stdin(self):
+        stdin = mock.Mock(buffer=BytesIO(make_workbook(*PERSONIO_ROWS).getvalue()))
+        stdout = mock.Mock(buffer=BytesIO())
+        stderr = StringIO()
+
+        with mock.patch.object(convert.sys, "stdin", stdin), mock.patch.object(convert.sys, "stdout", stdout):
+            call_command(
+                "convert",
+                "datev",
+                "--name",
+                "personio.xlsx",
+                "--consultant-number",
+                "1234",
+                "--client-number",
+                "5678",
+                stderr=stderr,
+            )
+
+        self.assertIn(b";1234;5678;", stdout.buffer.getvalue())
+        self.assertEqual("personio/EXTF_Personio-2023-06.csv", json.loads(stderr.getvalue())["target"])
+
+    def test_failure(self):
+        stdin, stderr = mock.Mock(buffer=BytesIO(b"PK\x03\x04broken")), StringIO()
+
+        with mock.patch.object(convert.sys, "stdin", stdin), self.assertRaises(SystemExit) as context:
+            call_command("convert", "sepa", "-o", str(self.directory / "broken.xml"), stdout=stderr)
+
+        self.assertEqual(convert.EXIT_FAILED, context.exception.code)
+        self.assertIn("error", json.loads(stderr.getvalue()))
+
+    def test_watch(self):
+        watched, output = self.directory / "inbox", self.directory / "outbox"
+        watched.mkdir()
+        (watched / "march.xlsx").write_bytes(TEMPLATE_PATH.read_bytes())
+        (watched / "broken.xlsx").write_bytes(b"PK\x03\x04broken")
+        (watched / "~$march.xlsx").write_bytes(b"lock")
+        stdout = StringIO()
+
+        with self.assertRaises(SystemExit) as context:
+            call_command("convert", "sepa", str(watched), "-o", str(output), "--watch", "--once", stdout=stdout)
+
+        self.assertEqual(convert.EXIT_FAILED, context.exception.code)
+
+        *files, summary = map(json.loads, stdout.getvalue().splitlines())
+
+        self.assertEqual(["broken.xlsx", "march.xlsx"], sorted(result["source"] for result in files))
+        self.assertEqual({"converted": 1, "failed": 1}, {key: summary[key] for key in ("converted", "failed")})
+        self.assertEqual(["march.xml"], [path.name for path in output.iterdir()])
+        self.assertEqual(["march.xlsx"], [path.name for path in (watched / "done").iterdir()])
+        self.assertEqual(
+            ["broken.xlsx", "broken.xlsx.error.txt"],
+            sorted(path.name for path in (watched / "failed").iterdir()),
+        )
+        self.assertTrue((watched / "~$march.xlsx").exists())
+
+        with self.assertRaises(CommandError) as context:
+            call_command("convert", "sepa", str(watched), "--watch")
+
+        self.assertEqual(convert.EXIT_USAGE, context.exception.returncode)
+
+
+class TestCleanUpCommand(SimpleTestCase):
+    def test_clean_up(self):
+        with (
+            mock.patch("sepacetamol.jobs.fail_orphaned_jobs") as fail_orphaned_jobs,
+            mock.patch("sepacetamol.metrics.clear_snapshots") as clear_snapshots,
+        ):
+            call_command("clean_up")
+
+        fail_orphaned_jobs.assert_called_once_with()
+        clear_snapshots.assert_called_once_with()
@@ -0,0 +1,431 @@
+import atexit
+import fcntl
+import json
+import os
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from typing import TypeVar
+from uuid import uuid4
+
+from django.conf import settings
+
+from . import cache
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+ROW_BUCKETS = (10, 100, 1_000, 10_000, 100_000, 1_000_000)
+SIZE_BUCKETS = (1_024, 10_240, 102_400, 1_048_576, 10_485_760, 104_857_600)
+
+T = TypeVar("T")
+
+
+class RequestMetrics:
+    __slots__ = ("stages", "rows")
+
+    def __init__(self):
+        self.stages: dict[str, float] = defaultdict(float)
+        self.rows = 0
+
+
+# Set by `config.middleware.MetricsMiddleware` for the duration of a request, stages outside of requests are not timed
+current_request: ContextVar[RequestMetrics | None] = ContextVar("current_request", default=None)
+
+
+def add_stage_time(name: str, seconds: float):
+    if (metrics := current_request.get()) is not None:
+        metrics.stages[name] += seconds
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_stage_time(name, time.perf_counter() - started)
+
+
+def timed(name: str, iterable: Iterable[T]) -> Iterator[T]:
+    """
+    Pass items through, accounting to the stage only the time spent producing them, not the time the consumer spends
+    on each of them.
+    """
+    iterator = iter(iterable)
+    seconds = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                seconds += time.perf_counter() - started
+            yield item
+    finally:
+        add_stage_time(name, seconds)
+
+
+def add_rows(rows: int):
+    if (metrics := current_request.get()) is not None:
+        metrics.rows += rows
+
+
+def format_labels(labelnames: tuple[str, ...], labels: tuple[str, ...], **extra: str) -> str:
+    pairs = [*zip(labelnames, labels), *extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...], buckets: tuple[float, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.lock = Lock()
+        # Non-cumulative counts per bucket, with a trailing +Inf bucket
+        self.counts: dict[tuple[str, ...], list[int]] = {}
+        self.sums: dict[tuple[str, ...], float] = defaultdict(float)
+
+    def observe(self, labels: tuple[str, ...], value: float):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            if (counts := self.counts.get(labels)) is None:
+                counts = self.counts[labels] = [0] * (len(self.buckets) + 1)
+            counts[index] += 1
+            self.sums[labels] += value
+
+    def dump(self) -> list:
+        with self.lock:
+            return [[list(labels), list(counts), self.sums[labels]] for labels, counts in self.counts.items()]
+
+    @staticmethod
+    def merge(dumps: Iterable[list]) -> list:
+        values: dict[tuple[str, ...], tuple[list[int], float]] = {}
+        for dump in dumps:
+            for labels, counts, total in dump:
+                merged_counts, merged_total = values.get(tuple(labels), ([0] * len(counts), 0.0))
+                values[tuple(labels)] = (list(map(sum, zip(merged_counts, counts))), merged_total + total)
+
+        return [[list(labels), counts, total] for labels, (counts, total) in sorted(values.items())]
+
+    def expose(self, dumps: Iterable[list] = ()) -> Iterator[str]:
+        """
+        Expose the values of this process, added up with those of the other processes given as dumps.
+        """
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+
+        for labels, counts, total in self.merge((self.dump(), *dumps)):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                yield f"{self.name}_bucket{format_labels(self.labelnames, labels, le=str(bound))} {cumulative}"
+            yield f"{self.name}_sum{format_labels(self.labelnames, labels)} {total}"
+            yield f"{self.name}_count{format_labels(self.labelnames, labels)} {cumulative}"
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.lock = Lock()
+        self.values: dict[tuple[str, ...], float] = defaultdict(float)
+
+    def inc(self, labels: tuple[str, ...], value: float = 1):
+        with self.lock:
+            self.values[labels] += value
+
+    def set(self, labels: tuple[str, ...], value: float):
+        # For values counted elsewhere, like by a cache
+        with self.lock:
+            self.values[labels] = value
+
+    def dump(self) -> list:
+        with self.lock:
+            return [[list(labels), value] for labels, value in self.values.items()]
+
+    @staticmethod
+    def merge(dumps: Iterable[list]) -> list:
+        values: dict[tuple[str, ...], float] = defaultdict(float)
+        for dump in dumps:
+            for labels, value in dump:
+                values[tuple(labels)] += value
+
+        return [[list(labels), value] for labels, value in sorted(values.items())]
+
+    def expose(self, dumps: Iterable[list] = ()) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+
+        for labels, value in self.merge((self.dump(), *dumps)):
+            yield f"{self.name}{format_labels(self.labelnames, labels)} {value}"
+
+
+class Gauge(Counter):
+    """
+    A value of each process at the time of its snapshot, added up over the running processes only.
+    """
+
+    type = "gauge"
+
+
+REQUEST_DURATION = Histogram(
+    "sepacetamol_request_duration_seconds",
+    "Time to produce the response, excluding streaming of the body.",
+    ("endpoint", "method", "status"),
+    DURATION_BUCKETS,
+)
+STAGE_DURATION = Histogram(
+    "sepacetamol_stage_duration_seconds",
+    "Time spent in each conversion stage per request.",
+    ("endpoint", "stage"),
+    DURATION_BUCKETS,
+)
+REQUEST_ROWS = Histogram(
+    "sepacetamol_request_rows",
+    "Rows processed per request.",
+    ("endpoint",),
+    ROW_BUCKETS,
+)
+UPLOAD_SIZE = Histogram(
+    "sepacetamol_upload_size_bytes",
+    "Size of request bodies.",
+    ("endpoint",),
+    SIZE_BUCKETS,
+)
+ROWS = Counter(
+    "sepacetamol_rows_total",
+    "Rows processed.",
+    ("endpoint",),
+)
+
+IBAN_CACHE_REQUESTS = Counter(
+    "sepacetamol_iban_cache_requests_total",
+    "IBAN lookups, by whether they were answered from the cache.",
+    ("result",),
+)
+IBAN_CACHE_SIZE = Gauge(
+    "sepacetamol_iban_cache_size",
+    "IBANs in the cache.",
+    (),
+)
+
+METRICS = (REQUEST_DURATION, STAGE_DURATION, REQUEST_ROWS, UPLOAD_SIZE, ROWS, IBAN_CACHE_REQUESTS, IBAN_CACHE_SIZE)
+
+
+def collect():
+    """
+    Update the metrics counted elsewhere, before they are saved or exposed.
+    """
+    from . import iban
+
+    info = iban.cache_info()
+    IBAN_CACHE_REQUESTS.set(("hit",), info.hits)
+    IBAN_CACHE_REQUESTS.set(("miss",), info.misses)
+    IBAN_CACHE_SIZE.set((), info.currsize)
+
+
+def record_request(
+    endpoint: str,
+    method: str,
+    status: int,
+    seconds: float,
+    upload_size: int,
+    metrics: RequestMetrics,
+):
+    REQUEST_DURATION.observe((endpoint, method, str(status)), seconds)
+
+    for name, stage_seconds in metrics.stages.items():
+        STAGE_DURATION.observe((endpoint, name), stage_seconds)
+
+    if metrics.rows:
+        REQUEST_ROWS.observe((endpoint,), metrics.rows)
+        ROWS.inc((endpoint,), metrics.rows)
+
+    if upload_size:
+        UPLOAD_SIZE.observe((endpoint,), upload_size)
+
+    save_snapshot_periodically()
+
+
+# Seconds between two snapshots of a process, requests in between are only counted in memory
+SNAPSHOT_INTERVAL = 5.0
+
+# Snapshot files of other processes, named after their pid for `load_snapshots` to tell the finished ones
+SNAPSHOT_PATTERN = "*-*.json"
+
+# Added up snapshots of finished processes, so that their counts are not lost when they are recycled
+RETIRED_SNAPSHOT = "retired.json"
+
+# Names the snapshot file of this process, with a random id as well since the pids of finished workers are reused
+process_id: tuple[int, str] | None = None
+
+saved_at: float | None = None
+saving = Lock()
+
+
+def get_snapshot_path() -> Path:
+    global process_id
+
+    # Workers forked from a preloading master get an id of their own
+    if process_id is None or process_id[0] != os.getpid():
+        process_id = os.getpid(), uuid4().hex
+
+    return settings.METRICS_DIR / f"{process_id[0]}-{process_id[1]}.json"
+
+
+def read_snapshot(path: Path) -> dict[str, list] | None:
+    try:
+        return json.loads(path.read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def write_snapshot(path: Path, snapshot: dict[str, list]):
+    """
+    Write to a file of its own first and replace the snapshot at once, so that readers never see half of it.
+    """
+    with NamedTemporaryFile("w", dir=path.parent, prefix=".", suffix=".tmp", delete=False) as temporary:
+        json.dump(snapshot, temporary)
+    os.replace(temporary.name, path)
+
+
+def save_snapshot():
+    """
+    Save the metrics of this process for `expose` in the others.
+    """
+    collect()
+    path = get_snapshot_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    write_snapshot(path, {metric.name: metric.dump() for metric in METRICS})
+
+
+def save_snapshot_periodically():
+    """
+    Save the metrics of this process if the last snapshot is older than SNAPSHOT_INTERVAL, and once more when it
+    exits. Requests served meanwhile by other threads do not wait for the snapshot in progress.
+    """
+    global saved_at
+
+    if saved_at is not None and time.monotonic() - saved_at < SNAPSHOT_INTERVAL:
+        return
+
+    if not saving.acquire(blocking=False):
+        return
+
+    try:
+        if saved_at is None:
+            atexit.register(save_snapshot)
+        saved_at = time.monotonic()
+        save_snapshot()
+    finally:
+        saving.release()
+
+
+def is_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def merge_snapshots(snapshots: Iterable[dict[str, list]]) -> dict[str, list]:
+    # Gauges of finished processes no longer hold
+    snapshots = list(snapshots)
+    return {
+        metric.name: metric.merge(snapshot[metric.name] for snapshot in snapshots if metric.name in snapshot)
+        for metric in METRICS
+        if not isinstance(metric, Gauge)
+    }
+
+
+def load_snapshots() -> list[dict[str, list]]:
+    """
+    Read the snapshots of the other processes, folding those of finished ones into the retired snapshot so that the
+    directory does not grow with every recycled worker.
+    """
+    own = get_snapshot_path()
+    directory = settings.METRICS_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+
+    # Processes scraped at the same time would otherwise both retire the same snapshots
+    with open(directory / ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        snapshots, finished = [], []
+        for path in directory.glob(SNAPSHOT_PATTERN):
+            if path == own:
+                continue
+            if is_running(int(path.name.partition("-")[0])):
+                if (snapshot := read_snapshot(path)) is not None:
+                    snapshots.append(snapshot)
+            else:
+                finished.append(path)
+
+        retired = read_snapshot(directory / RETIRED_SNAPSHOT)
+
+        if finished:
+            retired = merge_snapshots(
+                snapshot for snapshot in (retired, *map(read_snapshot, finished)) if snapshot is not None
+            )
+            write_snapshot(directory / RETIRED_SNAPSHOT, retired)
+            for path in finished:
+                path.unlink(missing_ok=True)
+
+    return [*snapshots, retired] if retired is not None else snapshots
+
+
+def clear_snapshots():
+    """
+    Forget the metrics of a previous run of the server, as counters start from zero again when it restarts.
+    """
+    for path in settings.METRICS_DIR.glob("*.json"):
+        path.unlink(missing_ok=True)
+
+
+def get_server_timing(metrics: RequestMetrics, total: float) -> str:
+    return ", ".join(
+        f"{name};dur={seconds * 1000:.1f}" for name, seconds in (*metrics.stages.items(), ("total", total))
+    )
+
+
+def expose() -> str:
+    collect()
+    snapshots = load_snapshots()
+    lines = [
+        line
+        for metric in METRICS
+        for line in metric.expose(snapshot[metric.name] for snapshot in snapshots if metric.name in snapshot)
+    ]
+
+    if cache.is_enabled():
+        stats = cache.get_stats()
+        lines += [
+            "# HELP sepacetamol_result_cache_requests_total Result cache lookups, shared by all processes.",
+            "# TYPE sepacetamol_result_cache_requests_total counter",
+            *(
+                f'sepacetamol_result_cache_requests_total{{namespace="{namespace}",result="{result}"}} {value}'
+                for namespace, counters in sorted(stats["namespaces"].items())
+                for result, value in sorted(counters.items())
+            ),
+            "# HELP sepacetamol_result_cache_size_bytes Total size of the cached results.",
+            "# TYPE sepacetamol_result_cache_size_bytes gauge",
+            f"sepacetamol_result_cache_size_bytes {stats['size']}",
+        ]
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,74 @@
+import asyncio
+import os
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache, partial
+from io import BytesIO
+from multiprocessing import get_context
+from tempfile import NamedTemporaryFile
+from typing import IO, TypeVar
+
+import django
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+
+T = TypeVar("T")
+
+
+def initialize_process():
+    # Loads the IBAN registries as well, in `SepacetamolConfig.ready`
+    django.setup()
+
+
+@cache
+def get_process_pool() -> ProcessPoolExecutor:
+    # Spawned rather than forked, since forking a process that runs an event loop and threads is not safe; every
+    # child sets Django up once
+    return ProcessPoolExecutor(
+        max_workers=settings.CONVERSION_PROCESSES,
+        mp_context=get_context("spawn"),
+        initializer=initialize_process,
+        max_tasks_per_child=settings.CONVERSION_MAX_TASKS_PER_CHILD or None,
+    )
+
+
+async def run_in_process(fn: Callable[..., T], *args) -> T:
+    return await asyncio.get_running_loop().run_in_executor(get_process_pool(), partial(fn, *args))
+
+
+def share_upload(file: UploadedFile) -> str | bytes:
+    """
+    Make an upload available to another process: large uploads are already on disk and passed by path, small ones
+    are kept in memory by Django and passed by value.
+    """
+    if hasattr(file, "temporary_file_path"):
+        return file.temporary_file_path()
+
+    file.seek(0)
+    return file.read()
+
+
+def open_upload(source: str | bytes) -> IO[bytes]:
+    return open(source, "rb") if isinstance(source, str) else BytesIO(source)
+
+
+def write_result(write: Callable[[IO[bytes]], T]) -> tuple[T, str]:
+    """
+    Write the output of a conversion to a temporary file, which is handed back to the requesting process by name.
+    """
+    output = NamedTemporaryFile(delete=False)
+    try:
+        with output:
+            result = write(output)
+    except BaseException:
+        os.unlink(output.name)
+        raise
+
+    return result, output.name
+
+
+def open_result(path: str) -> IO[bytes]:
+    # Unlinked right away, the file is gone as soon as the response is closed
+    file = open(path, "rb")
+    os.unlink(path)
+    return file
@@ -0,0 +1,115 @@
+import cProfile
+import io
+import json
+import pstats
+import time
+import tracemalloc
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Lock
+from uuid import uuid4
+
+from django.conf import settings
+
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 20
+
+# cProfile and tracemalloc are process-wide, so only one request per process is profiled at a time
+lock = Lock()
+
+
+@dataclass
+class Profile:
+    id: str = field(default_factory=lambda: uuid4().hex)
+    profiler: cProfile.Profile = field(default_factory=cProfile.Profile)
+    summary: dict = field(default_factory=dict)
+
+
+@contextmanager
+def profile(description: str) -> Iterator[Profile | None]:
+    """
+    Capture a CPU profile and an allocation summary of the enclosed code and store them in the ring buffer. Yields
+    None without profiling when another profile is being captured in this process.
+    """
+    if not lock.acquire(blocking=False):
+        yield None
+        return
+
+    result = Profile()
+    started = time.perf_counter()
+    try:
+        tracemalloc.start()
+        result.profiler.enable()
+        try:
+            yield result
+        finally:
+            result.profiler.disable()
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        result.summary = {
+            "id": result.id,
+            "request": description,
+            "created_at": time.time(),
+            "duration": time.perf_counter() - started,
+            "peak_memory": peak,
+            "functions": format_functions(result.profiler),
+            "allocations": [str(statistic) for statistic in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]],
+        }
+        store(result)
+    finally:
+        lock.release()
+
+
+def format_functions(profiler: cProfile.Profile) -> str:
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+    return output.getvalue()
+
+
+def is_internal(request) -> bool:
+    return request.META.get("REMOTE_ADDR") in settings.INTERNAL_IPS
+
+
+def get_directory() -> Path:
+    directory = settings.PROFILING_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def store(result: Profile):
+    directory = get_directory()
+
+    result.profiler.dump_stats(directory / f"{result.id}.prof")
+    (directory / f"{result.id}.json").write_text(json.dumps(result.summary))
+
+    # Ring buffer shared by all processes, the oldest profiles are dropped
+    for summary_path in sorted(directory.glob("*.json"), key=lambda path: path.stat().st_mtime)[
+        : -settings.PROFILING_RING_SIZE
+    ]:
+        summary_path.unlink(missing_ok=True)
+        summary_path.with_suffix(".prof").unlink(missing_ok=True)
+
+
+def list_profiles() -> list[dict]:
+    summaries = []
+    for summary_path in get_directory().glob("*.json"):
+        try:
+            summary = json.loads(summary_path.read_text())
+        except FileNotFoundError:
+            continue
+        summaries.append({key: summary[key] for key in ("id", "request", "created_at", "duration", "peak_memory")})
+
+    return sorted(summaries, key=lambda summary: summary["created_at"], reverse=True)
+
+
+def get_profile_path(profile_id: str, suffix: str) -> Path | None:
+    # Ids are generated as hex, anything else could escape the directory
+    if not profile_id.isalnum():
+        return None
+
+    path = get_directory() / f"{profile_id}{suffix}"
+    return path if path.exists() else None
@@ -0,0 +1,285 @@
+import codecs
+import csv
+import io
+import re
+import zipfile
+import zlib
+from collections.abc import Callable, Iterator
+from datetime import datetime
+from typing import IO
+from xml.etree.ElementTree import iterparse
+
+from django.conf import settings
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+
+from .metrics import stage, timed
+
+XLSX = "xlsx"
+ODS = "ods"
+CSV = "csv"
+
+ZIP_SIGNATURE = b"PK\x03\x04"
+# Compound file signature of legacy .xls workbooks
+CFB_SIGNATURE = b"\xd0\xcf\x11\xe0"
+
+ODS_MIMETYPE = b"application/vnd.oasis.opendocument.spreadsheet"
+ODS_TABLE = "{urn:oasis:names:tc:opendocument:xmlns:table:1.0}"
+ODS_OFFICE = "{urn:oasis:names:tc:opendocument:xmlns:office:1.0}"
+ODS_TEXT_P = "{urn:oasis:names:tc:opendocument:xmlns:text:1.0}p"
+ODS_CELLS = (f"{ODS_TABLE}table-cell", f"{ODS_TABLE}covered-table-cell")
+
+CSV_DELIMITERS = ";,\t"
+CSV_SAMPLE_SIZE = 64 * 1024
+
+# German notation, e.g. -1.234,56 or 42, without leading zeros, which are kept as text like account numbers
+GERMAN_NUMBER = re.compile(r"[+-]?(?:0|[1-9]\d{0,2}(?:\.\d{3})+|[1-9]\d*)(?:,\d+)?")
+
+
+class BudgetExceeded(ValueError):
+    pass
+
+
+def check_workbook_size(file: IO[bytes]):
+    """
+    Reject workbooks that would inflate beyond the byte budget, from the sizes declared in the ZIP central directory
+    and without decompressing anything.
+    """
+    position = file.tell()
+    with zipfile.ZipFile(file) as archive:
+        size = sum(info.file_size for info in archive.infolist())
+    file.seek(position)
+
+    if size > settings.UPLOAD_MAX_SHEET_SIZE:
+        raise BudgetExceeded(
+            f"The workbook unpacks to {size} bytes, at most {settings.UPLOAD_MAX_SHEET_SIZE} bytes are accepted",
+        )
+
+
+def check_row_count(rows: int):
+    if rows > settings.UPLOAD_MAX_ROWS:
+        raise BudgetExceeded(f"The sheet has more than {settings.UPLOAD_MAX_ROWS} rows")
+
+
+def iter_budgeted(rows: Iterator[tuple]) -> Iterator[tuple]:
+    # Dimensions can be missing or wrong, the budget is enforced on the rows actually read as well
+    max_rows = settings.UPLOAD_MAX_ROWS
+    for row_number, row in enumerate(rows, start=1):
+        if row_number > max_rows:
+            check_row_count(row_number)
+        yield row
+
+
+def detect_format(file: IO[bytes]) -> str:
+    """
+    Tell XLSX, ODS and CSV uploads apart by their contents, as file names and content types are up to the client.
+    """
+    position = file.tell()
+    signature = file.read(len(ZIP_SIGNATURE))
+    file.seek(position)
+
+    if signature.startswith(CFB_SIGNATURE):
+        raise ValueError("Legacy .xls workbooks are not supported, please save the file as .xlsx")
+
+    if signature != ZIP_SIGNATURE:
+        return CSV
+
+    with zipfile.ZipFile(file) as archive:
+        mimetype = archive.read("mimetype") if "mimetype" in archive.namelist() else None
+    file.seek(position)
+
+    return ODS if mimetype == ODS_MIMETYPE else XLSX
+
+
+def iter_xlsx_rows(file: IO[bytes]) -> Iterator[tuple]:
+    """
+    Stream the cell values of the active worksheet row by row in a single forward pass.
+
+    The workbook is opened in read-only mode, so rows are parsed lazily from the underlying XML and no cell graph is
+    kept in memory, regardless of the size of the sheet. Workbooks beyond the byte and row budgets are rejected with
+    `BudgetExceeded`, as far as possible before any row is parsed.
+    """
+    with stage("load"):
+        check_workbook_size(file)
+        workbook = load_workbook(file, read_only=True)
+    try:
+        worksheet = workbook.active
+
+        # Sheets written without a <dimension> element would yield ragged rows; size them with an extra streaming
+        # pass, so that short rows are padded with None just like in full mode
+        if worksheet.max_column is None:
+            with stage("load"):
+                worksheet.calculate_dimension(force=True)
+
+        # Declared in the sheet header, read without parsing any row
+        check_row_count(worksheet.max_row or 0)
+
+        yield from timed("load", iter_budgeted(worksheet.iter_rows(values_only=True)))
+    finally:
+        workbook.close()
+
+
+def get_ods_value(cell) -> object:
+    match cell.get(f"{ODS_OFFICE}value-type"):
+        case "float" | "percentage" | "currency":
+            value = cell.get(f"{ODS_OFFICE}value")
+            # Integral numbers come out as int, just like from openpyxl
+            return float(value) if any(c in value for c in ".eE") else int(value)
+        case "date":
+            return datetime.fromisoformat(cell.get(f"{ODS_OFFICE}date-value"))
+        case "boolean":
+            return cell.get(f"{ODS_OFFICE}boolean-value") == "true"
+        case _:
+            return "\n".join("".join(p.itertext()) for p in cell.iter(ODS_TEXT_P)) or None
+
+
+def iter_ods_table_rows(file: IO[bytes]) -> Iterator[list]:
+    """
+    Stream the rows of the first table of an ODS workbook, without trailing empty cells. Repeated empty rows and
+    cells, which pad tables to the full size of the sheet, are only expanded when followed by a value.
+    """
+    with zipfile.ZipFile(file) as archive, archive.open("content.xml") as content:
+        parents = []
+        row = []
+        empty_cells = 0
+        empty_rows = 0
+
+        for event, element in iterparse(content, events=("start", "end")):
+            if event == "start":
+                parents.append(element)
+                continue
+
+            parents.pop()
+
+            if element.tag in ODS_CELLS:
+                repeat = int(element.get(f"{ODS_TABLE}number-columns-repeated", 1))
+                if (value := get_ods_value(element)) is None:
+                    empty_cells += repeat
+                else:
+                    row.extend([None] * empty_cells)
+                    row.extend([value] * repeat)
+                    empty_cells = 0
+                element.clear()
+            elif element.tag == f"{ODS_TABLE}table-row":
+                repeat = int(element.get(f"{ODS_TABLE}number-rows-repeated", 1))
+                if not row:
+                    empty_rows += repeat
+                else:
+                    for _ in range(empty_rows):
+                        yield []
+                    for _ in range(repeat):
+                        yield list(row)
+                    empty_rows = 0
+                row.clear()
+                empty_cells = 0
+                # Detached, so that the rows read do not pile up in the tree
+                parents[-1].remove(element)
+            elif element.tag == f"{ODS_TABLE}table":
+                return
+
+
+def iter_ods_rows(file: IO[bytes]) -> Iterator[tuple]:
+    """
+    Stream the cell values of the first sheet of an ODS workbook. Rows are padded with None to the width of the
+    widest one, like those read from XLSX, which takes an extra streaming pass.
+    """
+    with stage("load"):
+        check_workbook_size(file)
+
+        position = file.tell()
+        width = 0
+        for row_number, row in enumerate(iter_ods_table_rows(file), start=1):
+            check_row_count(row_number)
+            width = max(width, len(row))
+        file.seek(position)
+
+    rows = (tuple(row) + (None,) * (width - len(row)) for row in iter_ods_table_rows(file))
+    yield from timed("load", iter_budgeted(rows))
+
+
+def normalize_german_number(value: str) -> str | None:
+    """
+    Rewrite a number in German notation, e.g. -1.234,56, in the notation of Python, or None if it is not one. The
+    dot is only ever read as thousands separator, so 1.234 is 1234 wherever it comes from.
+    """
+    if GERMAN_NUMBER.fullmatch(value) is None:
+        return None
+
+    integer, _, fraction = value.replace(".", "").partition(",")
+    return f"{integer}.{fraction}" if fraction else integer
+
+
+def get_csv_value(value: str) -> object:
+    """
+    Convert a CSV field to what a spreadsheet cell would hold: numbers in German notation and text as is, empty
+    fields as None. Dates are left as text, as they are only parsed by the columns holding them, like the Personio
+    "Datum", and a purpose or name could read just like one.
+    """
+    if not value:
+        return None
+
+    # Most fields are text, which rarely starts like a number
+    if value[0].isdigit() or value[0] in "+-":
+        if (number := normalize_german_number(value)) is not None:
+            return float(number) if "." in number else int(number)
+
+    return value
+
+
+def get_csv_format(sample: bytes) -> tuple[str, str]:
+    """
+    Guess the encoding and the delimiter of a CSV file from its first bytes: UTF-8, with or without BOM, or Windows
+    code page 1252 as written by Excel otherwise, and whichever delimiter is the most frequent in the first line.
+
+    Sniffing whole lines is not reliable here, as German decimal commas make commas about as frequent as semicolons.
+    """
+    try:
+        text = codecs.getincrementaldecoder("utf-8-sig")().decode(sample)
+        encoding = "utf-8-sig"
+    except UnicodeDecodeError:
+        text = sample.decode("cp1252", errors="replace")
+        encoding = "cp1252"
+
+    first_line = next(iter(text.splitlines()), "")
+    delimiter = max(CSV_DELIMITERS, key=first_line.count)
+
+    return encoding, delimiter
+
+
+def iter_csv_rows(file: IO[bytes]) -> Iterator[tuple]:
+    """
+    Stream the records of a CSV file row by row, with their fields converted like `get_csv_value`.
+    """
+    position = file.tell()
+    encoding, delimiter = get_csv_format(file.read(CSV_SAMPLE_SIZE))
+    file.seek(position)
+
+    text = io.TextIOWrapper(file, encoding=encoding, newline="")
+    try:
+        rows = (tuple(map(get_csv_value, row)) for row in csv.reader(text, delimiter=delimiter))
+        yield from timed("load", iter_budgeted(rows))
+    finally:
+        # Leaves the upload open for its owner
+        text.detach()
+
+
+READERS: dict[str, Callable[[IO[bytes]], Iterator[tuple]]] = {
+    XLSX: iter_xlsx_rows,
+    ODS: iter_ods_rows,
+    CSV: iter_csv_rows,
+}
+
+
+def iter_rows(file: IO[bytes]) -> Iterator[tuple]:
+    """
+    Stream the rows of an upload, whichever of the formats in `READERS` it is in, as tuples of cell values. Uploads
+    that are truncated, corrupt or lack a sheet are rejected with a ValueError.
+    """
+    try:
+        with stage("load"):
+            reader = READERS[detect_format(file)]
+
+        yield from reader(file)
+    # KeyError for parts missing from the archive, SyntaxError for the XML parse errors of ElementTree and lxml alike
+    except (zipfile.BadZipFile, zlib.error, EOFError, KeyError, SyntaxError, InvalidFileException) as e:
+        raise ValueError("The file could not be read, it may be damaged or not a spreadsheet") from e
@@ -0,0 +1,43 @@
+import gc
+
+from django.urls import URLPattern, URLResolver, get_resolver
+
+
+def iter_patterns(resolver: URLResolver):
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_patterns(pattern)
+        elif isinstance(pattern, URLPattern):
+            yield pattern
+
+
+def warm_up():
+    """
+    Import every view and initialise what requests would otherwise set up on first use: the pydantic schemas of the
+    DATEV models and the pain.001 XML schema. The IBAN registries are loaded by `SepacetamolConfig.ready` already.
+
+    Meant for servers that preload the application before forking their workers, which then share all of it
+    copy-on-write. Must not start threads or processes, as these do not survive the fork.
+    """
+    from . import validation
+
+    for pattern in iter_patterns(get_resolver()):
+        if (load := getattr(pattern.callback, "load", None)) is not None:
+            load()
+
+    validation.get_schema()
+
+    # Moved out of the collector's reach, so that collections in the workers do not touch and copy their pages
+    gc.freeze()
+
+
+def clean_up():
+    """
+    Forget the state of a previous run of the server: the jobs queued on the process pools of its workers and their
+    metrics. Must run once before the workers start and never in a worker, as it would fail the jobs of the others.
+    Run by the `on_starting` hook of gunicorn or the `clean_up` command.
+    """
+    from . import jobs, metrics
+
+    jobs.fail_orphaned_jobs()
+    metrics.clear_snapshots()
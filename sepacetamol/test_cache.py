@@ -0,0 +1,119 @@
+from io import BytesIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from django.test import SimpleTestCase
+from django.urls import reverse
+
+from sepacetamol import cache
+from sepacetamol.views.test_sepa import TEMPLATE_PATH
+
+
+class TestCache(SimpleTestCase):
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        settings = self.settings(
+            RESULT_CACHE_DIR=Path(directory.name),
+            RESULT_CACHE_MAX_SIZE=10,
+            RESULT_CACHE_MAX_AGE=60,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def lookup(self, key: str) -> bytes | None:
+        if (result := cache.lookup(key)) is None:
+            return None
+        with result.file:
+            return result.file.read()
+
+    def test_store(self):
+        key = cache.get_cache_key("test", "digest", 1234)
+        contents = BytesIO(b"0123")
+
+        self.assertIsNone(self.lookup(key))
+
+        cache.store(key, contents, {"filename": "test.csv"})
+
+        self.assertEqual(0, contents.tell())
+        self.assertEqual(b"0123", self.lookup(key))
+        self.assertEqual({"filename": "test.csv"}, cache.lookup(key).meta)
+        self.assertNotEqual(key, cache.get_cache_key("test", "digest", 4321))
+
+        self.assertEqual(
+            {"entries": 1, "size": 4, "namespaces": {"test": {"hits": 2, "misses": 1}}},
+            cache.get_stats(),
+        )
+
+    def test_eviction(self):
+        first, second, third = (cache.get_cache_key("test", i) for i in range(3))
+
+        cache.store(first, BytesIO(b"0123"))
+        cache.store(second, BytesIO(b"4567"))
+        self.lookup(first)
+        cache.store(third, BytesIO(b"890"))
+
+        # Least recently used first
+        self.assertEqual((b"0123", None, b"890"), (self.lookup(first), self.lookup(second), self.lookup(third)))
+
+        with mock.patch("time.time", return_value=cache.time.time() + 61):
+            cache.store(second, BytesIO(b"4567"))
+
+            self.assertEqual((None, b"4567", None), (self.lookup(first), self.lookup(second), self.lookup(third)))
+
+    def test_version(self):
+        key = cache.get_cache_key("test", "digest")
+
+        with mock.patch.object(cache, "VERSION", cache.VERSION + 1):
+            self.assertNotEqual(key, cache.get_cache_key("test", "digest"))
+
+    def test_objects(self):
+        key = cache.get_cache_key("test", "object")
+
+        with self.settings(RESULT_CACHE_MAX_SIZE=1024):
+            cache.store_object(key, {"a": (1, 2)})
+            self.assertEqual({"a": (1, 2)}, cache.load_object(key))
+
+    def test_disabled(self):
+        key = cache.get_cache_key("test", "disabled")
+
+        with self.settings(RESULT_CACHE_MAX_SIZE=0):
+            cache.store(key, BytesIO(b"0123"))
+            self.assertIsNone(cache.lookup(key))
+            self.assertEqual({"entries": 0, "size": 0, "namespaces": {}}, cache.get_stats())
+
+    @mock.patch("sepacetamol.cache.hashlib.file_digest")
+    def test_disabled_views(self, file_digest):
+        with self.settings(
+            RESULT_CACHE_MAX_SIZE=0,
+            STORAGES={"staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}},
+        ):
+            with TEMPLATE_PATH.open("rb") as source_file:
+                response = self.client.post(reverse("index"), {"source-file": source_file}, secure=True)
+
+        self.assertEqual(3, response.context["draft"].count)
+        file_digest.assert_not_called()
+
+    def test_views(self):
+        with self.settings(
+            RESULT_CACHE_MAX_SIZE=1024 * 1024,
+            STORAGES={"staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}},
+        ):
+            for _ in range(2):
+                with TEMPLATE_PATH.open("rb") as source_file:
+                    response = self.client.post(reverse("index"), {"source-file": source_file}, secure=True)
+                    self.assertEqual(3, response.context["draft"].count)
+
+                response = self.client.post(
+                    reverse("generate"),
+                    {"draft": response.context["token"], "batch-booking": "false"},
+                    secure=True,
+                )
+                self.assertIn(b"<CtrlSum>369.57</CtrlSum>", b"".join(response.streaming_content))
+
+        self.assertEqual(
+            {"sepa-preview": {"hits": 1, "misses": 1}, "sepa-xml": {"hits": 1, "misses": 1}},
+            cache.get_stats()["namespaces"],
+        )
@@ -0,0 +1,129 @@
+from contextlib import closing
+from dataclasses import replace
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from sepaxml.validation import ValidationError
+
+from sepacetamol import history
+from sepacetamol.test_pain import PAYMENTS
+from sepacetamol.test_readers import make_workbook
+from sepacetamol.views.test_sepa import GENERATE_DRAFT, INVALID_SPLIT_DRAFT, TEMPLATE_PATH, get_generate_form
+
+
+class TestHistory(SimpleTestCase):
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        settings = self.settings(PAYMENT_HISTORY_DIR=Path(directory.name))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_digest(self):
+        payment, _ = PAYMENTS
+
+        self.assertEqual(history.get_payment_digest(payment), history.get_payment_digest(replace(payment, name="x")))
+
+        changes = {"iban": "DE02120300000000202051", "amount": 6, "endtoend_id": "", "description": ""}
+
+        for field, value in changes.items():
+            with self.subTest(field=field):
+                self.assertNotEqual(
+                    history.get_payment_digest(payment),
+                    history.get_payment_digest(replace(payment, **{field: value})),
+                )
+
+    def test_record(self):
+        digests = [history.get_payment_digest(payment) for payment in PAYMENTS]
+
+        self.assertEqual({}, history.find_exported(digests))
+
+        history.record_exported(digests[:1])
+
+        self.assertEqual([digests[0]], list(history.find_exported(digests)))
+
+        with self.subTest("batches"), mock.patch.object(history, "BATCH_SIZE", 1):
+            self.assertEqual([digests[0]], list(history.find_exported(digests)))
+
+        with self.subTest("expired"), self.settings(PAYMENT_HISTORY_RETENTION=-1):
+            self.assertEqual({}, history.find_exported(digests))
+
+            history.record_exported(digests[1:])
+
+            with closing(history.connect(settings.PAYMENT_HISTORY_DIR)) as connection:
+                self.assertEqual(
+                    [(digests[1],)],
+                    connection.execute("SELECT digest FROM payment").fetchall(),
+                )
+
+    @override_settings(
+        STORAGES={"staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}},
+    )
+    def test_preview(self):
+        with TEMPLATE_PATH.open("rb") as source_file:
+            response = self.client.post(reverse("index"), {"source-file": source_file}, secure=True)
+
+        self.assertEqual(0, response.context["draft"].duplicates)
+        self.assertNotContains(response, "exported before")
+
+        self.client.post(
+            reverse("generate"),
+            {"draft": response.context["token"], "batch-booking": "false"},
+            secure=True,
+        )
+
+        with TEMPLATE_PATH.open("rb") as source_file:
+            response = self.client.post(reverse("index"), {"source-file": source_file}, secure=True)
+
+        self.assertContains(response, "3 of these transactions were exported")
+        self.assertEqual(3, response.context["draft"].duplicates)
+        self.assertTrue(all(exported_at is not None for *_, exported_at in response.context["rows"]))
+        self.assertContains(response, 'class="table-warning"', count=3)
+
+    @override_settings(
+        STORAGES={"staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}},
+    )
+    def test_preview_repeated_payment(self):
+        payment = ("CANCOM1 GmbH", "DE17720400460112921200", 123, "Auftrag 1", "Kdn. 1234567")
+        rows = (
+            ("Name", "IBAN"),
+            ("honeymeets continuity GmbH", "DE02120300000000202051"),
+            ("Name", "IBAN", "Amount", "Purpose", "Reference"),
+            payment,
+            payment,
+        )
+
+        def upload():
+            source_file = make_workbook(*rows)
+            source_file.name = "repeated.xlsx"
+            return self.client.post(reverse("index"), {"source-file": source_file}, secure=True)
+
+        self.client.post(
+            reverse("generate"),
+            {"draft": upload().context["token"], "batch-booking": "false"},
+            secure=True,
+        )
+
+        self.assertEqual(2, upload().context["draft"].duplicates)
+
+    @override_settings(SEPA_STREAM_VALIDATION=True)
+    def test_record_after_stream_validation(self):
+        for draft, recorded in ((INVALID_SPLIT_DRAFT, False), (GENERATE_DRAFT, True)):
+            with self.subTest(recorded=recorded):
+                response = self.client.post(reverse("generate"), get_generate_form(draft), secure=True)
+                digests = [history.get_payment_digest(payment) for payment in draft.payments]
+
+                self.assertEqual({}, history.find_exported(digests))
+
+                if recorded:
+                    b"".join(response.streaming_content)
+                else:
+                    with self.assertRaises(ValidationError):
+                        b"".join(response.streaming_content)
+
+                self.assertEqual(recorded, bool(history.find_exported(digests)))
@@ -0,0 +1,31 @@
+from unittest import TestCase
+
+from django.core.exceptions import SuspiciousOperation
+from schwifty import IBAN
+
+from sepacetamol.iban import ResolvedIBAN, cache_info, resolve_iban
+
+
+class TestIBAN(TestCase):
+    def test_resolve_iban(self):
+        self.assertEqual(
+            ResolvedIBAN(
+                compact="DE17720400460112921200",
+                formatted="DE17 7204 0046 0112 9212 00",
+                country_code="DE",
+                bic=IBAN("DE17720400460112921200").bic.compact,
+            ),
+            resolve_iban("DE17 7204 0046 0112 9212 00"),
+        )
+
+    def test_resolve_iban_cache(self):
+        resolve_iban("DE89 3704 0044 0532 0130 00")
+        hits = cache_info().hits
+
+        self.assertIs(resolve_iban("DE89 3704 0044 0532 0130 00"), resolve_iban(" de89370400440532013000"))
+        self.assertEqual(hits + 2, cache_info().hits)
+
+    def test_resolve_invalid_iban(self):
+        for iban in ("DE00 0000 0000 0000 0000 00", None):
+            with self.subTest(iban=iban), self.assertRaises(SuspiciousOperation):
+                resolve_iban(iban)
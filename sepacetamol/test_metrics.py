@@ -0,0 +1,182 @@
+import json
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from django.test import SimpleTestCase
+from django.urls import reverse
+
+from sepacetamol import metrics
+from sepacetamol.iban import cache_info, resolve_iban
+from sepacetamol.views.test_sepa import get_generate_form
+
+
+class TestMetrics(SimpleTestCase):
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        settings = self.settings(METRICS_DIR=Path(directory.name))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_histogram(self):
+        histogram = metrics.Histogram("test_seconds", "Test.", ("endpoint",), (0.1, 1))
+        for value in (0.05, 0.1, 0.5, 2):
+            histogram.observe(("a",), value)
+
+        self.assertEqual(
+            [
+                "# HELP test_seconds Test.",
+                "# TYPE test_seconds histogram",
+                'test_seconds_bucket{endpoint="a",le="0.1"} 2',
+                'test_seconds_bucket{endpoint="a",le="1"} 3',
+                'test_seconds_bucket{endpoint="a",le="+Inf"} 4',
+                'test_seconds_sum{endpoint="a"} 2.65',
+                'test_seconds_count{endpoint="a"} 4',
+            ],
+            list(histogram.expose()),
+        )
+
+    def test_stages(self):
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.current_request.set(request_metrics)
+        try:
+            with metrics.stage("export"):
+                pass
+            self.assertEqual([1, 2], list(metrics.timed("load", [1, 2])))
+            metrics.add_rows(2)
+        finally:
+            metrics.current_request.reset(token)
+
+        # Outside of a request
+        with metrics.stage("export"):
+            metrics.add_rows(1)
+
+        self.assertEqual(["export", "load"], list(request_metrics.stages))
+        self.assertEqual(2, request_metrics.rows)
+        self.assertRegex(
+            metrics.get_server_timing(request_metrics, 0.0125),
+            r"^export;dur=\d+\.\d, load;dur=\d+\.\d, total;dur=12\.5$",
+        )
+
+    def test_views(self):
+        response = self.client.post(reverse("generate"), get_generate_form(), secure=True)
+
+        self.assertRegex(
+            response["Server-Timing"],
+            r"^iban;dur=[\d.]+, export;dur=[\d.]+, history;dur=[\d.]+, total;dur=[\d.]+$",
+        )
+
+        response = self.client.get(reverse("metrics"))
+
+        self.assertEqual(200, response.status_code)
+
+        exposition = response.content.decode()
+
+        self.assertIn(
+            'sepacetamol_request_duration_seconds_count{endpoint="generate",method="POST",status="200"}',
+            exposition,
+        )
+        self.assertRegex(exposition, r'sepacetamol_rows_total\{endpoint="generate"\} \d+')
+        self.assertRegex(
+            exposition,
+            r'sepacetamol_stage_duration_seconds_count\{endpoint="generate",stage="iban"\} \d+',
+        )
+
+    def test_snapshots(self):
+        histogram = metrics.Histogram("test_seconds", "Test.", ("endpoint",), (0.1, 1))
+        counter = metrics.Counter("test_total", "Test.", ("endpoint",))
+        histogram.observe(("a",), 0.05)
+        counter.inc(("a",), 2)
+
+        # As saved by another worker
+        other = json.loads(json.dumps({"histogram": histogram.dump(), "counter": counter.dump()}))
+        histogram.observe(("b",), 2)
+
+        self.assertEqual(
+            [
+                'test_seconds_bucket{endpoint="a",le="0.1"} 2',
+                'test_seconds_bucket{endpoint="a",le="1"} 2',
+                'test_seconds_bucket{endpoint="a",le="+Inf"} 2',
+                'test_seconds_sum{endpoint="a"} 0.1',
+                'test_seconds_count{endpoint="a"} 2',
+                'test_seconds_bucket{endpoint="b",le="0.1"} 0',
+                'test_seconds_bucket{endpoint="b",le="1"} 0',
+                'test_seconds_bucket{endpoint="b",le="+Inf"} 1',
+                'test_seconds_sum{endpoint="b"} 2.0',
+                'test_seconds_count{endpoint="b"} 1',
+            ],
+            list(histogram.expose([other["histogram"]]))[2:],
+        )
+        self.assertEqual(['test_total{endpoint="a"} 4.0'], list(counter.expose([other["counter"]]))[2:])
+
+    def test_shared(self):
+        metrics.save_snapshot()
+
+        path = metrics.get_snapshot_path()
+        other = json.loads(path.read_text())
+        other[metrics.ROWS.name] = [[["generate"], 1_000_000]]
+
+        # Another worker, a worker that finished with the requests it served and a snapshot that cannot be read
+        finished = subprocess.Popen([sys.executable, "-c", ""])
+        finished.wait()
+        finished_pid = finished.pid
+        path.with_name(f"{os.getpid()}-other.json").write_text(json.dumps(other))
+        path.with_name(f"{finished_pid}-finished.json").write_text(json.dumps(other))
+        path.with_name(f"{os.getpid()}-broken.json").write_text("{")
+
+        for _ in range(2):
+            exposition = self.client.get(reverse("metrics")).content.decode()
+
+            self.assertRegex(exposition, r'sepacetamol_rows_total\{endpoint="generate"\} 2\d{6}\.0')
+            self.assertFalse(path.with_name(f"{finished_pid}-finished.json").exists())
+            self.assertTrue(path.with_name(metrics.RETIRED_SNAPSHOT).exists())
+
+        metrics.clear_snapshots()
+
+        self.assertEqual([], list(path.parent.glob("*.json")))
+
+    def test_periodic(self):
+        with mock.patch.object(metrics, "save_snapshot") as save_snapshot, mock.patch.object(metrics, "saved_at", None):
+            for _ in range(3):
+                metrics.record_request("health", "GET", 200, 0.001, 0, metrics.RequestMetrics())
+
+        save_snapshot.assert_called_once_with()
+
+    def test_concurrent(self):
+        with ThreadPoolExecutor(4) as executor:
+            list(executor.map(lambda _: metrics.save_snapshot(), range(200)))
+
+        self.assertEqual([metrics.get_snapshot_path()], list(metrics.get_snapshot_path().parent.iterdir()))
+
+    def test_iban_cache(self):
+        resolve_iban("DE02 1203 0000 0000 2020 51")
+        info = cache_info()
+
+        exposition = self.client.get(reverse("metrics")).content.decode()
+
+        self.assertIn(f'sepacetamol_iban_cache_requests_total{{result="hit"}} {float(info.hits)}', exposition)
+        self.assertIn(f'sepacetamol_iban_cache_requests_total{{result="miss"}} {float(info.misses)}', exposition)
+        self.assertIn(f"sepacetamol_iban_cache_size {float(info.currsize)}", exposition)
+        self.assertNotIn(metrics.IBAN_CACHE_SIZE.name, metrics.merge_snapshots([{}]))
+
+    def test_access(self):
+        self.assertEqual(200, self.client.get(reverse("metrics"), REMOTE_ADDR="127.0.0.1").status_code)
+        self.assertEqual(404, self.client.get(reverse("metrics"), REMOTE_ADDR="192.0.2.1").status_code)
+
+        with self.settings(METRICS_TOKEN="secret"):
+            for authorization, status_code in (("Bearer secret", 200), ("Bearer other", 404), ("secret", 404)):
+                with self.subTest(authorization=authorization):
+                    self.assertEqual(
+                        status_code,
+                        self.client.get(
+                            reverse("metrics"),
+                            REMOTE_ADDR="192.0.2.1",
+                            HTTP_AUTHORIZATION=authorization,
+                        ).status_code,
+                    )
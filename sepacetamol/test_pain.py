@@ -0,0 +1,179 @@
+import datetime
+import pickle
+import re
+from collections.abc import Sequence
+from dataclasses import replace
+from itertools import product
+from unittest import TestCase
+
+from sepaxml import SepaTransfer
+
+from sepacetamol.pain import BatchBooking, CreditTransferWriter, Payment, PaymentStore, split_payments, to_cents
+from sepacetamol.validation import validate
+
+ORIGINATOR = {"name": "Zäh & Söhne GmbH", "IBAN": "DE89370400440532013000", "BIC": "COBADEFFXXX", "currency": "EUR"}
+
+PAYMENTS = (
+    Payment(
+        name="Müller <Bau>",
+        iban="DE17720400460112921200",
+        bic="COBADEFF720",
+        amount=5,
+        description="Auftrag 12345678-9, 12.03.2020, v1/2345",
+        endtoend_id="Kdn. 1234567",
+    ),
+    Payment(
+        name="CANCOM2 GmbH",
+        iban="DE02120300000000202051",
+        bic="BYLADEM1001",
+        amount=1234567,
+        description="Rechnung €",
+        endtoend_id="NOTPROVIDED",
+    ),
+)
+
+EXECUTION_DATE = datetime.date(2024, 1, 31)
+
+
+def export_with_sepaxml(batch_booking: BatchBooking, payments: Sequence[Payment] = PAYMENTS) -> bytes:
+    sepa = SepaTransfer({**ORIGINATOR, "batch": batch_booking != BatchBooking.SINGLE}, clean=True)
+
+    for payment in payments:
+        sepa.add_payment(
+            {
+                "name": payment.name,
+                "IBAN": payment.iban,
+                **({"BIC": payment.bic} if payment.bic else {}),
+                "amount": payment.amount,
+                "description": payment.description,
+                "execution_date": EXECUTION_DATE,
+                "endtoend_id": payment.endtoend_id,
+            },
+        )
+
+    contents = sepa.export(validate=True)
+
+    if batch_booking == BatchBooking.FALSE:
+        contents = contents.replace(b"<BtchBookg>true", b"<BtchBookg>false")
+
+    return contents
+
+
+class TestCreditTransferWriter(TestCase):
+    maxDiff = None
+
+    def test_matches_sepaxml_export(self):
+        # The second creditor has an IBAN of a country whose BICs are not known, and is paid by IBAN only
+        without_bic = (PAYMENTS[0], replace(PAYMENTS[1], iban="FR1420041010050500013M02606", bic=""))
+
+        for batch_booking, payments in product(BatchBooking, (PAYMENTS, without_bic)):
+            with self.subTest(batch_booking=batch_booking, bic=payments[1].bic):
+                expected = export_with_sepaxml(batch_booking, payments)
+
+                payment_information_ids = iter(re.findall(rb"<PmtInfId>(.*?)</PmtInfId>", expected))
+
+                writer = CreditTransferWriter(
+                    name=ORIGINATOR["name"],
+                    iban=ORIGINATOR["IBAN"],
+                    bic=ORIGINATOR["BIC"],
+                    batch_booking=batch_booking,
+                    execution_date=EXECUTION_DATE,
+                    msg_id=re.search(rb"<MsgId>(.*?)</MsgId>", expected).group(1).decode(),
+                    created_at=datetime.datetime.fromisoformat(
+                        re.search(rb"<CreDtTm>(.*?)</CreDtTm>", expected).group(1).decode(),
+                    ),
+                    make_payment_information_id=lambda name, ids=payment_information_ids: next(ids).decode(),
+                )
+
+                self.assertEqual(expected.decode(), b"".join(writer.iter_chunks(payments, chunk_size=1)).decode())
+
+    def test_to_cents(self):
+        self.assertEqual(
+            [12300, 12345, 1, 29, 3333, 100, 101, -101],
+            [to_cents(amount) for amount in (123, "123.45", 0.01, 0.29, 100 / 3, "1.001", "1.005", "-1.005")],
+        )
+
+        for amount in ("abc", "NaN", None):
+            with self.subTest(amount=amount), self.assertRaises(ValueError):
+                to_cents(amount)
+
+    def test_split_payments(self):
+        payments = [replace(PAYMENTS[0], amount=amount) for amount in (100, 200, 300, 400)]
+
+        def amounts(runs):
+            return [[payment.amount for payment in run] for run in runs]
+
+        self.assertEqual([payments], split_payments(payments))
+        self.assertEqual([[]], amounts(split_payments([], max_transactions=2)))
+        self.assertEqual([[100, 200], [300, 400]], amounts(split_payments(payments, max_transactions=2)))
+        self.assertEqual([[100, 200], [300], [400]], amounts(split_payments(payments, max_amount=500)))
+        self.assertEqual([[100], [200], [300], [400]], amounts(split_payments(payments, 1, max_amount=1000)))
+
+        with self.assertRaisesRegex(ValueError, "4.00 EUR exceeds the limit of 3.00 EUR"):
+            split_payments(payments, max_amount=300)
+
+    def test_block_limits(self):
+        payments = [replace(PAYMENTS[0], amount=amount) for amount in (100, 200, 300, 400, 500)]
+
+        for batch_booking in (BatchBooking.TRUE, BatchBooking.FALSE):
+            with self.subTest(batch_booking=batch_booking):
+                writer = CreditTransferWriter(
+                    name=ORIGINATOR["name"],
+                    iban=ORIGINATOR["IBAN"],
+                    bic=ORIGINATOR["BIC"],
+                    batch_booking=batch_booking,
+                    execution_date=EXECUTION_DATE,
+                    max_block_transactions=2,
+                    max_block_amount=600,
+                )
+                contents = b"".join(writer.iter_chunks(payments))
+
+                validate((contents,))
+
+                self.assertEqual(
+                    [(b"5", b"15.00"), (b"2", b"3.00"), (b"1", b"3.00"), (b"1", b"4.00"), (b"1", b"5.00")],
+                    re.findall(rb"<NbOfTxs>(.*?)</NbOfTxs><CtrlSum>(.*?)</CtrlSum>", contents),
+                )
+                self.assertEqual(4, len(set(re.findall(rb"<PmtInfId>(.*?)</PmtInfId>", contents))))
+
+
+class TestPaymentStore(TestCase):
+    def test_store(self):
+        store = PaymentStore.from_payments(PAYMENTS * 3)
+
+        self.assertEqual(6, len(store))
+        self.assertEqual(3 * (5 + 1234567), store.total)
+        self.assertEqual(["DE17720400460112921200", "DE02120300000000202051"], store.ibans.values)
+        self.assertEqual(["COBADEFF720", "BYLADEM1001"], store.bics.values)
+        self.assertEqual(list(PAYMENTS * 3), [Payment(*row) for row in store.rows()])
+        self.assertEqual(PAYMENTS[1].name, store[-1].name)
+        self.assertEqual([PAYMENTS[1].amount] * 3, [payment.amount for payment in store[1::2]])
+        self.assertEqual(1234567, store[5:].total)
+        self.assertEqual(store, pickle.loads(pickle.dumps(store)))
+        self.assertNotEqual(store, store[1:])
+
+        with self.assertRaises(IndexError):
+            store[6]
+
+    def test_writer(self):
+        payments = [replace(PAYMENTS[index % 2], amount=amount) for index, amount in enumerate((100, 200, 300, 400))]
+
+        def export(payments):
+            writer = CreditTransferWriter(
+                name=ORIGINATOR["name"],
+                iban=ORIGINATOR["IBAN"],
+                bic=ORIGINATOR["BIC"],
+                batch_booking=BatchBooking.TRUE,
+                execution_date=EXECUTION_DATE,
+                msg_id="msg",
+                created_at=datetime.datetime(2024, 1, 1),
+                make_payment_information_id=lambda name: "pmtinf",
+                max_block_amount=500,
+            )
+            return b"".join(writer.iter_chunks(payments))
+
+        self.assertEqual(export(payments), export(PaymentStore.from_payments(payments)))
+        self.assertEqual(
+            [[100, 200], [300], [400]],
+            [list(run.amounts) for run in split_payments(PaymentStore.from_payments(payments), max_amount=500)],
+        )
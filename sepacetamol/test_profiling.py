@@ -0,0 +1,71 @@
+import pstats
+import tempfile
+from pathlib import Path
+
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from sepacetamol import profiling
+from sepacetamol.views.test_sepa import get_generate_form
+
+
+class TestProfiling(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def test_disabled(self):
+        response = self.client.post(reverse("generate"), get_generate_form(), secure=True, headers={"X-Profile": "1"})
+
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertEqual(404, self.client.get(reverse("profiles"), secure=True).status_code)
+
+    def test_profile(self):
+        with self.settings(PROFILING=True, PROFILING_DIR=self.directory, PROFILING_RING_SIZE=2):
+            # Neither asked for nor sampled
+            response = self.client.post(reverse("generate"), get_generate_form(), secure=True)
+            self.assertNotIn("X-Profile-Id", response)
+
+            profile_ids = [
+                self.client.post(reverse("generate"), get_generate_form(), secure=True, headers={"X-Profile": "1"})[
+                    "X-Profile-Id"
+                ]
+                for _ in range(3)
+            ]
+
+            response = self.client.get(reverse("profiles"), secure=True)
+            self.assertEqual(
+                profile_ids[:0:-1],
+                [summary["id"] for summary in response.json()["profiles"]],
+            )
+
+            response = self.client.get(reverse("profile", args=(profile_ids[-1],)), secure=True)
+            summary = b"".join(response.streaming_content)
+            self.assertIn(b"POST /generate/", summary)
+            self.assertIn(b"sepa.py:", summary)
+
+            response = self.client.get(reverse("profile-download", args=(profile_ids[-1],)), secure=True)
+            profile_path = self.directory / "downloaded.prof"
+            profile_path.write_bytes(b"".join(response.streaming_content))
+            self.assertTrue(pstats.Stats(str(profile_path)).total_calls)
+
+            self.assertEqual(404, self.client.get(reverse("profile", args=(profile_ids[0],)), secure=True).status_code)
+
+    def test_internal_ips_only(self):
+        with self.settings(PROFILING=True, PROFILING_DIR=self.directory, PROFILING_SAMPLE_RATE=1):
+            response = self.client.post(reverse("generate"), get_generate_form(), secure=True, REMOTE_ADDR="192.0.2.1")
+
+            self.assertNotIn("X-Profile-Id", response)
+            response = self.client.get(reverse("profiles"), secure=True, REMOTE_ADDR="192.0.2.1")
+            self.assertEqual(404, response.status_code)
+            self.assertEqual([], self.client.get(reverse("profiles"), secure=True).json()["profiles"])
+
+    @override_settings(PROFILING=True)
+    def test_one_profile_at_a_time(self):
+        with self.settings(PROFILING_DIR=self.directory), profiling.profile("outer") as outer:
+            with profiling.profile("inner") as inner:
+                pass
+
+        self.assertIsNotNone(outer)
+        self.assertIsNone(inner)
@@ -0,0 +1,161 @@
+import zipfile
+from datetime import datetime
+from io import BytesIO
+from unittest import TestCase
+
+from django.test import override_settings
+from openpyxl import Workbook
+
+from sepacetamol.readers import CSV, ODS, XLSX, BudgetExceeded, detect_format, iter_budgeted, iter_rows
+
+# A table as written by LibreOffice, with repeated cells and rows padding it to the full size of the sheet
+ODS_CONTENT = """<?xml version="1.0" encoding="UTF-8"?>
+<office:document-content xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0"
+    xmlns:table="urn:oasis:names:tc:opendocument:xmlns:table:1.0"
+    xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0">
+<office:body><office:spreadsheet>
+<table:table table:name="Sheet1">
+<table:table-column table:number-columns-repeated="1024"/>
+<table:table-row>
+<table:table-cell office:value-type="string"><text:p>a</text:p></table:table-cell>
+<table:table-cell office:value-type="float" office:value="1"/>
+<table:table-cell table:number-columns-repeated="1022"/>
+</table:table-row>
+<table:table-row table:number-rows-repeated="2"><table:table-cell table:number-columns-repeated="1024"/></table:table-row>
+<table:table-row>
+<table:table-cell office:value-type="string"><text:p>b</text:p><text:p>c</text:p></table:table-cell>
+<table:table-cell office:value-type="currency" office:value="2.5"/>
+<table:table-cell/>
+<table:table-cell office:value-type="date" office:date-value="2023-06-01"/>
+</table:table-row>
+<table:table-row table:number-rows-repeated="1048572"><table:table-cell table:number-columns-repeated="1024"/></table:table-row>
+</table:table>
+<table:table table:name="Sheet2"><table:table-row><table:table-cell office:value-type="string"><text:p>x</text:p>
+</table:table-cell></table:table-row></table:table>
+</office:spreadsheet></office:body>
+</office:document-content>"""
+
+
+def make_workbook(*rows: tuple, write_only: bool = False) -> BytesIO:
+    workbook = Workbook(write_only=write_only)
+    worksheet = workbook.create_sheet() if write_only else workbook.active
+    for row in rows:
+        worksheet.append(row)
+    output = BytesIO()
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+def make_ods(content: str = ODS_CONTENT) -> BytesIO:
+    output = BytesIO()
+    with zipfile.ZipFile(output, "w") as archive:
+        archive.writestr("mimetype", "application/vnd.oasis.opendocument.spreadsheet")
+        archive.writestr("content.xml", content)
+    output.seek(0)
+    return output
+
+
+class TestReaders(TestCase):
+    def test_iter_rows(self):
+        self.assertEqual(
+            [("a", 1, None), (None, None, None), ("b", 2.5, "c")],
+            list(iter_rows(make_workbook(("a", 1), (), ("b", 2.5, "c")))),
+        )
+
+    def test_iter_rows_unsized_worksheet(self):
+        self.assertEqual(
+            [("a", None, None), ("b", 2, "c")],
+            list(iter_rows(make_workbook(("a",), ("b", 2, "c"), write_only=True))),
+        )
+
+    @override_settings(UPLOAD_MAX_ROWS=2)
+    def test_row_budget(self):
+        self.assertEqual(2, len(list(iter_rows(make_workbook((1,), (2,))))))
+
+        for write_only in (False, True):
+            with self.subTest(write_only=write_only), self.assertRaisesRegex(BudgetExceeded, "more than 2 rows"):
+                next(iter_rows(make_workbook((1,), (2,), (3,), write_only=write_only)))
+
+    @override_settings(UPLOAD_MAX_ROWS=2)
+    def test_row_budget_wrong_dimension(self):
+        rows = iter_budgeted(iter([(1,), (2,), (3,)]))
+
+        self.assertEqual([(1,), (2,)], [next(rows), next(rows)])
+        with self.assertRaises(BudgetExceeded):
+            next(rows)
+
+    @override_settings(UPLOAD_MAX_SHEET_SIZE=1024)
+    def test_size_budget(self):
+        with self.assertRaisesRegex(BudgetExceeded, "at most 1024 bytes"):
+            next(iter_rows(make_workbook(("a" * 1024,))))
+
+    def test_detect_format(self):
+        self.assertEqual(
+            [XLSX, ODS, CSV, CSV],
+            [detect_format(file) for file in (make_workbook(("a",)), make_ods(), BytesIO(b"a;b"), BytesIO(b""))],
+        )
+
+        with self.assertRaisesRegex(ValueError, "Legacy .xls"):
+            detect_format(BytesIO(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"))
+
+    def test_iter_rows_corrupt(self):
+        without_sheet = BytesIO()
+        with zipfile.ZipFile(without_sheet, "w") as archive:
+            archive.writestr("readme.txt", "")
+        without_sheet.seek(0)
+
+        for name, file in (
+            ("truncated", BytesIO(make_workbook(("a",)).getvalue()[:1024])),
+            ("without sheet", without_sheet),
+            ("broken ODS", make_ods("<office:document-content")),
+        ):
+            with self.subTest(name), self.assertRaisesRegex(ValueError, "could not be read"):
+                list(iter_rows(file))
+
+    def test_iter_rows_ods(self):
+        self.assertEqual(
+            [
+                ("a", 1, None, None),
+                (None, None, None, None),
+                (None, None, None, None),
+                ("b\nc", 2.5, None, datetime(2023, 6, 1)),
+            ],
+            list(iter_rows(make_ods())),
+        )
+
+    def test_iter_rows_csv(self):
+        contents = (
+            "Datum;Umsatz;Konto;Buchungstext\r\n"
+            '01.06.2023;-1.234,56;0815;"Gehalt; Juni"\r\n'
+            "\r\n"
+            "31.06.2023;42;4120;\r\n"
+            "02.06.2023;1.234;4120;\r\n"
+            "1.5;+0,5;1.23;Ärger\r\n"
+        )
+        expected = [
+            ("Datum", "Umsatz", "Konto", "Buchungstext"),
+            ("01.06.2023", -1234.56, "0815", "Gehalt; Juni"),
+            (),
+            ("31.06.2023", 42, 4120, None),
+            ("02.06.2023", 1234, 4120, None),
+            ("1.5", 0.5, "1.23", "Ärger"),
+        ]
+
+        for encoding in ("utf-8", "utf-8-sig", "cp1252"):
+            with self.subTest(encoding=encoding):
+                self.assertEqual(expected, list(iter_rows(BytesIO(contents.encode(encoding)))))
+
+        with self.subTest("commas"):
+            self.assertEqual(
+                [("a", "b"), (1.5, None)],
+                list(iter_rows(BytesIO(b'a,b\n"1,5",\n'))),
+            )
+
+    @override_settings(UPLOAD_MAX_ROWS=2)
+    def test_row_budget_ods_csv(self):
+        with self.assertRaises(BudgetExceeded):
+            next(iter_rows(make_ods()))
+
+        with self.assertRaises(BudgetExceeded):
+            list(iter_rows(BytesIO(b"1\n2\n3\n")))
@@ -0,0 +1,40 @@
+import json
+import os
+import subprocess
+import sys
+from unittest import TestCase
+
+from django.conf import settings
+
+HEAVY_MODULES = ("openpyxl", "pydantic", "schwifty", "sepaxml", "xmlschema")
+
+# Run in a fresh interpreter, the test process has imported everything already
+SCRIPT = """
+import json, sys
+import django
+django.setup()
+from django.test import Client
+status = Client().get("/health/", secure=True).status_code
+health = sorted(set(sys.argv[1:]) & set(sys.modules))
+from sepacetamol.startup import warm_up
+warm_up()
+print(json.dumps({"status": status, "health": health, "warm": sorted(set(sys.argv[1:]) & set(sys.modules))}))
+"""
+
+
+class TestStartup(TestCase):
+    def test_lazy_imports(self):
+        result = subprocess.run(
+            (sys.executable, "-c", SCRIPT, *HEAVY_MODULES),
+            cwd=settings.BASE_DIR,
+            env={**os.environ, "DJANGO_SETTINGS_MODULE": "config.settings", "DJANGO_DEBUG": "1"},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+
+        self.assertEqual(
+            # schwifty is loaded along with the IBAN registries when the app is ready
+            {"status": 200, "health": ["schwifty"], "warm": sorted(HEAVY_MODULES)},
+            json.loads(result.stdout),
+        )
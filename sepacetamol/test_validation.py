@@ -0,0 +1,47 @@
+from dataclasses import replace
+from io import BytesIO
+from unittest import TestCase
+
+from sepaxml.validation import ValidationError
+
+from sepacetamol.pain import BatchBooking, CreditTransferWriter
+from sepacetamol.test_pain import EXECUTION_DATE, ORIGINATOR, PAYMENTS
+from sepacetamol.validation import iter_validated, validate
+
+
+def make_writer(batch_booking: BatchBooking) -> CreditTransferWriter:
+    return CreditTransferWriter(
+        name=ORIGINATOR["name"],
+        iban=ORIGINATOR["IBAN"],
+        bic=ORIGINATOR["BIC"],
+        batch_booking=batch_booking,
+        execution_date=EXECUTION_DATE,
+    )
+
+
+class TestValidation(TestCase):
+    def test_validate(self):
+        for batch_booking in BatchBooking:
+            with self.subTest(batch_booking=batch_booking):
+                output = BytesIO()
+                chunks = list(make_writer(batch_booking).iter_chunks(PAYMENTS * 3, chunk_size=100))
+
+                validate(chunks, output)
+
+                self.assertEqual(b"".join(chunks), output.getvalue())
+
+    def test_validate_invalid_transaction(self):
+        for position in range(3):
+            payments = list(PAYMENTS * 2)
+            payments[position] = replace(payments[position], bic="X")
+
+            for batch_booking in BatchBooking:
+                with self.subTest(position=position, batch_booking=batch_booking), self.assertRaises(ValidationError):
+                    validate(make_writer(batch_booking).iter_chunks(payments, chunk_size=1))
+
+    def test_iter_validated(self):
+        chunks = list(make_writer(BatchBooking.TRUE).iter_chunks(PAYMENTS, chunk_size=100))
+        self.assertEqual(chunks, list(iter_validated(chunks)))
+
+        with self.assertRaises(ValidationError):
+            list(iter_validated(make_writer(BatchBooking.TRUE).iter_chunks([replace(PAYMENTS[0], iban="DE00")])))
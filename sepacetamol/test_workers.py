@@ -0,0 +1,28 @@
+from unittest import TestCase, mock
+
+from django.test import override_settings
+
+from sepacetamol import workers
+
+
+class TestWorkers(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(workers, "recycling", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_get_rss(self):
+        self.assertGreater(workers.get_rss(), 1024 * 1024)
+
+    @mock.patch("os.kill")
+    def test_recycle(self, kill):
+        with override_settings(WORKER_MAX_RSS=1024 * 1024 * 1024 * 1024):
+            workers.recycle_if_oversized()
+
+        kill.assert_not_called()
+
+        with override_settings(WORKER_MAX_RSS=1024):
+            workers.recycle_if_oversized()
+            workers.recycle_if_oversized()
+
+        kill.assert_called_once()
@@ -1,9 +1,50 @@
+from collections.abc import Callable
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
 from django.urls import path
+from django.utils.module_loading import import_string
+from django.views.decorators.csrf import csrf_exempt
+
+
+def lazy_view(name: str, is_async: bool = False) -> Callable:
+    """
+    Reference a view by its dotted path and import it on first call, so that processes serving only health checks
+    and metrics never import openpyxl, sepaxml and pydantic. Attributes that middleware reads before
+    calling the view, such as `csrf_exempt`, must be set on the reference itself.
+    """
+
+    def view(request, *args, **kwargs):
+        return import_string(name)(request, *args, **kwargs)
+
+    async def async_view(request, *args, **kwargs):
+        return await import_string(name)(request, *args, **kwargs)
+
+    reference = markcoroutinefunction(async_view) if is_async else view
+    reference.load = lambda: import_string(name)
+    return reference
+
 
-from .views import datev, sepa
+if settings.ASYNC_VIEWS:
+    index = lazy_view("sepacetamol.views.sepa.async_index", is_async=True)
+    generate = lazy_view("sepacetamol.views.sepa.async_generate", is_async=True)
+    personio_datev = lazy_view("sepacetamol.views.datev.async_index", is_async=True)
+else:
+    index = lazy_view("sepacetamol.views.sepa.index")
+    generate = lazy_view("sepacetamol.views.sepa.generate")
+    personio_datev = lazy_view("sepacetamol.views.datev.index")
 
 urlpatterns = [
-    path("", sepa.index, name="index"),
-    path("generate/", sepa.generate, name="generate"),
-    path("personio-datev/", datev.index, name="personio-datev"),
+    path("", index, name="index"),
+    path("generate/", generate, name="generate"),
+    path("preview/<str:token>/", lazy_view("sepacetamol.views.sepa.preview"), name="preview"),
+    path("personio-datev/", personio_datev, name="personio-datev"),
+    path("api/v1/sepa/", csrf_exempt(lazy_view("sepacetamol.views.api.sepa")), name="api-v1-sepa"),
+    path("api/v1/datev/", csrf_exempt(lazy_view("sepacetamol.views.api.datev")), name="api-v1-datev"),
+    path("batch/sepa/", csrf_exempt(lazy_view("sepacetamol.views.batch.sepa")), name="batch-sepa"),
+    path("batch/datev/", csrf_exempt(lazy_view("sepacetamol.views.batch.datev")), name="batch-datev"),
+    path("jobs/sepa/", csrf_exempt(lazy_view("sepacetamol.views.jobs.sepa")), name="job-sepa"),
+    path("jobs/datev/", csrf_exempt(lazy_view("sepacetamol.views.jobs.datev")), name="job-datev"),
+    path("jobs/<str:job_id>/", lazy_view("sepacetamol.views.jobs.status"), name="job-status"),
+    path("jobs/<str:job_id>/download/", lazy_view("sepacetamol.views.jobs.download"), name="job-download"),
 ]
@@ -0,0 +1,120 @@
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+from typing import IO
+from xml.etree.ElementTree import Element, XMLPullParser
+
+from django.conf import settings
+from sepaxml.validation import ValidationError
+
+from .pain import NAMESPACE, SCHEMA_PATH
+
+# Elements validated and discarded one by one as soon as they are complete
+STREAMED_ELEMENTS = {
+    "PmtInf": "Document/CstmrCdtTrfInitn/PmtInf",
+    "CdtTrfTxInf": "Document/CstmrCdtTrfInitn/PmtInf/CdtTrfTxInf",
+}
+
+
+@cache
+def get_schema():
+    # xmlschema monkeypatches etree on import, so it is imported lazily just like in sepaxml
+    import xmlschema
+
+    return xmlschema.XMLSchema(SCHEMA_PATH)
+
+
+@cache
+def get_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=settings.SEPA_VALIDATION_WORKERS, thread_name_prefix="sepa-validation")
+
+
+def validate_element(declaration, element: Element):
+    import xmlschema
+
+    try:
+        declaration.validate(element)
+    except xmlschema.XMLSchemaValidationError as e:
+        raise ValidationError(
+            "The output SEPA file contains validation errors. This is likely due to an illegal value in one of "
+            "your input fields.",
+        ) from e
+
+
+class StreamValidator:
+    """
+    Validate a pain.001 document against the XSD while it is being written, chunk by chunk.
+
+    Every payment information block and transaction except for the first one of its parent is validated against
+    its own element declaration as soon as it is complete, and then dropped from the tree. The remaining skeleton is
+    validated as a whole at the end of the document, so memory stays flat regardless of the number of transactions.
+    """
+
+    def __init__(self):
+        schema = get_schema()
+
+        self.schema = schema
+        self.declarations = {
+            f"{{{NAMESPACE}}}{tag}": schema.find(path, namespaces={"": NAMESPACE})
+            for tag, path in STREAMED_ELEMENTS.items()
+        }
+        self.parser = XMLPullParser(events=("start", "end"))
+        self.stack: list[Element] = []
+        self.root: Element | None = None
+
+    def feed(self, data: bytes):
+        self.parser.feed(data)
+
+        for event, element in self.parser.read_events():
+            if event == "start":
+                self.stack.append(element)
+                continue
+
+            self.stack.pop()
+
+            if not self.stack:
+                self.root = element
+                continue
+
+            if (declaration := self.declarations.get(element.tag)) is None:
+                continue
+
+            parent = self.stack[-1]
+            if next(child for child in parent if child.tag == element.tag) is not element:
+                validate_element(declaration, element)
+                parent.remove(element)
+
+    def close(self):
+        self.parser.close()
+
+        if self.root is None:
+            raise ValidationError("The output SEPA file is empty.")
+
+        validate_element(self.schema, self.root)
+
+
+def validate(chunks: Iterable[bytes], output: IO[bytes] | None = None) -> None:
+    validator = StreamValidator()
+
+    for chunk in chunks:
+        validator.feed(chunk)
+        if output is not None:
+            output.write(chunk)
+
+    validator.close()
+
+
+def iter_validated(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Pass chunks through as soon as they have been fed to a validator on the bounded validation executor.
+
+    A validation error aborts the stream, so the client ends up with a truncated document instead of an invalid one.
+    """
+    executor = get_executor()
+    validator = executor.submit(StreamValidator).result()
+
+    for chunk in chunks:
+        executor.submit(validator.feed, chunk).result()
+        yield chunk
+
+    executor.submit(validator.close).result()
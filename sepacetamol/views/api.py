@@ -0,0 +1,136 @@
+import codecs
+import csv
+import json
+from collections.abc import Iterator
+from datetime import date
+from itertools import chain
+
+from django.core.exceptions import SuspiciousOperation
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from sepaxml.validation import ValidationError
+
+from ..iban import resolve_iban
+from ..pain import BatchBooking, Payment, PaymentStore, to_cents
+from ..readers import normalize_german_number
+from .datev import DatevSettings, datev_response, get_datev_booking_data_from_personio
+from .sepa import Originator, credit_transfer_response
+
+CSV_DELIMITERS = ",;\t"
+
+
+class UnsupportedMediaType(Exception):
+    pass
+
+
+def iter_records(request) -> Iterator[dict]:
+    """
+    Read records from the request body, either as a JSON array, as newline-delimited JSON or as CSV with a header
+    row. Newline-delimited JSON and CSV are consumed line by line, so the body is never held in memory as a whole.
+    """
+    encoding = request.content_params.get("charset", "utf-8")
+
+    match request.content_type:
+        case "application/json":
+            records = json.load(request)
+            if not isinstance(records, list):
+                raise ValueError("JSON body must be an array of records")
+            yield from records
+        case "application/x-ndjson":
+            for line in request:
+                if line.strip():
+                    yield json.loads(line)
+        case "text/csv":
+            lines = codecs.iterdecode(request, encoding)
+            header = next(lines, "")
+            dialect = csv.Sniffer().sniff(header, delimiters=CSV_DELIMITERS) if header.strip() else csv.excel
+            yield from csv.DictReader(chain((header,), lines), dialect=dialect)
+        case _:
+            raise UnsupportedMediaType(request.content_type)
+
+
+def normalize_amount(value: str | int | float) -> str | int | float:
+    """
+    Read amounts given as text in German notation, e.g. 1.234,56, like uploaded CSV files are read, and anything
+    else, e.g. 1234.56 or JSON numbers, as is.
+    """
+    if not isinstance(value, str):
+        return value
+
+    value = value.strip()
+    return number if (number := normalize_german_number(value)) is not None else value
+
+
+def get_payment_from_record(record: dict) -> Payment:
+    iban = resolve_iban(record["iban"])
+    reference = (record.get("reference") or "").strip()
+
+    return Payment(
+        name=record["name"].strip(),
+        iban=iban.compact,
+        bic=(record.get("bic") or "").strip() or (iban.bic if iban.country_code == "DE" else ""),
+        amount=to_cents(normalize_amount(record["amount"])),
+        description=record["purpose"].strip(),
+        endtoend_id=reference if reference != "" else "NOTPROVIDED",
+    )
+
+
+def get_booking_data_from_record(record: dict) -> tuple[date, dict]:
+    record = {key: value.strip() if isinstance(value, str) else value for key, value in record.items()}
+    return get_datev_booking_data_from_personio({**record, "Umsatz": float(normalize_amount(record["Umsatz"]))})
+
+
+def api_view(view):
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except UnsupportedMediaType as e:
+            return JsonResponse({"error": f"Unsupported media type: {e}"}, status=415)
+        except (KeyError, ValueError, SuspiciousOperation, ValidationError) as e:
+            return JsonResponse({"error": str(e) if not isinstance(e, KeyError) else f"Missing field: {e}"}, status=400)
+
+    return csrf_exempt(require_POST(wrapper))
+
+
+@api_view
+def sepa(request):
+    """
+    Generate a pain.001 credit transfer from a batch of payments with the fields `name`, `iban`, `bic` (optional for
+    German IBANs), `amount`, `purpose` and `reference` (optional). The originator is given in the query string, using
+    the same parameter names as the HTML form.
+    """
+    originator_iban = resolve_iban(request.GET["originator-iban"])
+    if originator_iban.country_code != "DE":
+        raise ValueError("only German originator IBANs are supported")
+
+    originator = Originator(
+        name=request.GET["originator-name"],
+        iban=originator_iban.compact,
+        bic=request.GET.get("originator-bic") or originator_iban.bic,
+    )
+
+    execution_date = request.GET.get("execution-date")
+
+    return credit_transfer_response(
+        originator,
+        BatchBooking(request.GET.get("batch-booking", BatchBooking.FALSE)),
+        PaymentStore.from_payments(get_payment_from_record(record) for record in iter_records(request)),
+        target_filename=request.GET.get("target-filename", "sepa.xml"),
+        execution_date=date.fromisoformat(execution_date) if execution_date else None,
+    )
+
+
+@api_view
+def datev(request):
+    """
+    Convert a batch of bookings with the columns of a Personio accounting export (`Datum`, `Umsatz`, `S/H`, `Konto`,
+    `Gegenkonto`, `Belegfeld 1`, `Buchungstext`) to a DATEV Buchungsstapel. Consultant and client number are given in
+    the query string.
+    """
+    datev_settings = DatevSettings(
+        consultant_number=request.GET["consultant-number"],
+        client_numer=request.GET["client-number"],
+    )
+
+    return datev_response(datev_settings, [get_booking_data_from_record(record) for record in iter_records(request)])
@@ -0,0 +1,71 @@
+from datetime import date
+from pathlib import PurePosixPath
+
+from django.http import StreamingHttpResponse
+from django.utils.encoding import smart_str
+
+from ..batch import Converter, iter_batch_results, iter_batch_sources, iter_batch_zip
+from ..pain import BatchBooking
+from .api import api_view
+from .datev import DatevSettings, export_personio_to_datev
+from .sepa import export_source_file
+
+
+def convert_sepa(name: str, data: str | bytes, options: dict[str, str]) -> tuple[str, str]:
+    execution_date = options.get("execution-date")
+
+    path = export_source_file(
+        data,
+        BatchBooking(options.get("batch-booking", BatchBooking.FALSE)),
+        date.fromisoformat(execution_date) if execution_date else None,
+    )
+
+    return str(PurePosixPath(name).with_suffix(".xml")), path
+
+
+def convert_datev(name: str, data: str | bytes, options: dict[str, str]) -> tuple[str, str]:
+    datev_settings = DatevSettings(
+        consultant_number=options["consultant-number"],
+        client_numer=options["client-number"],
+    )
+
+    target_filename, path = export_personio_to_datev(data, datev_settings)
+
+    # One directory per source, as the exports of several entities for the same month share a file name
+    return str(PurePosixPath(name).with_suffix("") / target_filename), path
+
+
+CONVERTERS: dict[str, Converter] = {
+    "sepa": convert_sepa,
+    "datev": convert_datev,
+}
+
+
+def batch_response(request, convert: Converter) -> StreamingHttpResponse:
+    archive = request.FILES["archive"]
+
+    response = StreamingHttpResponse(
+        iter_batch_zip(iter_batch_results(convert, iter_batch_sources(archive, request.POST.dict()))),
+        content_type="application/zip",
+    )
+    response["Content-Disposition"] = "attachment; filename=%s" % smart_str(archive.name)
+
+    return response
+
+
+@api_view
+def sepa(request):
+    """
+    Convert a ZIP of SEPA source sheets to a ZIP of pain.001 documents. `batch-booking` and `execution-date` are
+    taken from the form, and can be overridden per file in a `settings.json` member of the archive.
+    """
+    return batch_response(request, convert_sepa)
+
+
+@api_view
+def datev(request):
+    """
+    Convert a ZIP of Personio exports to a ZIP of DATEV Buchungsstapel. `consultant-number` and `client-number` are
+    taken from the form, and can be overridden per file in a `settings.json` member of the archive.
+    """
+    return batch_response(request, convert_datev)
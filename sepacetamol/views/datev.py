@@ -1,34 +1,56 @@
 import calendar
-import csv
 import re
+import zipfile
+from collections.abc import Callable, Iterable, Iterator, Sequence
 from datetime import date, datetime
-from io import StringIO
-from typing import Annotated, Literal, Optional
+from functools import cache, partial
+from itertools import chain, islice, zip_longest
+from operator import attrgetter
+from tempfile import SpooledTemporaryFile
+from typing import IO, Annotated, Literal, Optional, Self
 from zoneinfo import ZoneInfo
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib import messages as message
-from django.http import HttpResponse, HttpResponseBadRequest
+from django.http import FileResponse, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import render
 from django.utils.encoding import smart_str
-from openpyxl.reader.excel import load_workbook
-from pydantic import BaseModel, ConfigDict, Field, field_validator
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError, field_validator
+
+from ..batch import convert_all, iter_batch_zip
+from ..cache import get_cache_key, get_file_digest, is_enabled, lookup, store
+from ..metrics import add_rows, stage
+from ..processes import open_result, open_upload, run_in_process, share_upload, write_result
+from ..readers import iter_rows
 
 
 def float_to_german(value: float) -> str:
     return f"{value:.2f}".replace(".", ",")
 
 
-def unquote_empty_csv_strings(value: str) -> str:
-    while ';"";' in value:
-        value = value.replace(';"";', ";;")
-    result = value.removesuffix(';""')
-    return result if result == value else result + ";"
+def quote_datev_value(value) -> str:
+    """
+    DATEV flavour of `csv.QUOTE_NONNUMERIC`: numbers are written as is, text is quoted, empty values are left empty.
+    """
+    if value is None or value == "":
+        return ""
+    if isinstance(value, int | float):
+        return str(value)
+    return '"' + str(value).replace('"', '""') + '"'
 
 
 def date_to_datev(d: date) -> str:
     return d.strftime("%Y%m%d")
 
 
+DATEV_CSV_ENCODING = "cp1252"
+DATEV_CSV_LINE_TERMINATOR = "\r\n"
+DATEV_CSV_CHUNK_ROWS = 1000
+
+# Errors of a bulk validation listed in its message, the others only counted
+MAX_REPORTED_ERRORS = 10
+
 DEFAULT_CONFIG = ConfigDict(
     populate_by_name=True,
     validate_default=True,
@@ -47,12 +69,48 @@ class DatevSettings(BaseModel):
     model_config = DEFAULT_CONFIG
 
 
+@cache
+def get_csv_fields(model: type[BaseModel]) -> attrgetter:
+    return attrgetter(*model.model_fields)
+
+
+def format_validation_error(error: ValidationError, limit: int = MAX_REPORTED_ERRORS) -> str:
+    count = error.error_count()
+    lines = [f"{count} validation error{'s' if count != 1 else ''} for {error.title}"]
+    lines.extend(
+        f"{'.'.join(map(str, details['loc']))}: {details['msg']}"
+        for details in error.errors(include_url=False, include_context=False, include_input=False)[:limit]
+    )
+    if count > limit:
+        lines.append(f"and {count - limit} more")
+    return "\n".join(lines)
+
+
+@cache
+def get_list_adapter(model: type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(list[model])
+
+
 class DatevModel(BaseModel):
+    @classmethod
+    def model_validate_many(cls, objs: Iterable[dict]) -> list[Self]:
+        """
+        Validate a batch of models in a single call into pydantic-core rather than constructing them one by one.
+
+        The constraints are exactly those of the model, but errors are reported for all items at once, prefixed with
+        the index of the offending item, as a `ValueError` listing the first `MAX_REPORTED_ERRORS` of them.
+        """
+        try:
+            return get_list_adapter(cls).validate_python(list(objs))
+        except ValidationError as e:
+            raise ValueError(format_validation_error(e)) from e
+
     def model_dump_csv(self) -> str:
-        output = StringIO()
-        datev_writer = csv.writer(output, quoting=csv.QUOTE_NONNUMERIC, delimiter=";")
-        datev_writer.writerow(self.model_dump().values())
-        return "\n".join(unquote_empty_csv_strings(line) for line in output.getvalue().splitlines())
+        return ";".join(map(quote_datev_value, get_csv_fields(type(self))(self)))
+
+    @classmethod
+    def model_dump_csv_header(cls) -> str:
+        return ";".join(quote_datev_value(field.alias or name) for name, field in cls.model_fields.items())
 
     model_config = ConfigDict(
         populate_by_name=True,
@@ -192,80 +250,205 @@ class DatevBooking(DatevModel):
         description="Mahn- oder Zahlsperre, 0 = keine Sperre (default), 1 = Sperre",
     )
 
-    def model_dump_csv_header(self) -> str:
-        output = StringIO()
-        datev_writer = csv.DictWriter(
-            output,
-            fieldnames=self.model_dump(by_alias=True).keys(),
-            quoting=csv.QUOTE_NONNUMERIC,
-            delimiter=";",
-        )
-        datev_writer.writeheader()
-        return output.getvalue().strip()
 
+def iter_datev_csv(header: DatevHeader, bookings: Iterable[DatevBooking]) -> Iterator[bytes]:
+    """
+    Serialize a Buchungsstapel in a single pass: header, column names and one line per booking, separated by CRLF
+    without a trailing line break, encoded to cp1252 in chunks of `DATEV_CSV_CHUNK_ROWS` lines.
+    """
+    lines = chain(
+        (header.model_dump_csv(), DatevBooking.model_dump_csv_header()),
+        (booking.model_dump_csv() for booking in bookings),
+    )
 
-def get_datev_booking_from_personio(row: dict) -> tuple[date, DatevBooking]:
-    datum = row["Datum"]
-    umsatz = row["Umsatz"]
-    sh = row["S/H"]
-    gegenkonto = row["Gegenkonto"]
-    konto = row["Konto"]
-    belegfeld_1 = row.get("Belegfeld 1") or row.get("Beleg Feld 1", "")
-    buchungstext = row["Buchungstext"]
+    separator = ""
+    while chunk := tuple(islice(lines, DATEV_CSV_CHUNK_ROWS)):
+        yield (separator + DATEV_CSV_LINE_TERMINATOR.join(chunk)).encode(DATEV_CSV_ENCODING)
+        separator = DATEV_CSV_LINE_TERMINATOR
 
+
+PERSONIO_TIMEZONE = ZoneInfo("Europe/Berlin")
+
+
+def strip_value(value):
+    return value.strip() if isinstance(value, str) else value
+
+
+def map_distinct(function: Callable, values: Sequence) -> list:
+    """
+    Apply a function once per distinct value of a column, for columns repeating a handful of values like dates,
+    accounts and periods.
+    """
+    results = {value: function(value) for value in set(values)}
+    return list(map(results.__getitem__, values))
+
+
+def parse_personio_date(value: str | datetime) -> date:
     # Personio hacks to support different formats
-    datum = (
-        datetime.strptime(datum, "%d.%m.%Y").replace(tzinfo=ZoneInfo("Europe/Berlin")).date()
-        if isinstance(datum, str)
-        else datum.date()
-    )
+    if isinstance(value, str):
+        return datetime.strptime(value.strip(), "%d.%m.%Y").replace(tzinfo=PERSONIO_TIMEZONE).date()
+    return value.date()
 
-    if isinstance(belegfeld_1, float):
-        belegfeld_1 = str(int(belegfeld_1))
 
-    buchungstext = (buchungstext[:57] + "...") if len(buchungstext) > 60 else buchungstext
+def parse_belegfeld(value) -> str | None:
+    return str(int(value)) if isinstance(value, int | float) else strip_value(value)
 
-    soll_haben = "S" if not sh else sh
 
-    if umsatz < 0:
-        soll_haben = "H" if soll_haben == "S" else "S"
+def truncate_buchungstext(value: str) -> str:
+    value = value.strip()
+    return (value[:57] + "...") if len(value) > 60 else value
 
-    return (
-        datum,
-        DatevBooking(
-            umsatz=float_to_german(abs(umsatz)),
-            soll_haben_kz=soll_haben,
-            konto=konto,
-            gegenkonto=gegenkonto,
-            belegdatum=datum.strftime("%d%m"),
-            belegfeld_1=belegfeld_1,
-            buchungstext=buchungstext,
-        ),
-    )
 
+def format_amounts(amounts: Sequence[float]) -> list[str]:
+    # Decimal commas for the whole column in one replace, rather than one per amount. Takes at least one amount.
+    return "\n".join([f"{abs(amount):.2f}" for amount in amounts]).replace(".", ",").split("\n")
 
-def convert_personio_to_datev(request) -> HttpResponse:
-    datev_settings = DatevSettings(
-        consultant_number=request.POST["consultant-number"],
-        client_numer=request.POST["client-number"],
+
+def get_soll_haben(sh_values: Sequence, amounts: Sequence[float]) -> list[str]:
+    # Negative amounts are booked on the other side
+    sh_values = map_distinct(lambda sh: strip_value(sh) or "S", sh_values)
+    return [("H" if sh == "S" else "S") if amount < 0 else sh for sh, amount in zip(sh_values, amounts)]
+
+
+def get_personio_columns(rows: Sequence[tuple]) -> dict[str, Sequence]:
+    """
+    Transpose the rows of a Personio export, header first, to columns keyed by their name. Short rows are padded.
+    """
+    return {strip_value(column[0]): column[1:] for column in zip_longest(*rows) if column[0] is not None}
+
+
+def get_datev_bookings_data_from_personio(columns: dict[str, Sequence]) -> tuple[tuple[date, dict], ...]:
+    """
+    Convert the columns of a Personio export to booking data, applying each rule to a whole column at once.
+    """
+    amounts = columns["Umsatz"]
+    dates = map_distinct(parse_personio_date, columns["Datum"])
+    belegdaten = map_distinct(lambda datum: datum.strftime("%d%m"), dates)
+
+    missing = (None,) * len(amounts)
+    belegfeld_1 = [
+        first or second
+        for first, second in zip(columns.get("Belegfeld 1", missing), columns.get("Beleg Feld 1", ("",) * len(amounts)))
+    ]
+
+    return tuple(
+        (
+            datum,
+            {
+                "umsatz": umsatz,
+                "soll_haben_kz": soll_haben,
+                "konto": konto,
+                "gegenkonto": gegenkonto,
+                "belegdatum": belegdatum,
+                "belegfeld_1": belegfeld,
+                "buchungstext": buchungstext,
+            },
+        )
+        for datum, umsatz, soll_haben, konto, gegenkonto, belegdatum, belegfeld, buchungstext in zip(
+            dates,
+            format_amounts(amounts),
+            get_soll_haben(columns["S/H"], amounts),
+            map_distinct(strip_value, columns["Konto"]),
+            map_distinct(strip_value, columns["Gegenkonto"]),
+            belegdaten,
+            map_distinct(parse_belegfeld, belegfeld_1),
+            map(truncate_buchungstext, columns["Buchungstext"]),
+        )
     )
 
+
+def get_datev_booking_data_from_personio(row: dict) -> tuple[date, dict]:
+    (booking_data,) = get_datev_bookings_data_from_personio({key: (value,) for key, value in row.items()})
+    return booking_data
+
+
+def get_datev_booking_from_personio(row: dict) -> tuple[date, DatevBooking]:
+    datum, booking = get_datev_booking_data_from_personio(row)
+    return datum, DatevBooking(**booking)
+
+
+def read_personio_rows(file: IO[bytes]) -> tuple[tuple, ...]:
+    """
+    Read the non-empty rows of a Personio export as they are, values are only cleaned up column by column later.
+    """
     try:
-        worksheet = load_workbook(request.FILES["personio-file"]).active
+        return tuple(row for row in iter_rows(file) if any(row))
     except Exception as e:
         raise ValueError("Personio file could not be loaded, please check the format") from e
 
-    non_empty_rows = tuple(
-        tuple(value.strip() if isinstance(value, str) else value for value in row)
-        for row in worksheet.iter_rows(values_only=True)
-        if any(row)
+
+def parse_personio_rows(non_empty_rows: Sequence[tuple]) -> tuple[tuple[date, dict], ...]:
+    if len(non_empty_rows) < 2:
+        return ()
+    return get_datev_bookings_data_from_personio(get_personio_columns(non_empty_rows))
+
+
+def read_personio_bookings(file: IO[bytes]) -> tuple[tuple[date, dict], ...]:
+    return parse_personio_rows(read_personio_rows(file))
+
+
+def read_personio_file(source: str | bytes) -> tuple[tuple[date, dict], ...]:
+    with open_upload(source) as file:
+        return read_personio_bookings(file)
+
+
+def group_by_period(bookings_data: Iterable[tuple[date, dict]]) -> list[tuple[date, list[tuple[date, dict]]]]:
+    """
+    Group bookings by the month of their date in a single pass, keeping their order within each month. Months are
+    keyed by their first day and sorted.
+    """
+    periods: dict[date, list[tuple[date, dict]]] = {}
+    for booking_data in bookings_data:
+        periods.setdefault(booking_data[0].replace(day=1), []).append(booking_data)
+
+    return sorted(periods.items())
+
+
+def get_datev_settings(request) -> DatevSettings:
+    return DatevSettings(
+        consultant_number=request.POST["consultant-number"],
+        client_numer=request.POST["client-number"],
     )
 
-    bookings = tuple(get_datev_booking_from_personio(dict(zip(non_empty_rows[0], row))) for row in non_empty_rows[1:])
 
-    (datum, first_booking), *_ = bookings
+def get_datev_cache_key(personio_file, datev_settings: DatevSettings) -> str | None:
+    # Uploads are not hashed for nothing while the cache is disabled
+    if not is_enabled():
+        return None
+
+    return get_cache_key(
+        "datev-csv",
+        get_file_digest(personio_file),
+        datev_settings.consultant_number,
+        datev_settings.client_numer,
+    )
+
 
-    header = DatevHeader(
+def cached_datev_response(cache_key: str | None) -> FileResponse | None:
+    if cache_key is None or (cached := lookup(cache_key)) is None:
+        return None
+
+    response = FileResponse(cached.file, content_type="text/csv")
+    response["Content-Disposition"] = "attachment; filename=%s" % smart_str(cached.meta["filename"])
+
+    return response
+
+
+def convert_personio_to_datev(request) -> FileResponse | StreamingHttpResponse:
+    datev_settings = get_datev_settings(request)
+
+    cache_key = get_datev_cache_key(request.FILES["personio-file"], datev_settings)
+    if (response := cached_datev_response(cache_key)) is not None:
+        return response
+
+    bookings_data = read_personio_bookings(request.FILES["personio-file"])
+    add_rows(len(bookings_data))
+
+    return datev_response(datev_settings, bookings_data, cache_key=cache_key)
+
+
+def get_datev_header(datev_settings: DatevSettings, datum: date) -> DatevHeader:
+    return DatevHeader(
         flag="EXTF",
         format_category=21,
         format_name="Buchungsstapel",
@@ -282,19 +465,139 @@ def convert_personio_to_datev(request) -> HttpResponse:
         gl_chart_of_accounts="03",
     )
 
-    target_filename = f"EXTF_Personio-{datum.strftime('%Y-%m')}.csv"
 
-    contents = "\r\n".join(
-        (
-            header.model_dump_csv(),
-            first_booking.model_dump_csv_header(),
-            *(booking.model_dump_csv() for _, booking in bookings),
-        ),
-    ).encode("cp1252")
+def get_datev_filename(datum: date) -> str:
+    return f"EXTF_Personio-{datum.strftime('%Y-%m')}.csv"
+
+
+def get_datev_archive_filename(periods: Sequence[tuple[date, Sequence]]) -> str:
+    (first, _), *_, (last, _) = periods
+    return f"EXTF_Personio-{first.strftime('%Y-%m')}_{last.strftime('%Y-%m')}.zip"
+
+
+def write_datev(datev_settings: DatevSettings, bookings_data: Sequence[tuple[date, dict]], output: IO[bytes]) -> str:
+    """
+    Write the bookings of a single month as one Buchungsstapel, its period taken from the first booking.
+    """
+    if not bookings_data:
+        raise ValueError("The Personio file contains no bookings")
+
+    (datum, _), *_ = bookings_data
+
+    with stage("validate"):
+        bookings = DatevBooking.model_validate_many(booking for _, booking in bookings_data)
+
+    with stage("export"):
+        output.writelines(iter_datev_csv(get_datev_header(datev_settings, datum), bookings))
+
+    return get_datev_filename(datum)
+
+
+def write_datev_archive(
+    datev_settings: DatevSettings,
+    periods: Sequence[tuple[date, Sequence[tuple[date, dict]]]],
+    output: IO[bytes],
+) -> str:
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for period, bookings_data in periods:
+            with archive.open(get_datev_filename(period), "w") as entry:
+                write_datev(datev_settings, bookings_data, entry)
+
+    return get_datev_archive_filename(periods)
+
+
+def export_datev(datev_settings: DatevSettings, bookings_data: Sequence[tuple[date, dict]]) -> tuple[str, str]:
+    return write_result(partial(write_datev, datev_settings, bookings_data))
+
+
+def export_datev_period(
+    target_filename: str,
+    datev_settings: DatevSettings,
+    bookings_data: Sequence[tuple[date, dict]],
+) -> tuple[str, str]:
+    # Takes the name of the file first, as a source of `convert_all`
+    return export_datev(datev_settings, bookings_data)
+
+
+def datev_archive_response(
+    datev_settings: DatevSettings,
+    periods: Sequence[tuple[date, Sequence[tuple[date, dict]]]],
+) -> StreamingHttpResponse:
+    """
+    Write one Buchungsstapel per month on the process pool, all of them before the ZIP is streamed, so that bookings
+    of any month which cannot be written are reported like those of a single month.
+    """
+    with stage("export"):
+        results = convert_all(
+            export_datev_period,
+            ((get_datev_filename(period), datev_settings, bookings_data) for period, bookings_data in periods),
+        )
+
+    response = StreamingHttpResponse(iter_batch_zip(results), content_type="application/zip")
+    response["Content-Disposition"] = "attachment; filename=%s" % smart_str(get_datev_archive_filename(periods))
+
+    return response
+
 
-    response = HttpResponse(content_type="text/csv")
+def datev_response(
+    datev_settings: DatevSettings,
+    bookings_data: Sequence[tuple[date, dict]],
+    cache_key: str | None = None,
+) -> FileResponse | StreamingHttpResponse:
+    if len(periods := group_by_period(bookings_data)) > 1:
+        return datev_archive_response(datev_settings, periods)
+
+    # Spooled so that bookings which cannot be encoded to cp1252 are reported before the response starts
+    contents = SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    target_filename = write_datev(datev_settings, bookings_data, contents)
+    contents.seek(0)
+
+    if cache_key is not None:
+        store(cache_key, contents, {"filename": target_filename})
+
+    response = FileResponse(contents, content_type="text/csv")
+    response["Content-Disposition"] = "attachment; filename=%s" % smart_str(target_filename)
+
+    return response
+
+
+def export_personio_to_datev(source: str | bytes, datev_settings: DatevSettings) -> tuple[str, str]:
+    """
+    Convert a Personio export to a Buchungsstapel, or to a ZIP of one per month if it spans several. Meant to run on
+    the process pool already, so the months are written one after the other.
+    """
+    bookings_data = read_personio_file(source)
+
+    if len(periods := group_by_period(bookings_data)) > 1:
+        return write_result(partial(write_datev_archive, datev_settings, periods))
+
+    return export_datev(datev_settings, bookings_data)
+
+
+async def convert_personio_to_datev_in_process(request) -> FileResponse | StreamingHttpResponse:
+    datev_settings = get_datev_settings(request)
+
+    cache_key = await sync_to_async(get_datev_cache_key)(request.FILES["personio-file"], datev_settings)
+    if (response := await sync_to_async(cached_datev_response)(cache_key)) is not None:
+        return response
+
+    with stage("process"):
+        bookings_data = await run_in_process(read_personio_file, share_upload(request.FILES["personio-file"]))
+    add_rows(len(bookings_data))
+
+    # Exports spanning several months are written month by month in parallel, each on a process of its own
+    if len(periods := group_by_period(bookings_data)) > 1:
+        return await sync_to_async(datev_archive_response)(datev_settings, periods)
+
+    with stage("process"):
+        target_filename, path = await run_in_process(export_datev, datev_settings, bookings_data)
+
+    contents = open_result(path)
+    if cache_key is not None:
+        await sync_to_async(store)(cache_key, contents, {"filename": target_filename})
+
+    response = FileResponse(contents, content_type="text/csv")
     response["Content-Disposition"] = "attachment; filename=%s" % smart_str(target_filename)
-    response.write(contents)
 
     return response
 
@@ -312,3 +615,18 @@ def index(request):
             return response
     else:
         return HttpResponseBadRequest
+
+
+async def async_index(request):
+    if request.method == "GET":
+        return render(request, "datev.html")
+    elif request.method == "POST":
+        try:
+            response = await convert_personio_to_datev_in_process(request)
+        except Exception as e:
+            message.error(request, e)
+            return render(request, "datev.html")
+        else:
+            return response
+    else:
+        return HttpResponseBadRequest
@@ -0,0 +1,92 @@
+from datetime import date
+
+from django.http import FileResponse, Http404, JsonResponse
+from django.urls import reverse
+from django.utils.encoding import smart_str
+from django.views.decorators.http import require_GET
+
+from ..jobs import Job, JobStatus, get_job, open_job_result, submit_job
+from ..pain import BatchBooking
+from .api import api_view
+from .datev import export_personio_to_datev, get_datev_settings
+from .sepa import export_source_file, get_target_filename
+
+
+def job_response(job: Job, status: int = 200) -> JsonResponse:
+    return JsonResponse(
+        {
+            "id": job.id,
+            "status": job.status,
+            "filename": job.filename,
+            "error": job.error,
+            "status_url": reverse("job-status", args=(job.id,)),
+            "download_url": reverse("job-download", args=(job.id,)) if job.status == JobStatus.DONE else None,
+        },
+        status=status,
+    )
+
+
+def export_source_job(
+    source: str,
+    target_filename: str,
+    batch_booking: BatchBooking,
+    execution_date: date | None,
+) -> tuple[str, str]:
+    # Takes the path of the upload first, as passed by `submit_job`
+    return target_filename, export_source_file(source, batch_booking, execution_date)
+
+
+@api_view
+def sepa(request):
+    """
+    Queue a pain.001 credit transfer of a source sheet uploaded as `source-file`, converted without a preview, with
+    optional `batch-booking` and `execution-date` form fields.
+    """
+    source_file = request.FILES["source-file"]
+    execution_date = request.POST.get("execution-date")
+
+    return job_response(
+        submit_job(
+            export_source_job,
+            get_target_filename(source_file.name),
+            BatchBooking(request.POST.get("batch-booking", BatchBooking.FALSE)),
+            date.fromisoformat(execution_date) if execution_date else None,
+            upload=source_file,
+        ),
+        status=202,
+    )
+
+
+@api_view
+def datev(request):
+    """
+    Queue a Personio to DATEV conversion, taking the same form fields and upload as the `personio-datev` form.
+    """
+    datev_settings = get_datev_settings(request)
+    return job_response(
+        submit_job(export_personio_to_datev, datev_settings, upload=request.FILES["personio-file"]),
+        status=202,
+    )
+
+
+def get_job_or_404(job_id: str) -> Job:
+    if (job := get_job(job_id)) is None:
+        raise Http404("No such job")
+    return job
+
+
+@require_GET
+def status(request, job_id: str):
+    return job_response(get_job_or_404(job_id))
+
+
+@require_GET
+def download(request, job_id: str):
+    job = get_job_or_404(job_id)
+    if job.status != JobStatus.DONE:
+        return JsonResponse({"error": f"Job is {job.status}"}, status=409)
+
+    response = FileResponse(open_job_result(job), content_type="application/octet-stream")
+    response["Content-Disposition"] = "attachment; filename=%s" % smart_str(job.filename)
+
+    return response
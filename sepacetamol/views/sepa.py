@@ -1,14 +1,36 @@
-from dataclasses import dataclass
-from enum import StrEnum, auto, unique
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from copy import copy
+from dataclasses import dataclass, replace
+from datetime import date
+from decimal import Decimal
+from functools import partial
+from math import ceil
+from pathlib import PurePosixPath
+from tempfile import SpooledTemporaryFile
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages as message
 from django.core.exceptions import SuspiciousOperation
-from django.http import HttpResponse, HttpResponseBadRequest
+from django.http import FileResponse, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import render
 from django.utils import timezone
 from django.utils.encoding import smart_str
-from openpyxl import load_workbook
-from schwifty import IBAN
-from sepaxml import SepaTransfer
+from django.views.decorators.http import require_GET
+from sepaxml.validation import ValidationError
+
+from ..batch import convert_all, iter_batch_zip
+from ..cache import get_cache_key, get_file_digest, is_enabled, load_object, lookup, store, store_object
+from ..drafts import load_draft, save_draft
+from ..history import find_exported, get_payment_digest, record_exported
+from ..iban import resolve_iban
+from ..metrics import add_rows, stage
+from ..pain import BatchBooking, CreditTransferWriter, Payment, PaymentStore, split_payments, to_cents
+from ..processes import open_result, open_upload, run_in_process, share_upload, write_result
+from ..readers import iter_rows
+from ..validation import get_executor, iter_validated, validate
+
+PREVIEW_PAGE_SIZE = 100
 
 
 @dataclass
@@ -18,135 +40,486 @@ class Originator:
     bic: str
 
 
-@dataclass
-class Transaction:
-    name: str
-    iban: str
-    bic: str
-    amount: float
-    purpose: str
-    reference: str
+@dataclass(frozen=True)
+class Draft:
+    """
+    A parsed upload with its payments already resolved and converted to cents, as kept between preview and generate.
+    Loaded for the preview, it holds only the payments of the page shown.
+    """
 
+    source_filename: str
+    target_filename: str
+    digest: str  # of the upload, empty while the result cache is disabled
+    originator: Originator | None
+    count: int
+    total: int  # cents
+    payments: PaymentStore
+    duplicates: int = 0  # payments exported before
+
+
+def parse_source_rows(rows: Iterable[tuple]) -> tuple[Originator | None, PaymentStore]:
+    """
+    Read the originator and the payments of a source sheet, the amounts converted to cents exactly.
+    """
+    originator = None
+    payments = PaymentStore()
+
+    for row_number, row in enumerate(rows, start=1):
+        if row_number == 2:
+            name, iban, *_ = row
+            iban = resolve_iban(iban)
+            originator = Originator(name=name, iban=iban.formatted, bic=iban.bic)
+            continue
+
+        if row_number < 4 or not any(row):
+            continue
+
+        name, iban, amount, purpose, reference = row
+
+        if amount is None:
+            raise ValueError(f"Row {row_number} has no amount")
+
+        iban = resolve_iban(iban)
+        bic = iban.bic if iban.country_code == "DE" else ""
+
+        payments.append(
+            str(name).strip(),
+            iban.compact,
+            bic,
+            to_cents(amount),
+            str(purpose).strip(),
+            str(reference if reference is not None else "").strip() or "NOTPROVIDED",
+        )
+
+    return originator, payments
+
+
+def parse_source_file(source: str | bytes) -> tuple[Originator | None, PaymentStore]:
+    with open_upload(source) as file:
+        return parse_source_rows(iter_rows(file))
+
+
+def save_sepa_draft(draft: Draft) -> str:
+    # Plain tuples pickle far smaller than the dataclasses they are rebuilt into
+    originator = draft.originator
+    return save_draft(
+        (
+            draft.source_filename,
+            draft.target_filename,
+            draft.digest,
+            (originator.name, originator.iban, originator.bic) if originator is not None else None,
+            draft.count,
+            draft.total,
+            draft.duplicates,
+        ),
+        draft.payments.rows(),
+        page_size=PREVIEW_PAGE_SIZE,
+    )
+
+
+def load_sepa_draft(token: str, page: int | None = None) -> Draft | None:
+    if (data := load_draft(token, page)) is None:
+        return None
+
+    (source_filename, target_filename, digest, originator, count, total, duplicates), payments = data
+
+    return Draft(
+        source_filename=source_filename,
+        target_filename=target_filename,
+        digest=digest,
+        originator=Originator(*originator) if originator is not None else None,
+        count=count,
+        total=total,
+        payments=PaymentStore.from_rows(payments),
+        duplicates=duplicates,
+    )
+
+
+def get_target_filename(source_filename: str) -> str:
+    return PurePosixPath(source_filename).with_suffix(".xml").name
+
+
+def to_euros(cents: int) -> Decimal:
+    return Decimal(cents).scaleb(-2)
 
-def parse_iban(iban: str) -> IBAN:
-    try:
-        return IBAN(iban)
-    except ValueError as e:
-        raise SuspiciousOperation(e) from e
+
+def render_index(request, draft: Draft | None = None, token: str | None = None, page: int = 1):
+    """
+    Render the summary of a draft and a single page of its payments, so that the response does not grow with the
+    number of rows in the sheet. Payments of the page that were exported before are flagged with the time of export.
+    """
+    pages = max(1, ceil(draft.count / PREVIEW_PAGE_SIZE)) if draft is not None else 1
+    first = (page - 1) * PREVIEW_PAGE_SIZE + 1
+
+    if draft is not None and draft.duplicates:
+        digests = [get_payment_digest(payment) for payment in draft.payments]
+        exported = find_exported(digests)
+        exported_at = [exported.get(digest) for digest in digests]
+    else:
+        exported_at = [None] * (len(draft.payments) if draft is not None else 0)
+
+    with stage("render"):
+        return render(
+            request,
+            "index.html",
+            {
+                "draft": draft,
+                "token": token,
+                "grand_total": to_euros(draft.total) if draft is not None else None,
+                "rows": [
+                    (number, payment, to_euros(payment.amount), payment_exported_at)
+                    for number, payment, payment_exported_at in zip(
+                        range(first, first + len(exported_at)),
+                        draft.payments,
+                        exported_at,
+                    )
+                ]
+                if draft is not None
+                else [],
+                "page": page,
+                "pages": pages,
+                "previous_page": page - 1 if page > 1 else None,
+                "next_page": page + 1 if page < pages else None,
+            },
+        )
+
+
+def get_upload_digest(source_file) -> str:
+    # Only addresses the cache, so uploads are not hashed for nothing while it is disabled
+    return get_file_digest(source_file) if is_enabled() else ""
+
+
+def get_preview_cache_key(digest: str) -> str:
+    return get_cache_key("sepa-preview", digest)
+
+
+def preview_response(request, source_file, digest: str, preview: tuple[Originator | None, PaymentStore]):
+    originator, payments = preview
+    add_rows(len(payments))
+
+    digests = [get_payment_digest(payment) for payment in payments]
+    with stage("history"):
+        exported = find_exported(digests)
+
+    draft = Draft(
+        source_filename=source_file.name,
+        target_filename=get_target_filename(source_file.name),
+        digest=digest,
+        originator=originator,
+        count=len(payments),
+        total=payments.total,
+        payments=payments,
+        # Payments, not fingerprints: a sheet paying the same twice over has both flagged
+        duplicates=sum(digest in exported for digest in digests),
+    )
+    token = save_sepa_draft(draft)
+
+    return render_index(request, replace(draft, payments=payments[:PREVIEW_PAGE_SIZE]), token)
 
 
 def index(request):
-    source_file = request.FILES["source-file"] if request.method == "POST" else None
+    if request.method != "POST":
+        return render_index(request)
 
-    originator = None
-    transactions = []
-
-    if request.method == "POST":
-        worksheet = load_workbook(source_file).active
-
-        (name, iban, *_), *_ = worksheet.iter_rows(min_row=2, max_row=2, values_only=True)
-        originator = Originator(name=name, iban=parse_iban(iban).formatted, bic=parse_iban(iban).bic.compact)
-
-        for row in worksheet.iter_rows(min_row=4, values_only=True):
-            if not any(row):
-                continue
-
-            name, iban, amount, purpose, reference = row
-
-            iban = parse_iban(iban)
-            bic = str(iban.bic) if iban.country_code == "DE" else ""
-
-            transactions.append(
-                Transaction(
-                    name=name,
-                    iban=iban.compact,
-                    bic=bic,
-                    amount=amount,
-                    purpose=purpose,
-                    reference=reference if reference is not None else "",
-                ),
-            )
-
-    source_filename = source_file.name if source_file is not None else None
-    target_filename = source_filename.replace(".xlsx", ".xml") if source_filename is not None else None
-
-    return render(
-        request,
-        "index.html",
-        {
-            "source_filename": source_filename,
-            "target_filename": target_filename,
-            "originator": originator,
-            "transactions": transactions,
-            "grand_total": sum(transaction.amount for transaction in transactions),
-        },
+    source_file = request.FILES["source-file"]
+
+    digest = get_upload_digest(source_file)
+    cache_key = get_preview_cache_key(digest)
+    if (preview := load_object(cache_key)) is None:
+        try:
+            preview = parse_source_rows(iter_rows(source_file))
+        except (ValueError, SuspiciousOperation) as e:
+            message.error(request, e)
+            return render_index(request)
+        store_object(cache_key, preview)
+
+    return preview_response(request, source_file, digest, preview)
+
+
+async def async_index(request):
+    if request.method != "POST":
+        return render_index(request)
+
+    source_file = request.FILES["source-file"]
+
+    # Hashing the upload, the cache and the draft store all do file I/O, kept off the event loop like the parsing
+    digest = await sync_to_async(get_upload_digest)(source_file)
+    cache_key = get_preview_cache_key(digest)
+    if (preview := await sync_to_async(load_object)(cache_key)) is None:
+        try:
+            with stage("process"):
+                preview = await run_in_process(parse_source_file, share_upload(source_file))
+        except (ValueError, SuspiciousOperation) as e:
+            message.error(request, e)
+            return render_index(request)
+        await sync_to_async(store_object)(cache_key, preview)
+
+    return await sync_to_async(preview_response)(request, source_file, digest, preview)
+
+
+@require_GET
+def preview(request, token: str):
+    try:
+        page = max(1, int(request.GET.get("page", 1)))
+    except ValueError:
+        page = 1
+
+    if (draft := load_sepa_draft(token, page)) is None:
+        return draft_expired_response(request)
+
+    return render_index(request, draft, token, page)
+
+
+def check_originator(originator: Originator | None):
+    assert originator is not None and resolve_iban(originator.iban).country_code == "DE", (
+        "only German originator IBANs are supported"
     )
 
 
-@unique
-class BatchBooking(StrEnum):
-    TRUE = auto()
-    FALSE = auto()
-    SINGLE = auto()
+def get_generate_cache_key(draft: Draft, batch_booking: BatchBooking) -> str:
+    # The execution date defaults to the current day, so that a cached document never carries a past one
+    return get_cache_key("sepa-xml", draft.digest, draft.target_filename, batch_booking, timezone.now().date())
+
+
+def cached_credit_transfer_response(cache_key: str) -> FileResponse | None:
+    if (cached := lookup(cache_key)) is None:
+        return None
+
+    response = FileResponse(cached.file, content_type="application/xml")
+    response["Content-Disposition"] = "attachment; filename=%s" % smart_str(cached.meta["filename"])
+
+    return response
+
+
+def parse_generate_draft(request) -> tuple[Draft | None, BatchBooking]:
+    draft = load_sepa_draft(request.POST["draft"])
+    batch_booking = BatchBooking(request.POST["batch-booking"])
+
+    if draft is not None:
+        check_originator(draft.originator)
+        add_rows(len(draft.payments))
+
+    return draft, batch_booking
+
+
+def record_draft(draft: Draft):
+    with stage("history"):
+        record_exported(get_payment_digest(payment) for payment in draft.payments)
+
+
+def draft_expired_response(request):
+    message.error(request, "The imported transactions have expired, please upload the file again.")
+    return render_index(request)
 
 
 def generate(request):
     if request.method != "POST":
         return HttpResponseBadRequest
 
-    target_filename = request.POST["target-filename"]
-    batch_booking = BatchBooking(request.POST["batch-booking"])
+    draft, batch_booking = parse_generate_draft(request)
+    if draft is None:
+        return draft_expired_response(request)
 
-    originator = Originator(
-        *[request.POST[field].strip() for field in ("originator-name", "originator-iban", "originator-bic")],
-    )
+    cache_key = get_generate_cache_key(draft, batch_booking)
+    if (response := cached_credit_transfer_response(cache_key)) is not None:
+        return response
+
+    try:
+        response = credit_transfer_response(
+            draft.originator,
+            batch_booking,
+            draft.payments,
+            draft.target_filename,
+            cache_key=cache_key,
+            on_success=partial(record_draft, draft),
+        )
+    except (ValueError, ValidationError) as e:
+        message.error(request, e)
+        return render_index(request)
+
+    return response
+
+
+def export_document(writer: CreditTransferWriter, payments: Sequence[Payment]) -> str:
+    # The writer is passed whole, with the limits it was configured with in the requesting process
+    _, path = write_result(partial(validate, writer.iter_chunks(payments)))
+
+    return path
+
+
+async def async_generate(request):
+    if request.method != "POST":
+        return HttpResponseBadRequest
+
+    draft, batch_booking = await sync_to_async(parse_generate_draft)(request)
+    if draft is None:
+        return draft_expired_response(request)
+
+    cache_key = get_generate_cache_key(draft, batch_booking)
+    if (response := await sync_to_async(cached_credit_transfer_response)(cache_key)) is not None:
+        return response
+
+    try:
+        # Walks all payments, off the event loop like the export itself
+        files = await sync_to_async(split_credit_transfer)(draft.originator, batch_booking, draft.payments)
+        if len(files) > 1:
+            # Waits for every document of the run to be validated on the pool
+            response = await sync_to_async(split_credit_transfer_response)(files, draft.target_filename)
+        else:
+            with stage("process"):
+                path = await run_in_process(export_document, *files[0])
+    except (ValueError, ValidationError) as e:
+        message.error(request, e)
+        return render_index(request)
+
+    if len(files) == 1:
+        contents = open_result(path)
+        await sync_to_async(store)(cache_key, contents, {"filename": draft.target_filename})
 
-    iban = parse_iban(originator.iban)
-    assert iban.country_code == "DE", "only German originator IBANs are supported"
-
-    sepa = SepaTransfer(
-        {
-            "name": originator.name,
-            "IBAN": str(iban),
-            "BIC": originator.bic,
-            "batch": batch_booking != BatchBooking.SINGLE,
-            "currency": "EUR",
-        },
-        clean=True,
+        response = FileResponse(contents, content_type="application/xml")
+        response["Content-Disposition"] = "attachment; filename=%s" % smart_str(draft.target_filename)
+
+    await sync_to_async(record_draft)(draft)
+
+    return response
+
+
+def export_source_file(source: str | bytes, batch_booking: BatchBooking, execution_date: date | None = None) -> str:
+    """
+    Convert a source sheet straight to a validated pain.001 document, skipping the preview, and return its path.
+    """
+    originator, payments = parse_source_file(source)
+
+    if originator is None or resolve_iban(originator.iban).country_code != "DE":
+        raise ValueError("only German originator IBANs are supported")
+
+    chunks = get_credit_transfer_writer(originator, batch_booking, execution_date).iter_chunks(payments)
+    _, path = write_result(partial(validate, chunks))
+
+    return path
+
+
+def get_credit_transfer_writer(
+    originator: Originator,
+    batch_booking: BatchBooking,
+    execution_date: date | None = None,
+) -> CreditTransferWriter:
+    return CreditTransferWriter(
+        name=originator.name,
+        iban=resolve_iban(originator.iban).compact,
+        bic=originator.bic,
+        batch_booking=batch_booking,
+        execution_date=execution_date if execution_date is not None else timezone.now().date(),
+        max_block_transactions=settings.SEPA_MAX_BLOCK_TRANSACTIONS,
+        max_block_amount=settings.SEPA_MAX_BLOCK_AMOUNT,
     )
 
-    for name, iban, bic, amount, purpose, reference in zip(
-        *(
-            (field.strip() for field in request.POST.getlist(item))
-            for item in (
-                "transaction-name",
-                "transaction-iban",
-                "transaction-bic",
-                "transaction-amount",
-                "transaction-purpose",
-                "transaction-reference",
-            )
-        ),
-    ):
-        sepa.add_payment(
-            {
-                "name": name,
-                "IBAN": str(parse_iban(iban)),
-                "BIC": bic,
-                "amount": int(float(amount) * 100),  # cents
-                "description": purpose,
-                "execution_date": timezone.now().date(),
-                "endtoend_id": reference if reference != "" else "NOTPROVIDED",
-            },
+
+def split_credit_transfer(
+    originator: Originator,
+    batch_booking: BatchBooking,
+    payments: Sequence[Payment],
+    execution_date: date | None = None,
+) -> list[tuple[CreditTransferWriter, Sequence[Payment]]]:
+    """
+    Split payments beyond the per-file limits into several documents, each with a writer of its own. The documents
+    share their creation time, and their message IDs differ only by a numeric suffix.
+    """
+    files = split_payments(payments, settings.SEPA_MAX_FILE_TRANSACTIONS, settings.SEPA_MAX_FILE_AMOUNT)
+    writer = get_credit_transfer_writer(originator, batch_booking, execution_date)
+
+    if len(files) == 1:
+        return [(writer, payments)]
+
+    writers = []
+    for index, file_payments in enumerate(files, start=1):
+        file_writer = copy(writer)
+        file_writer.msg_id = f"{writer.msg_id}-{index}"
+        writers.append((file_writer, file_payments))
+
+    return writers
+
+
+def get_split_filename(target_filename: str, index: int, count: int) -> str:
+    path = PurePosixPath(target_filename)
+    return f"{path.stem}-{index:0{len(str(count))}d}{path.suffix}"
+
+
+def export_split_file(
+    target_filename: str,
+    writer: CreditTransferWriter,
+    payments: Sequence[Payment],
+) -> tuple[str, str]:
+    return target_filename, export_document(writer, payments)
+
+
+def split_credit_transfer_response(
+    files: list[tuple[CreditTransferWriter, Sequence[Payment]]],
+    target_filename: str,
+) -> StreamingHttpResponse:
+    """
+    Generate and validate the documents of a split credit transfer on the process pool, all of them before the ZIP
+    is streamed, so that a run any part of which is invalid is rejected as a whole.
+    """
+    with stage("export"):
+        results = convert_all(
+            export_split_file,
+            (
+                (get_split_filename(target_filename, index, len(files)), writer, payments)
+                for index, (writer, payments) in enumerate(files, start=1)
+            ),
         )
 
-    contents = sepa.export(validate=True)
+    response = StreamingHttpResponse(iter_batch_zip(results), content_type="application/zip")
+    response["Content-Disposition"] = "attachment; filename=%s" % smart_str(
+        PurePosixPath(target_filename).with_suffix(".zip").name,
+    )
+
+    return response
+
+
+def iter_then(chunks: Iterable[bytes], callback: Callable[[], object]) -> Iterator[bytes]:
+    yield from chunks
+    callback()
+
+
+def credit_transfer_response(
+    originator: Originator,
+    batch_booking: BatchBooking,
+    payments: Sequence[Payment],
+    target_filename: str,
+    execution_date: date | None = None,
+    cache_key: str | None = None,
+    on_success: Callable[[], object] = lambda: None,
+) -> StreamingHttpResponse:
+    """
+    Generate and validate a credit transfer, or the ZIP of its documents if it is split. `on_success` is called once
+    all of it is known to be valid: before returning, or after the last chunk when validated as it is streamed.
+    """
+    files = split_credit_transfer(originator, batch_booking, payments, execution_date)
+    if len(files) > 1:
+        response = split_credit_transfer_response(files, target_filename)
+        on_success()
+        return response
+
+    [(writer, payments)] = files
+    chunks = writer.iter_chunks(payments)
+
+    if settings.SEPA_STREAM_VALIDATION:
+        response = StreamingHttpResponse(iter_then(iter_validated(chunks), on_success), content_type="application/xml")
+    else:
+        # The document is spooled rather than kept in memory, so that it can be validated before the first byte is sent
+        contents = SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        with stage("export"):
+            get_executor().submit(validate, chunks, contents).result()
+        contents.seek(0)
+
+        if cache_key is not None:
+            store(cache_key, contents, {"filename": target_filename})
 
-    if batch_booking == BatchBooking.FALSE:
-        contents = contents.replace(b"<BtchBookg>true", b"<BtchBookg>false")
+        response = FileResponse(contents, content_type="application/xml")
+        on_success()
 
-    response = HttpResponse(content_type="application/xml")
     response["Content-Disposition"] = "attachment; filename=%s" % smart_str(target_filename)
-    response.write(contents)
 
     return response
@@ -0,0 +1,109 @@
+import json
+
+from django.test import SimpleTestCase
+from django.urls import reverse
+
+from sepacetamol.views.test_sepa import ORIGINATOR_BIC, RECIPIENT_BIC
+
+ORIGINATOR_QUERY = "originator-name=honeymeets+continuity+GmbH&originator-iban=DE02120300000000202051"
+
+PAYMENTS = [
+    {"name": "CANCOM1 GmbH", "iban": "DE17 7204 0046 0112 9212 00", "amount": 123, "purpose": "Auftrag 1"},
+    {
+        "name": "CANCOM2 GmbH",
+        "iban": "DE17720400460112921200",
+        "bic": RECIPIENT_BIC,
+        "amount": "1.123,45",
+        "purpose": "Auftrag 2",
+        "reference": "Kdn. 1234567",
+    },
+]
+
+BOOKINGS_CSV = """Datum;Umsatz;S/H;Gegenkonto;Konto;Belegfeld 1;Buchungstext
+01.06.2023;-123,45;S;4120;1755;202306;Festbezug Gehaelter
+02.06.2023;1.000,00;;4120;1755;202306;Festbezug Gehaelter
+"""
+
+
+class TestApi(SimpleTestCase):
+    def post(self, name: str, query: str, data: str, content_type: str):
+        return self.client.post(f"{reverse(name)}?{query}", data, content_type=content_type, secure=True)
+
+    def assert_credit_transfer(self, response):
+        self.assertEqual(200, response.status_code, response.content if not response.streaming else None)
+
+        contents = b"".join(response.streaming_content)
+
+        self.assertIn(b"<NbOfTxs>2</NbOfTxs><CtrlSum>1246.45</CtrlSum>", contents)
+        self.assertIn(f"<DbtrAgt><FinInstnId><BIC>{ORIGINATOR_BIC}</BIC>".encode(), contents)
+        self.assertEqual(2, contents.count(f"<CdtrAgt><FinInstnId><BIC>{RECIPIENT_BIC}</BIC>".encode()))
+        self.assertIn(b"<ReqdExctnDt>2024-01-31</ReqdExctnDt>", contents)
+
+    def test_sepa_json(self):
+        self.assert_credit_transfer(
+            self.post(
+                "api-v1-sepa",
+                f"{ORIGINATOR_QUERY}&execution-date=2024-01-31",
+                json.dumps(PAYMENTS),
+                "application/json",
+            ),
+        )
+
+    def test_sepa_ndjson(self):
+        self.assert_credit_transfer(
+            self.post(
+                "api-v1-sepa",
+                f"{ORIGINATOR_QUERY}&execution-date=2024-01-31",
+                "\n".join(json.dumps(payment) for payment in PAYMENTS),
+                "application/x-ndjson",
+            ),
+        )
+
+    def test_sepa_csv(self):
+        self.assert_credit_transfer(
+            self.post(
+                "api-v1-sepa",
+                f"{ORIGINATOR_QUERY}&execution-date=2024-01-31",
+                "name;iban;bic;amount;purpose;reference\n"
+                'CANCOM1 GmbH;DE17 7204 0046 0112 9212 00;;123;"Auftrag 1";\n'
+                f"CANCOM2 GmbH;DE17720400460112921200;{RECIPIENT_BIC};1.123,45;Auftrag 2;Kdn. 1234567\n",
+                "text/csv",
+            ),
+        )
+
+    def test_sepa_thousands(self):
+        # Read like the same amount in an uploaded CSV file
+        for data, content_type in (
+            (json.dumps([{**PAYMENTS[0], "amount": "1.234"}]), "application/json"),
+            ("name;iban;amount;purpose\nCANCOM1 GmbH;DE17720400460112921200;1.234;Auftrag 1\n", "text/csv"),
+        ):
+            with self.subTest(content_type=content_type):
+                response = self.post("api-v1-sepa", ORIGINATOR_QUERY, data, content_type)
+
+                self.assertEqual(200, response.status_code)
+                self.assertIn(b"<CtrlSum>1234.00</CtrlSum>", b"".join(response.streaming_content))
+
+    def test_sepa_errors(self):
+        for query, data, content_type, status_code in (
+            (ORIGINATOR_QUERY, "<xml/>", "application/xml", 415),
+            (ORIGINATOR_QUERY, json.dumps([{**PAYMENTS[0], "iban": "DE00"}]), "application/json", 400),
+            (ORIGINATOR_QUERY, json.dumps([{**PAYMENTS[0], "amount": "abc"}]), "application/json", 400),
+            ("originator-name=x", json.dumps(PAYMENTS), "application/json", 400),
+        ):
+            with self.subTest(data=data):
+                response = self.post("api-v1-sepa", query, data, content_type)
+                self.assertEqual(status_code, response.status_code)
+                self.assertIn("error", response.json())
+
+    def test_datev_csv(self):
+        response = self.post("api-v1-datev", "consultant-number=1001&client-number=99", BOOKINGS_CSV, "text/csv")
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("attachment; filename=EXTF_Personio-2023-06.csv", response["Content-Disposition"])
+        self.assertEqual(
+            [
+                '"123,45";"H";;;;;1755;4120;;"0106";"202306";;;"Festbezug Gehaelter";',
+                '"1000,00";"S";;;;;1755;4120;;"0206";"202306";;;"Festbezug Gehaelter";',
+            ],
+            b"".join(response.streaming_content).decode("cp1252").split("\r\n")[2:],
+        )
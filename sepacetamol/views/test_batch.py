@@ -0,0 +1,75 @@
+import json
+import zipfile
+from io import BytesIO
+
+from django.test import SimpleTestCase
+from django.urls import reverse
+
+from sepacetamol.test_readers import make_workbook
+from sepacetamol.views.test_jobs import PERSONIO_ROWS
+from sepacetamol.views.test_sepa import TEMPLATE_PATH
+
+
+def make_archive(files: dict[str, bytes], manifest: dict | None = None) -> BytesIO:
+    archive = BytesIO()
+    with zipfile.ZipFile(archive, "w") as archive_zip:
+        for name, data in files.items():
+            archive_zip.writestr(name, data)
+        if manifest is not None:
+            archive_zip.writestr("settings.json", json.dumps(manifest))
+    archive.seek(0)
+    archive.name = "batch.zip"
+    return archive
+
+
+class TestBatch(SimpleTestCase):
+    def setUp(self):
+        settings = self.settings(CONVERSION_PROCESSES=1)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def post(self, name: str, archive: BytesIO, **fields) -> zipfile.ZipFile:
+        response = self.client.post(reverse(name), {"archive": archive, **fields}, secure=True)
+
+        self.assertEqual(200, response.status_code, response.content if not response.streaming else None)
+        self.assertEqual("attachment; filename=batch.zip", response["Content-Disposition"])
+
+        return zipfile.ZipFile(BytesIO(b"".join(response.streaming_content)))
+
+    def test_datev(self):
+        personio = make_workbook(*PERSONIO_ROWS).getvalue()
+
+        output = self.post(
+            "batch-datev",
+            make_archive(
+                {"entity-a.xlsx": personio, "entity-b.xlsx": personio, "broken.xlsx": b"PK\x03\x04broken"},
+                manifest={"entity-b.xlsx": {"client-number": "4321"}},
+            ),
+            **{"consultant-number": "1234", "client-number": "5678"},
+        )
+
+        self.assertEqual(
+            ["broken.xlsx.error.txt", "entity-a/EXTF_Personio-2023-06.csv", "entity-b/EXTF_Personio-2023-06.csv"],
+            sorted(output.namelist()),
+        )
+        self.assertIn(b";1234;5678;", output.read("entity-a/EXTF_Personio-2023-06.csv"))
+        self.assertIn(b";1234;4321;", output.read("entity-b/EXTF_Personio-2023-06.csv"))
+        self.assertEqual(
+            b"Personio file could not be loaded, please check the format",
+            output.read("broken.xlsx.error.txt"),
+        )
+
+    def test_sepa(self):
+        output = self.post(
+            "batch-sepa",
+            make_archive({"runs/march.xlsx": TEMPLATE_PATH.read_bytes()}),
+            **{"batch-booking": "true", "execution-date": "2024-01-31"},
+        )
+
+        self.assertEqual(["runs/march.xml"], output.namelist())
+
+        contents = output.read("runs/march.xml")
+
+        self.assertIn(b"<NbOfTxs>3</NbOfTxs><CtrlSum>369.57</CtrlSum>", contents)
+        self.assertIn(b"<BtchBookg>true</BtchBookg>", contents)
+        self.assertIn(b"<ReqdExctnDt>2024-01-31</ReqdExctnDt>", contents)
@@ -1,15 +1,42 @@
-from datetime import date
+import os
+import zipfile
+from datetime import date, datetime
+from io import BytesIO
 from unittest import TestCase
 
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from sepacetamol.test_readers import make_workbook
 from sepacetamol.views.datev import (
     DatevBooking,
     DatevHeader,
+    DatevSettings,
     date_to_datev,
+    export_personio_to_datev,
     float_to_german,
     get_datev_booking_from_personio,
-    unquote_empty_csv_strings,
+    group_by_period,
+    iter_datev_csv,
+    parse_personio_rows,
+    quote_datev_value,
 )
 
+PERSONIO_HEADER = ("Datum", "Umsatz", "S/H", "Gegenkonto", "Konto", "Belegfeld 1", "Buchungstext")
+
+# Bookings of two months, out of order
+PERSONIO_PERIODS_ROWS = (
+    PERSONIO_HEADER,
+    ("01.07.2023", 20, "S", 4120, 1755, "202307", "Festbezug Gehaelter"),
+    ("01.06.2023", 10, "S", 4120, 1755, "202306", "Festbezug Gehaelter"),
+    ("15.07.2023", 30, "S", 4120, 1755, "202307", "Festbezug Gehaelter"),
+)
+
+
+def read_periods(contents: bytes) -> dict[str, bytes]:
+    with zipfile.ZipFile(BytesIO(contents)) as archive:
+        return {name: archive.read(name) for name in archive.namelist()}
+
 
 class TestDatev(TestCase):
     maxDiff = None
@@ -17,8 +44,11 @@ class TestDatev(TestCase):
     def test_float_to_german(self):
         self.assertEqual("1234567,89", float_to_german(1234567.89))
 
-    def test_csv_unquoting(self):
-        self.assertEqual(";;;;;;;;;", unquote_empty_csv_strings(';;;"";"";;;;"";""'))
+    def test_quote_datev_value(self):
+        self.assertEqual(
+            ["", "", "1", "2.5", '"a;"";b"'],
+            [quote_datev_value(value) for value in (None, "", 1, 2.5, 'a;";b')],
+        )
 
     def test_date_to_datev(self):
         self.assertEqual("20200101", date_to_datev(date(2020, 1, 1)))
@@ -26,7 +56,7 @@ class TestDatev(TestCase):
     def test_header_serialization(self):
         output_csv = (
             """
-            "EXTF";700;21;"Buchungsstapel";9;;;"RE";"MaxMuster";"";1001;99999;20200101;4;20200301;20200331;"Rechnungen März 2020";"";1;;0;"EUR";;;;;"03";;;"";""
+            "EXTF";700;21;"Buchungsstapel";9;;;"RE";"MaxMuster";;1001;99999;20200101;4;20200301;20200331;"Rechnungen März 2020";;1;;0;"EUR";;;;;"03";;;;
             """  # noqa: E501
         ).strip()
 
@@ -49,14 +79,14 @@ class TestDatev(TestCase):
             locking=0,
             gl_chart_of_accounts="03",
         )
-        self.assertEqual(unquote_empty_csv_strings(output_csv.strip()), input_obj.model_dump_csv().strip())
+        self.assertEqual(output_csv, input_obj.model_dump_csv())
 
     def test_booking_serialization(self):
         output_csv_header = """
             "Umsatz";"Soll-/Haben-Kennzeichen";"WKZ Umsatz";"Kurs";"Basisumsatz";"WKZ Basisumsatz";"Konto";"Gegenkonto (ohne BU-Schlüssel)";"BU-Schlüssel";"Belegdatum";"Belegfeld 1";"Belegfeld 2";"Skonto";"Buchungstext";"Postensperre"
         """  # noqa: E501
         output_csv_line = """
-            "123,45";"H";"EUR";;;"";1755;4120;"";"0104";"202304";"";;"Festbezug Gehaelter";
+            "123,45";"H";"EUR";;;;1755;4120;;"0104";"202304";;;"Festbezug Gehaelter";
         """
 
         input_obj = DatevBooking(
@@ -71,7 +101,7 @@ class TestDatev(TestCase):
         )
 
         self.assertEqual(output_csv_header.strip(), input_obj.model_dump_csv_header().strip())
-        self.assertEqual(unquote_empty_csv_strings(output_csv_line.strip()), input_obj.model_dump_csv().strip())
+        self.assertEqual(output_csv_line.strip(), input_obj.model_dump_csv())
 
     def test_personio_to_datev_booking(self):
         mock_booking = {
@@ -99,3 +129,227 @@ class TestDatev(TestCase):
             ),
             get_datev_booking_from_personio(mock_booking),
         )
+
+    def test_parse_personio_rows(self):
+        rows = (
+            ("Datum ", "Umsatz", "S/H", "Gegenkonto", "Konto", "Buchungstext", "Beleg Feld 1"),
+            (" 01.06.2023", -10.5, None, 4120, 1755, " Festbezug Gehaelter ", 202306.0),
+            (datetime(2023, 6, 2), 20, "H", "4120", "1755", "x" * 61, "202306"),
+            ("01.06.2023", -30, "H", 4120, 1755, "Festbezug Gehaelter"),
+        )
+
+        self.assertEqual(
+            (
+                (date(2023, 6, 1), "10,50", "H", "0106", "202306", "Festbezug Gehaelter"),
+                (date(2023, 6, 2), "20,00", "H", "0206", "202306", "x" * 57 + "..."),
+                (date(2023, 6, 1), "30,00", "S", "0106", None, "Festbezug Gehaelter"),
+            ),
+            tuple(
+                (
+                    datum,
+                    booking["umsatz"],
+                    booking["soll_haben_kz"],
+                    booking["belegdatum"],
+                    booking["belegfeld_1"],
+                    booking["buchungstext"],
+                )
+                for datum, booking in parse_personio_rows(rows)
+            ),
+        )
+
+    def test_datev_csv(self):
+        header = DatevHeader(
+            flag="EXTF",
+            format_category=21,
+            format_name="Buchungsstapel",
+            format_version=9,
+            consultant_number=1001,
+            client_numer=99999,
+            business_year_start=20230101,
+            gl_account_length=4,
+            date_from=20230601,
+            date_till=20230630,
+            designation="Lohnbuchungen 2023-06",
+            locking=0,
+            gl_chart_of_accounts="03",
+        )
+        bookings = [
+            DatevBooking(
+                umsatz=f"{i},00",
+                soll_haben_kz="S",
+                konto=1755,
+                gegenkonto=4120,
+                belegdatum="0106",
+                buchungstext="Gehälter",
+            )
+            for i in range(1, 2500)
+        ]
+
+        self.assertEqual(
+            "\r\n".join(
+                (
+                    header.model_dump_csv(),
+                    DatevBooking.model_dump_csv_header(),
+                    *(booking.model_dump_csv() for booking in bookings),
+                ),
+            ).encode("cp1252"),
+            b"".join(iter_datev_csv(header, bookings)),
+        )
+
+    def test_group_by_period(self):
+        bookings_data = [(date(2023, 7, 1), "a"), (date(2023, 6, 30), "b"), (date(2023, 7, 31), "c")]
+
+        self.assertEqual(
+            [
+                (date(2023, 6, 1), [(date(2023, 6, 30), "b")]),
+                (date(2023, 7, 1), [(date(2023, 7, 1), "a"), (date(2023, 7, 31), "c")]),
+            ],
+            group_by_period(bookings_data),
+        )
+        self.assertEqual([], group_by_period([]))
+
+    def test_export_periods(self):
+        target_filename, path = export_personio_to_datev(
+            make_workbook(*PERSONIO_PERIODS_ROWS).getvalue(),
+            DatevSettings(consultant_number=1234, client_numer=5678),
+        )
+        self.addCleanup(os.unlink, path)
+
+        with open(path, "rb") as archive:
+            periods = read_periods(archive.read())
+
+        self.assertEqual("EXTF_Personio-2023-06_2023-07.zip", target_filename)
+        self.assertEqual(["EXTF_Personio-2023-06.csv", "EXTF_Personio-2023-07.csv"], list(periods))
+        self.assertIn(b";20230601;20230630;", periods["EXTF_Personio-2023-06.csv"])
+        self.assertIn(b";20230701;20230731;", periods["EXTF_Personio-2023-07.csv"])
+        self.assertEqual(2, periods["EXTF_Personio-2023-07.csv"].count(b'"202307"'))
+
+    def test_booking_bulk_validation(self):
+        bookings = [
+            {
+                "umsatz": f"{i},00",
+                "soll_haben_kz": "H" if i % 2 else "S",
+                "konto": "1755",
+                "gegenkonto": 4120,
+                "belegdatum": "0106",
+                "buchungstext": "Festbezug Gehaelter",
+            }
+            for i in range(1, 10)
+        ]
+
+        self.assertEqual(
+            [DatevBooking(**booking) for booking in bookings],
+            DatevBooking.model_validate_many(bookings),
+        )
+
+        bookings[3] = {**bookings[3], "umsatz": "4.00"}
+
+        with self.assertRaises(ValueError) as context:
+            DatevBooking.model_validate_many(bookings)
+
+        self.assertEqual([(3, "umsatz")], [error["loc"] for error in context.exception.__cause__.errors()])
+        self.assertTrue(
+            str(context.exception).startswith(
+                "1 validation error for list[DatevBooking]\n3.umsatz: String should match"
+            ),
+        )
+
+    def test_booking_bulk_validation_errors_capped(self):
+        booking = {
+            "umsatz": "1.00",
+            "soll_haben_kz": "S",
+            "konto": "1755",
+            "gegenkonto": 4120,
+            "belegdatum": "0106",
+            "buchungstext": "Festbezug Gehaelter",
+        }
+
+        with self.assertRaises(ValueError) as context:
+            DatevBooking.model_validate_many([booking] * 25)
+
+        lines = str(context.exception).split("\n")
+
+        self.assertEqual(12, len(lines))
+        self.assertEqual("25 validation errors for list[DatevBooking]", lines[0])
+        self.assertTrue(lines[10].startswith("9.umsatz: "))
+        self.assertEqual("and 15 more", lines[11])
+
+
+@override_settings(
+    ROOT_URLCONF="sepacetamol.views.test_sepa",
+    CONVERSION_PROCESSES=1,
+    STORAGES={"staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}},
+)
+class TestAsyncIndex(SimpleTestCase):
+    async def convert(self, *rows: tuple):
+        personio_file = make_workbook(*rows)
+        personio_file.name = "personio.xlsx"
+
+        return await self.async_client.post(
+            reverse("personio-datev"),
+            {"consultant-number": "1234", "client-number": "5678", "personio-file": personio_file},
+            secure=True,
+        )
+
+    async def test_convert(self):
+        response = await self.convert(
+            ("Datum", "Umsatz", "S/H", "Gegenkonto", "Konto", "Belegfeld 1", "Buchungstext"),
+            ("01.06.2023", -12.5, "S", 4120, 1755, "202306", "Festbezug Gehaelter"),
+        )
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("attachment; filename=EXTF_Personio-2023-06.csv", response["Content-Disposition"])
+        self.assertTrue(
+            b"".join(response.streaming_content).endswith(
+                b'\r\n"12,50";"H";;;;;1755;4120;;"0106";"202306";;;"Festbezug Gehaelter";',
+            ),
+        )
+
+    async def test_convert_csv(self):
+        personio_file = BytesIO(
+            b"Datum;Umsatz;S/H;Gegenkonto;Konto;Belegfeld 1;Buchungstext\r\n"
+            b"01.06.2023;-1.012,50;S;4120;1755;202306;Festbezug Gehaelter\r\n",
+        )
+        personio_file.name = "personio.csv"
+
+        response = await self.async_client.post(
+            reverse("personio-datev"),
+            {"consultant-number": "1234", "client-number": "5678", "personio-file": personio_file},
+            secure=True,
+        )
+
+        self.assertEqual("attachment; filename=EXTF_Personio-2023-06.csv", response["Content-Disposition"])
+        self.assertTrue(
+            b"".join(response.streaming_content).endswith(
+                b'\r\n"1012,50";"H";;;;;1755;4120;;"0106";"202306";;;"Festbezug Gehaelter";',
+            ),
+        )
+
+    async def test_convert_periods(self):
+        response = await self.convert(*PERSONIO_PERIODS_ROWS)
+
+        self.assertEqual("attachment; filename=EXTF_Personio-2023-06_2023-07.zip", response["Content-Disposition"])
+
+        periods = read_periods(b"".join(response.streaming_content))
+
+        self.assertEqual(["EXTF_Personio-2023-06.csv", "EXTF_Personio-2023-07.csv"], sorted(periods))
+        self.assertIn(b'"Lohnbuchungen 2023-06"', periods["EXTF_Personio-2023-06.csv"])
+        self.assertTrue(periods["EXTF_Personio-2023-06.csv"].endswith(b';"0106";"202306";;;"Festbezug Gehaelter";'))
+        self.assertIn(b'"Lohnbuchungen 2023-07"', periods["EXTF_Personio-2023-07.csv"])
+
+    async def test_convert_periods_invalid(self):
+        response = await self.convert(
+            *PERSONIO_PERIODS_ROWS,
+            ("31.07.2023", 40, "S", 4120, 1755, "202307", "Festbezug \u2713"),
+        )
+
+        self.assertEqual(200, response.status_code)
+        self.assertFalse(response.streaming)
+        [error] = [str(message) for message in response.context["messages"]]
+        self.assertRegex(error, "^EXTF_Personio-2023-07.csv: 'charmap' codec can't encode")
+
+    async def test_convert_invalid(self):
+        response = await self.convert(("Datum", "Umsatz"), ("01.06.2023", 12.5))
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(["'S/H'"], [str(message) for message in response.context["messages"]])
@@ -0,0 +1,121 @@
+import time
+from contextlib import closing
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from django.conf import settings
+from django.test import SimpleTestCase
+from django.urls import reverse
+
+from sepacetamol.jobs import JobStatus, connect, fail_orphaned_jobs, get_job
+from sepacetamol.test_readers import make_workbook
+from sepacetamol.views.test_sepa import TEMPLATE_PATH
+
+PERSONIO_ROWS = (
+    ("Datum", "Umsatz", "S/H", "Gegenkonto", "Konto", "Belegfeld 1", "Buchungstext"),
+    ("01.06.2023", -12.5, "S", 4120, 1755, "202306", "Festbezug Gehaelter"),
+)
+
+
+class TestJobs(SimpleTestCase):
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        settings = self.settings(JOBS_DIR=Path(directory.name), CONVERSION_PROCESSES=1)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def wait(self, response) -> dict:
+        self.assertEqual(202, response.status_code, response.content)
+
+        for _ in range(600):
+            job = self.client.get(response.json()["status_url"], secure=True).json()
+            if job["status"] not in ("pending", "running"):
+                return job
+            time.sleep(0.05)
+
+        self.fail("job did not finish")
+
+    def submit_datev(self, *rows: tuple):
+        personio_file = make_workbook(*rows)
+        personio_file.name = "personio.xlsx"
+
+        return self.client.post(
+            reverse("job-datev"),
+            {"consultant-number": "1234", "client-number": "5678", "personio-file": personio_file},
+            secure=True,
+        )
+
+    def test_datev(self):
+        job = self.wait(self.submit_datev(*PERSONIO_ROWS))
+
+        self.assertEqual("done", job["status"])
+        self.assertEqual("EXTF_Personio-2023-06.csv", job["filename"])
+
+        response = self.client.get(job["download_url"], secure=True)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("attachment; filename=EXTF_Personio-2023-06.csv", response["Content-Disposition"])
+        self.assertTrue(b"".join(response.streaming_content).endswith(b';"Festbezug Gehaelter";'))
+
+    def test_datev_failed(self):
+        job = self.wait(self.submit_datev(("Datum", "Umsatz"), ("01.06.2023", 12.5)))
+
+        self.assertEqual(("failed", "'S/H'", None), (job["status"], job["error"], job["download_url"]))
+        self.assertEqual(409, self.client.get(reverse("job-download", args=(job["id"],)), secure=True).status_code)
+
+    def test_sepa(self):
+        with TEMPLATE_PATH.open("rb") as source_file:
+            job = self.wait(
+                self.client.post(
+                    reverse("job-sepa"),
+                    {"source-file": source_file, "execution-date": "2024-01-31"},
+                    secure=True,
+                ),
+            )
+
+        self.assertEqual(("done", "sepa-xml-template.xml"), (job["status"], job["filename"]))
+
+        response = self.client.get(job["download_url"], secure=True)
+
+        contents = b"".join(response.streaming_content)
+
+        self.assertIn(b"<NbOfTxs>3</NbOfTxs>", contents)
+        self.assertIn(b"<ReqdExctnDt>2024-01-31</ReqdExctnDt>", contents)
+
+    def test_sepa_missing_file(self):
+        response = self.client.post(reverse("job-sepa"), {"batch-booking": "false"}, secure=True)
+
+        self.assertEqual(400, response.status_code)
+
+    def test_fail_orphaned_jobs(self):
+        job = self.wait(self.submit_datev(*PERSONIO_ROWS))
+
+        with closing(connect(settings.JOBS_DIR)) as connection:
+            connection.executemany(
+                "INSERT INTO job (id, status, created_at) VALUES (?, ?, ?)",
+                [("pending", JobStatus.PENDING, time.time()), ("running", JobStatus.RUNNING, time.time())],
+            )
+
+        fail_orphaned_jobs()
+
+        self.assertEqual(
+            [
+                (JobStatus.FAILED, "Interrupted by a restart"),
+                (JobStatus.FAILED, "Interrupted by a restart"),
+                (JobStatus.DONE, None),
+            ],
+            [(job.status, job.error) for job in map(get_job, ("pending", "running", job["id"]))],
+        )
+
+    def test_unknown_job(self):
+        self.assertEqual(404, self.client.get(reverse("job-status", args=("unknown",)), secure=True).status_code)
+
+    def test_purge(self):
+        job = self.wait(self.submit_datev(*PERSONIO_ROWS))
+
+        with self.settings(JOB_RETENTION=-1):
+            self.wait(self.submit_datev(*PERSONIO_ROWS))
+
+        self.assertEqual(404, self.client.get(job["status_url"], secure=True).status_code)
@@ -0,0 +1,457 @@
+import re
+import zipfile
+from dataclasses import replace
+from decimal import Decimal
+from io import BytesIO
+from unittest import TestCase, mock
+
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+from django.urls import path, reverse
+from schwifty import IBAN
+
+from sepacetamol.pain import Payment, PaymentStore
+from sepacetamol.readers import iter_rows
+from sepacetamol.test_readers import make_workbook
+from sepacetamol.views import datev, sepa
+from sepacetamol.views.sepa import (
+    Draft,
+    Originator,
+    load_sepa_draft,
+    parse_source_rows,
+    save_sepa_draft,
+)
+
+TEMPLATE_PATH = settings.BASE_DIR / "sepacetamol" / "static" / "sepa-xml-template.xlsx"
+
+ORIGINATOR_BIC = IBAN("DE02120300000000202051").bic.compact
+RECIPIENT_BIC = IBAN("DE17720400460112921200").bic.compact
+
+GENERATE_DRAFT = Draft(
+    source_filename="sepa-xml-template.xlsx",
+    target_filename="sepa-xml-template.xml",
+    digest="generate-draft",
+    originator=Originator(name="honeymeets continuity GmbH", iban="DE02 1203 0000 0000 2020 51", bic=ORIGINATOR_BIC),
+    count=2,
+    total=24645,
+    payments=PaymentStore.from_payments(
+        [
+            Payment("CANCOM1 GmbH", "DE17720400460112921200", RECIPIENT_BIC, 12300, "Auftrag 1", "Kdn. 1234567"),
+            Payment("CANCOM2 GmbH", "DE17720400460112921200", RECIPIENT_BIC, 12345, "Auftrag 2", "NOTPROVIDED"),
+        ],
+    ),
+)
+
+
+def make_legacy_workbook() -> BytesIO:
+    # Compound File Binary signature of Excel 97-2003 workbooks
+    source_file = BytesIO(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1" + bytes(504))
+    source_file.name = "transactions.xls"
+    return source_file
+
+
+def get_generate_form(draft: Draft = GENERATE_DRAFT) -> dict[str, str]:
+    return {"draft": save_sepa_draft(draft), "batch-booking": "false"}
+
+
+# The second payment fails XSD validation, so that the second document of a split run does
+INVALID_SPLIT_DRAFT = replace(
+    GENERATE_DRAFT,
+    payments=PaymentStore.from_rows(
+        [
+            ("CANCOM1 GmbH", "DE17720400460112921200", RECIPIENT_BIC, 12300, "Auftrag 1", "Kdn. 1234567"),
+            ("CANCOM2 GmbH", "DE17720400460112921200", "X", 12345, "Auftrag 2", "NOTPROVIDED"),
+        ],
+    ),
+)
+
+
+INVALID_DRAFT = replace(INVALID_SPLIT_DRAFT, payments=INVALID_SPLIT_DRAFT.payments[1:])
+
+
+def read_split_files(contents: bytes) -> dict[str, bytes]:
+    with zipfile.ZipFile(BytesIO(contents)) as archive:
+        return {name: archive.read(name) for name in sorted(archive.namelist())}
+
+
+# The views as routed when served through config/asgi.py
+urlpatterns = [
+    path("", sepa.async_index, name="index"),
+    path("generate/", sepa.async_generate, name="generate"),
+    path("preview/<str:token>/", sepa.preview, name="preview"),
+    path("personio-datev/", datev.async_index, name="personio-datev"),
+]
+
+
+class TestSepa(TestCase):
+    maxDiff = None
+
+    def test_parse_source_rows(self):
+        with TEMPLATE_PATH.open("rb") as source_file:
+            originator, payments = parse_source_rows(iter_rows(source_file))
+
+        self.assertEqual(
+            Originator(name="honeymeets continuity GmbH", iban="DE02 1203 0000 0000 2020 51", bic=ORIGINATOR_BIC),
+            originator,
+        )
+        self.assertEqual(
+            [
+                Payment(
+                    name="CANCOM1 GmbH",
+                    iban="DE17720400460112921200",
+                    bic=RECIPIENT_BIC,
+                    amount=12300,
+                    description="Auftrag 12345678-9, 12.03.2020, v1/2345",
+                    endtoend_id="Kdn. 1234567",
+                ),
+                Payment(
+                    name="CANCOM2 GmbH",
+                    iban="DE17720400460112921200",
+                    bic=RECIPIENT_BIC,
+                    amount=12345,
+                    description="Auftrag 12345678-9, 12.03.2020, v1/2345",
+                    endtoend_id="NOTPROVIDED",
+                ),
+                Payment(
+                    name="CANCOM3 GmbH",
+                    iban="DE17720400460112921200",
+                    bic=RECIPIENT_BIC,
+                    amount=12312,
+                    description="Auftrag 12345678-9, 12.03.2020, v1/2345",
+                    endtoend_id="Kdn. 1234567",
+                ),
+            ],
+            [Payment(*row) for row in payments.rows()],
+        )
+        self.assertEqual(36957, payments.total)
+        self.assertEqual(["DE17720400460112921200"], payments.ibans.values)
+
+    def test_draft(self):
+        self.assertEqual(GENERATE_DRAFT, load_sepa_draft(save_sepa_draft(GENERATE_DRAFT)))
+        self.assertIsNone(load_sepa_draft("unknown"))
+
+        token = save_sepa_draft(GENERATE_DRAFT)
+        with self.subTest("expired"), override_settings(DRAFT_RETENTION=-1):
+            self.assertIsNone(load_sepa_draft(token))
+
+
+class TestGenerate(SimpleTestCase):
+    def test_generate(self):
+        for stream_validation in (False, True):
+            with (
+                self.subTest(stream_validation=stream_validation),
+                self.settings(
+                    SEPA_STREAM_VALIDATION=stream_validation,
+                ),
+            ):
+                self.assert_generate()
+
+    def assert_generate(self):
+        response = self.client.post(reverse("generate"), get_generate_form(), secure=True)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("attachment; filename=sepa-xml-template.xml", response["Content-Disposition"])
+
+        contents = b"".join(response.streaming_content)
+
+        self.assertIn(b"<NbOfTxs>2</NbOfTxs><CtrlSum>246.45</CtrlSum>", contents)
+        self.assertIn(b"<BtchBookg>false</BtchBookg>", contents)
+        self.assertIn(b"<EndToEndId>NOTPROVIDED</EndToEndId>", contents)
+
+    def test_generate_without_bic(self):
+        draft = replace(
+            GENERATE_DRAFT,
+            payments=PaymentStore.from_rows(
+                [("CANCOM1 SARL", "FR1420041010050500013M02606", "", 12300, "Auftrag 1", "NOTPROVIDED")],
+            ),
+        )
+
+        response = self.client.post(reverse("generate"), get_generate_form(draft), secure=True)
+
+        self.assertEqual(200, response.status_code)
+
+        contents = b"".join(response.streaming_content)
+
+        self.assertIn(b"<IBAN>FR1420041010050500013M02606</IBAN>", contents)
+        self.assertNotIn(b"<CdtrAgt>", contents)
+
+    @override_settings(SEPA_MAX_FILE_TRANSACTIONS=1, CONVERSION_PROCESSES=1)
+    def test_generate_split(self):
+        response = self.client.post(reverse("generate"), get_generate_form(), secure=True)
+
+        self.assertEqual("attachment; filename=sepa-xml-template.zip", response["Content-Disposition"])
+
+        files = read_split_files(b"".join(response.streaming_content))
+
+        self.assertEqual(["sepa-xml-template-1.xml", "sepa-xml-template-2.xml"], list(files))
+        self.assertIn(b"<NbOfTxs>1</NbOfTxs><CtrlSum>123.00</CtrlSum>", files["sepa-xml-template-1.xml"])
+        self.assertIn(b"<NbOfTxs>1</NbOfTxs><CtrlSum>123.45</CtrlSum>", files["sepa-xml-template-2.xml"])
+
+        (first_id, first_created_at), (second_id, second_created_at) = (
+            re.search(rb"<MsgId>(.*?)</MsgId><CreDtTm>(.*?)</CreDtTm>", contents).groups()
+            for contents in files.values()
+        )
+
+        self.assertEqual((first_id[:-2] + b"-1", first_id[:-2] + b"-2"), (first_id, second_id))
+        self.assertEqual(first_created_at, second_created_at)
+
+    @override_settings(
+        SEPA_MAX_FILE_TRANSACTIONS=1,
+        CONVERSION_PROCESSES=1,
+        STORAGES={"staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}},
+    )
+    def test_generate_split_invalid(self):
+        response = self.client.post(reverse("generate"), get_generate_form(INVALID_SPLIT_DRAFT), secure=True)
+
+        self.assertFalse(response.streaming)
+        self.assertContains(response, "sepa-xml-template-2.xml: The output SEPA file contains validation errors")
+
+    @override_settings(
+        STORAGES={"staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}},
+    )
+    def test_generate_invalid(self):
+        response = self.client.post(reverse("generate"), get_generate_form(INVALID_DRAFT), secure=True)
+
+        self.assertFalse(response.streaming)
+        self.assertContains(response, "The output SEPA file contains validation errors")
+
+    @override_settings(
+        SEPA_MAX_FILE_AMOUNT=12300,
+        STORAGES={"staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}},
+    )
+    def test_generate_over_limit(self):
+        response = self.client.post(reverse("generate"), get_generate_form(), secure=True)
+
+        self.assertContains(response, "123.45 EUR exceeds the limit of 123.00 EUR")
+
+    @override_settings(
+        STORAGES={"staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}},
+    )
+    def test_preview(self):
+        with TEMPLATE_PATH.open("rb") as source_file:
+            response = self.client.post(reverse("index"), {"source-file": source_file}, secure=True)
+
+        self.assertNotContains(response, 'name="transaction-')
+        self.assertContains(response, "3 transactions, grand total: 369.57 €")
+
+        draft = load_sepa_draft(response.context["token"])
+
+        self.assertEqual("sepa-xml-template.xml", draft.target_filename)
+        self.assertEqual([12300, 12345, 12312], [payment.amount for payment in draft.payments])
+
+        response = self.client.post(
+            reverse("generate"),
+            {"draft": response.context["token"], "batch-booking": "true"},
+            secure=True,
+        )
+
+        self.assertIn(b"<NbOfTxs>3</NbOfTxs><CtrlSum>369.57</CtrlSum>", b"".join(response.streaming_content))
+
+    @override_settings(
+        STORAGES={"staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}},
+    )
+    def test_preview_csv(self):
+        source_file = BytesIO(
+            "Sender name;Sender IBAN\r\n"
+            "honeymeets continuity GmbH;DE02 1203 0000 0000 2020 51\r\n"
+            "Recipient name;Recipient IBAN;Amount;Purpose;Reference (optional)\r\n"
+            "CANCOM1 GmbH;DE17720400460112921200;1.123;Auftrag 1;1234567\r\n"
+            "CANCOM2 GmbH;DE17720400460112921200;123,45;12.03.2020;\r\n".encode("cp1252"),
+        )
+        source_file.name = "sepa.csv"
+
+        response = self.client.post(reverse("index"), {"source-file": source_file}, secure=True)
+
+        self.assertContains(response, "2 transactions, grand total: 1246.45 €")
+        self.assertEqual("sepa.xml", response.context["draft"].target_filename)
+        self.assertEqual(
+            [("Auftrag 1", "1234567"), ("12.03.2020", "NOTPROVIDED")],
+            [(payment.description, payment.endtoend_id) for payment in response.context["draft"].payments],
+        )
+
+    @override_settings(
+        STORAGES={"staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}},
+    )
+    def test_preview_pages(self):
+        with mock.patch.object(sepa, "PREVIEW_PAGE_SIZE", 2), TEMPLATE_PATH.open("rb") as source_file:
+            response = self.client.post(reverse("index"), {"source-file": source_file}, secure=True)
+
+            token = response.context["token"]
+
+            self.assertEqual((1, 2), (response.context["page"], response.context["pages"]))
+            self.assertEqual([1, 2], [number for number, *_ in response.context["rows"]])
+            self.assertContains(response, f'href="/preview/{token}/?page=2"')
+
+            response = self.client.get(reverse("preview", args=(token,)), {"page": 2}, secure=True)
+
+            self.assertEqual(3, response.context["draft"].count)
+            self.assertEqual(
+                [(3, "CANCOM3 GmbH", Decimal("123.12"))],
+                [(number, payment.name, amount) for number, payment, amount, _ in response.context["rows"]],
+            )
+            self.assertIsNone(response.context["next_page"])
+
+            response = self.client.get(reverse("preview", args=(token,)), {"page": 3}, secure=True)
+
+            self.assertEqual([], response.context["rows"])
+
+    @override_settings(
+        STORAGES={"staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}},
+    )
+    def test_budgets(self):
+        with self.settings(UPLOAD_MAX_SIZE=1024), TEMPLATE_PATH.open("rb") as source_file:
+            response = self.client.post(reverse("index"), {"source-file": source_file}, secure=True)
+
+        self.assertEqual(413, response.status_code)
+
+        with self.settings(UPLOAD_MAX_ROWS=3), TEMPLATE_PATH.open("rb") as source_file:
+            response = self.client.post(reverse("index"), {"source-file": source_file}, secure=True)
+
+        self.assertContains(response, "The sheet has more than 3 rows")
+        self.assertIsNone(response.context["draft"])
+
+    @override_settings(
+        STORAGES={"staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}},
+    )
+    def test_preview_amounts(self):
+        def post(amount):
+            source_file = make_workbook(
+                ("Sender name", "Sender IBAN"),
+                ("honeymeets continuity GmbH", "DE02 1203 0000 0000 2020 51"),
+                ("Recipient name", "Recipient IBAN", "Amount", "Purpose", "Reference (optional)"),
+                ("CANCOM1 GmbH", "DE17720400460112921200", amount, "Auftrag 1", None),
+            )
+            source_file.name = "sepa.xlsx"
+            return self.client.post(reverse("index"), {"source-file": source_file}, secure=True)
+
+        # The value cached for a formula like =100/3
+        response = post(100 / 3)
+
+        self.assertContains(response, "1 transaction, grand total: 33.33 €")
+        self.assertEqual(3333, response.context["draft"].total)
+
+        response = post(None)
+
+        self.assertEqual(200, response.status_code)
+        self.assertContains(response, "Row 4 has no amount")
+        self.assertIsNone(response.context["draft"])
+
+    @override_settings(
+        STORAGES={"staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}},
+    )
+    def test_legacy_workbook(self):
+        response = self.client.post(reverse("index"), {"source-file": make_legacy_workbook()}, secure=True)
+
+        self.assertEqual(200, response.status_code)
+        self.assertContains(response, "Legacy .xls workbooks are not supported")
+        self.assertIsNone(response.context["draft"])
+
+    @override_settings(
+        STORAGES={"staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}},
+    )
+    def test_corrupt_workbook(self):
+        source_file = BytesIO(make_workbook(("a",)).getvalue()[:1024])
+        response = self.client.post(reverse("index"), {"source-file": source_file}, secure=True)
+
+        self.assertEqual(200, response.status_code)
+        self.assertContains(response, "The file could not be read")
+        self.assertIsNone(response.context["draft"])
+
+    @override_settings(
+        STORAGES={"staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}},
+    )
+    def test_expired_draft(self):
+        response = self.client.post(reverse("generate"), {"draft": "unknown", "batch-booking": "false"}, secure=True)
+
+        self.assertContains(response, "expired, please upload the file again")
+
+
+@override_settings(
+    ROOT_URLCONF=__name__,
+    CONVERSION_PROCESSES=1,
+    STORAGES={"staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}},
+)
+class TestAsyncViews(SimpleTestCase):
+    async def test_index(self):
+        with TEMPLATE_PATH.open("rb") as source_file:
+            response = await self.async_client.post(reverse("index"), {"source-file": source_file}, secure=True)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("sepa-xml-template.xml", response.context["draft"].target_filename)
+        self.assertEqual(3, response.context["draft"].count)
+        self.assertEqual(RECIPIENT_BIC, response.context["draft"].payments[0].bic)
+
+    async def test_index_corrupt_workbook(self):
+        response = await self.async_client.post(
+            reverse("index"),
+            {"source-file": BytesIO(make_workbook(("a",)).getvalue()[:1024])},
+            secure=True,
+        )
+
+        self.assertEqual(200, response.status_code)
+        self.assertContains(response, "The file could not be read")
+
+    async def test_index_legacy_workbook(self):
+        response = await self.async_client.post(reverse("index"), {"source-file": make_legacy_workbook()}, secure=True)
+
+        self.assertEqual(200, response.status_code)
+        self.assertContains(response, "Legacy .xls workbooks are not supported")
+
+    async def test_generate(self):
+        response = await self.async_client.post(reverse("generate"), get_generate_form(), secure=True)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("attachment; filename=sepa-xml-template.xml", response["Content-Disposition"])
+
+        contents = b"".join(response.streaming_content)
+
+        self.assertIn(b"<NbOfTxs>2</NbOfTxs><CtrlSum>246.45</CtrlSum>", contents)
+
+    @override_settings(SEPA_MAX_BLOCK_TRANSACTIONS=1, SEPA_MAX_FILE_AMOUNT=12300 + 12345)
+    async def test_generate_block_limits(self):
+        response = await self.async_client.post(reverse("generate"), get_generate_form(), secure=True)
+
+        self.assertEqual(
+            [(b"2", b"246.45"), (b"1", b"123.00"), (b"1", b"123.45")],
+            re.findall(rb"<NbOfTxs>(.*?)</NbOfTxs><CtrlSum>(.*?)</CtrlSum>", b"".join(response.streaming_content)),
+        )
+
+    @override_settings(SEPA_MAX_FILE_AMOUNT=20000)
+    async def test_generate_split(self):
+        response = await self.async_client.post(reverse("generate"), get_generate_form(), secure=True)
+
+        self.assertEqual("attachment; filename=sepa-xml-template.zip", response["Content-Disposition"])
+        self.assertEqual(
+            ["sepa-xml-template-1.xml", "sepa-xml-template-2.xml"],
+            list(read_split_files(b"".join(response.streaming_content))),
+        )
+
+    @override_settings(SEPA_MAX_FILE_TRANSACTIONS=1)
+    async def test_generate_split_invalid(self):
+        response = await self.async_client.post(
+            reverse("generate"),
+            get_generate_form(INVALID_SPLIT_DRAFT),
+            secure=True,
+        )
+
+        self.assertFalse(response.streaming)
+        self.assertContains(response, "sepa-xml-template-2.xml: The output SEPA file contains validation errors")
+
+    async def test_generate_invalid_document(self):
+        response = await self.async_client.post(reverse("generate"), get_generate_form(INVALID_DRAFT), secure=True)
+
+        self.assertFalse(response.streaming)
+        self.assertContains(response, "The output SEPA file contains validation errors")
+
+    async def test_generate_invalid(self):
+        with self.assertRaises(AssertionError):
+            await self.async_client.post(
+                reverse("generate"),
+                get_generate_form(
+                    replace(
+                        GENERATE_DRAFT,
+                        originator=replace(GENERATE_DRAFT.originator, iban="FR14 2004 1010 0505 0001 3M02 606"),
+                    ),
+                ),
+                secure=True,
+            )
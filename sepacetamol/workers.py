@@ -0,0 +1,37 @@
+import logging
+import os
+import resource
+import signal
+import sys
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+recycling = False
+
+
+def get_rss() -> int:
+    """
+    Current resident set size of this process in bytes, falling back to the peak where /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Reported in bytes on macOS, in kilobytes elsewhere
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def recycle_if_oversized(**kwargs):
+    """
+    Receiver of `request_finished`: once a request leaves the worker above WORKER_MAX_RSS, ask it to shut down
+    gracefully. gunicorn lets it finish the requests in flight and starts a fresh one in its place.
+    """
+    global recycling
+
+    if not recycling and (rss := get_rss()) > settings.WORKER_MAX_RSS:
+        recycling = True
+        logger.warning("Recycling worker %d, resident memory %d bytes", os.getpid(), rss)
+        os.kill(os.getpid(), signal.SIGTERM)